@@ -0,0 +1,166 @@
+"""API 账号表：多个用户各自的密码，每个账号的日程保存在独立的分区（见 StoreRegistry）
+
+账号来源:
+  - API_USERNAME / API_PASSWORD：与桌面端共用 记录.xlsx 的账号（原有配置）
+  - API_USERS_FILE（默认为程序目录下的 api_users.txt）：每行 "用户名:密码哈希"，
+    由下面的命令生成；文件修改后下一个请求自动重新读取，不需要重启
+用法:
+  python api_users.py add 用户名 [--password 密码]   # 不指定密码时交互输入
+  python api_users.py remove 用户名
+  python api_users.py list
+"""
+import argparse
+import getpass
+import os
+import sys
+import threading
+from werkzeug.security import generate_password_hash, check_password_hash
+from schedule_store import BASE_DIR
+from xlsx_stream import atomic_file
+
+USERS_FILE_NAME = "api_users.txt"
+
+
+def users_file_path():
+    return os.getenv("API_USERS_FILE") or os.path.join(BASE_DIR, USERS_FILE_NAME)
+
+
+def validate_username(username):
+    """用户名不能为空，不能包含冒号（分隔符）、换行或首尾空白"""
+    if not username or username != username.strip() or ":" in username or "\n" in username:
+        raise ValueError(f"无效的用户名: {username!r}")
+    return username
+
+
+def read_users(path):
+    """读取账号文件，返回 {用户名: 密码哈希}；空行和 # 开头的行被忽略"""
+    users = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.rstrip("\r\n")
+            if not line.strip() or line.lstrip().startswith("#"):
+                continue
+            username, sep, password_hash = line.partition(":")
+            if not sep or not username or not password_hash:
+                print(f"跳过账号文件 {path} 第 {line_number} 行: 格式应为 用户名:密码哈希")
+                continue
+            users[username] = password_hash
+    return users
+
+
+def write_users(path, users):
+    lines = ["# BEBOP API 账号，由 python api_users.py 维护，格式: 用户名:密码哈希\n"]
+    lines += [f"{username}:{password_hash}\n" for username, password_hash in sorted(users.items())]
+    with atomic_file(path) as f:
+        f.write("".join(lines).encode("utf-8"))
+
+
+class UserTable:
+    """账号文件的内存副本，文件签名变化时重新读取"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._signature = None
+        self._users = {}
+
+    def users(self):
+        try:
+            stat = os.stat(self.path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            signature = None
+        with self._lock:
+            if signature != self._signature:
+                try:
+                    self._users = read_users(self.path) if signature else {}
+                except OSError as e:
+                    print(f"读取账号文件失败: {str(e)}")
+                    self._users = {}
+                self._signature = signature
+            return self._users
+
+    def verify(self, username, password):
+        password_hash = self.users().get(username)
+        return password_hash is not None and check_password_hash(password_hash, password or "")
+
+    def __contains__(self, username):
+        return username in self.users()
+
+
+_user_table = None
+_user_table_lock = threading.Lock()
+
+
+def get_user_table():
+    """进程内共享的账号表（延迟创建，以便 .env 中的 API_USERS_FILE 已经加载）"""
+    global _user_table
+    with _user_table_lock:
+        if _user_table is None or _user_table.path != users_file_path():
+            _user_table = UserTable(users_file_path())
+        return _user_table
+
+
+def default_username():
+    return os.getenv("API_USERNAME", "admin")
+
+
+def verify_credentials(username, password):
+    """校验 API 账号：API_USERNAME/API_PASSWORD 或账号文件中的用户"""
+    if username == default_username() and password == os.getenv("API_PASSWORD", "password"):
+        return True
+    return get_user_table().verify(username, password)
+
+
+def is_known_user(username):
+    """是否为可以登录的账号（用于查询其他用户的空闲时段等）"""
+    return username == default_username() or username in get_user_table()
+
+
+def main(argv=None):
+    from dotenv import load_dotenv
+
+    load_dotenv(os.path.join(BASE_DIR, ".env"))
+    parser = argparse.ArgumentParser(description="管理 API 账号")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    add_parser = subparsers.add_parser("add", help="添加账号或修改密码")
+    add_parser.add_argument("username", help="用户名")
+    add_parser.add_argument("--password", default=None, help="密码（默认交互输入）")
+    remove_parser = subparsers.add_parser("remove", help="删除账号（不删除其日程）")
+    remove_parser.add_argument("username", help="用户名")
+    subparsers.add_parser("list", help="列出账号")
+    args = parser.parse_args(argv)
+
+    path = users_file_path()
+    users = read_users(path) if os.path.exists(path) else {}
+    if args.command == "list":
+        for username in sorted(users):
+            print(username)
+        return 0
+    if args.command == "remove":
+        if users.pop(args.username, None) is None:
+            print(f"账号不存在: {args.username}")
+            return 1
+        write_users(path, users)
+        print(f"已删除账号 {args.username}")
+        return 0
+    try:
+        username = validate_username(args.username)
+    except ValueError as e:
+        parser.error(str(e))
+    password = args.password
+    if password is None:
+        password = getpass.getpass("密码: ")
+        if password != getpass.getpass("再次输入密码: "):
+            print("两次输入的密码不一致")
+            return 1
+    if not password:
+        parser.error("密码不能为空")
+    users[username] = generate_password_hash(password)
+    write_users(path, users)
+    print(f"已保存账号 {username} 到 {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
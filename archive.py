@@ -0,0 +1,204 @@
+"""冷热分层：早于期限、已经结束的日程移入压缩的归档分段
+
+工作簿（热数据）只保留近期和尚未结束的日程，加载、保存和外部编辑都只涉及这一小部分；
+更早且当天事件全部为 已完成/取消 的日期按年份写入 <工作簿名>_archive/<年份>.json.gz。
+存储加载时只读取工作簿，归档层是单独的只读 ArchiveTier，某个年份的分段在第一次被访问时才读取；
+快照的 get()/iter_days() 同时查询两层（同一天以工作簿层为准），搜索、统计和导出通过它们包含归档的日程。
+归档分段只由程序重写：某天被修改后仍满足条件则重写所在年份的分段，否则移回工作簿。
+环境变量 ARCHIVE_AFTER_DAYS 设置期限（默认365天），设为0关闭分层。
+"""
+import gzip
+import json
+import os
+import re
+import threading
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+from types import MappingProxyType
+from xlsx_stream import atomic_file
+
+ARCHIVE_STATES = ("已完成", "取消")
+DEFAULT_ARCHIVE_AFTER_DAYS = 365
+ARCHIVE_FORMAT_VERSION = 1
+ARCHIVE_COLUMNS = ("time", "task", "completion")
+_SEGMENT_PATTERN = re.compile(r"(\d{4})\.json\.gz$")
+
+
+def archive_after_days():
+    return int(os.getenv("ARCHIVE_AFTER_DAYS", DEFAULT_ARCHIVE_AFTER_DAYS))
+
+
+def archive_horizon(days=None, today=None):
+    """早于该日期（YYYY-MM-DD）的日期可以归档，关闭分层时返回 None"""
+    days = archive_after_days() if days is None else days
+    if days <= 0:
+        return None
+    today = today or datetime.now().date()
+    return (today - timedelta(days=days)).strftime("%Y-%m-%d")
+
+
+def is_cold(date_str, day_events, horizon):
+    """该天是否应放入归档：早于期限，且所有事件都已结束"""
+    return (horizon is not None and date_str < horizon and bool(day_events)
+            and all(event.get("completion") in ARCHIVE_STATES for event in day_events))
+
+
+def cold_dates(days, horizon):
+    """{日期: 事件} 中应归档的日期集合"""
+    if horizon is None:
+        return set()
+    return {date_str for date_str, day_events in days.items() if is_cold(date_str, day_events, horizon)}
+
+
+def archive_dir(file_path):
+    """工作簿对应的归档目录"""
+    stem, _ = os.path.splitext(file_path)
+    return f"{stem}_archive"
+
+
+def segment_path(directory, year):
+    return os.path.join(directory, f"{year}.json.gz")
+
+
+def segment_year(path):
+    """归档分段路径对应的年份，不是归档分段时返回 None"""
+    match = _SEGMENT_PATTERN.match(os.path.basename(path))
+    return int(match.group(1)) if match else None
+
+
+def segment_years(directory):
+    """列出已存在的归档分段年份"""
+    if not os.path.isdir(directory):
+        return []
+    years = []
+    for name in os.listdir(directory):
+        match = _SEGMENT_PATTERN.match(name)
+        if match:
+            years.append(int(match.group(1)))
+    return sorted(years)
+
+
+def read_segment(path):
+    """读取一个归档分段，返回 {日期: [事件, ...]}"""
+    with gzip.open(path, "rb") as f:
+        data = json.loads(f.read().decode("utf-8"))
+    columns = data.get("columns", ARCHIVE_COLUMNS)
+    return {date_str: [dict(zip(columns, values)) for values in rows]
+            for date_str, rows in data.get("days", {}).items()}
+
+
+def write_segment(path, days):
+    """原子地重写一个归档分段，days 为空时删除该分段，返回写入的事件数"""
+    if not days:
+        if os.path.exists(path):
+            os.remove(path)
+        return 0
+    payload = {
+        "version": ARCHIVE_FORMAT_VERSION,
+        "columns": ARCHIVE_COLUMNS,
+        "days": {date_str: [[event.get(column, "") for column in ARCHIVE_COLUMNS] for event in days[date_str]]
+                 for date_str in sorted(days)},
+    }
+    data = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    with atomic_file(path) as f:
+        # mtime=0 使内容相同的分段字节也相同
+        f.write(gzip.compress(data, compresslevel=6, mtime=0))
+    return sum(len(day_events) for day_events in days.values())
+
+
+def _freeze_day(day_events):
+    if isinstance(day_events, tuple):
+        # 已经是快照中的只读事件元组
+        return day_events
+    return tuple(event if isinstance(event, MappingProxyType) else MappingProxyType(dict(event))
+                 for event in day_events)
+
+
+_EMPTY_SEGMENT = MappingProxyType({})
+
+
+class ArchiveTier:
+    """归档层的只读视图：各年份的分段在第一次访问时读取并缓存
+
+    实例发布后内容不再改变（与 ScheduleSnapshot 一样可被多个快照共享）；保存时通过
+    with_segments() 得到新实例，未重写的年份共享已读取的内容。
+    lock_for(路径) 返回读取分段时持有的文件锁。
+    """
+
+    def __init__(self, directory=None, years=None, segments=None, lock_for=None):
+        self.directory = directory
+        if years is None:
+            years = segment_years(directory) if directory else ()
+        self._years = tuple(sorted(years))
+        self._segments = dict(segments or {})  # 年份 -> {日期: (只读事件, ...)}
+        self._lock_for = lock_for
+        self._lock = threading.Lock()
+
+    def years(self):
+        return self._years
+
+    def segment(self, year):
+        """某年的 {日期: 事件元组}，首次访问时从磁盘读取"""
+        segment = self._segments.get(year)
+        if segment is not None or year not in self._years:
+            return segment if segment is not None else _EMPTY_SEGMENT
+        with self._lock:
+            segment = self._segments.get(year)
+            if segment is None:
+                path = segment_path(self.directory, year)
+                with self._lock_for(path) if self._lock_for else nullcontext():
+                    days = read_segment(path) if os.path.exists(path) else {}
+                segment = self._segments[year] = MappingProxyType(
+                    {date_str: _freeze_day(day_events) for date_str, day_events in days.items()})
+        return segment
+
+    def cached(self, year):
+        """已读取的分段，尚未读取时返回 None"""
+        return self._segments.get(year)
+
+    def get(self, date_str):
+        """某天的归档事件，没有时返回空元组"""
+        return self.segment(int(date_str[:4])).get(date_str, ())
+
+    def iter_days(self, start=None, end=None):
+        """按日期顺序产出 (日期, 事件元组)，只读取与 start/end 闭区间相交的年份"""
+        for year in self._years:
+            if (start and str(year) < start[:4]) or (end and str(year) > end[:4]):
+                continue
+            segment = self.segment(year)
+            for date_str in sorted(segment):
+                if (start and date_str < start) or (end and date_str > end):
+                    continue
+                yield date_str, segment[date_str]
+
+    def with_segments(self, updated):
+        """返回把 updated（{年份: {日期: 事件}}，空表示删除该分段）替换后的新实例"""
+        years = set(self._years)
+        segments = dict(self._segments)
+        for year, days in updated.items():
+            if days:
+                years.add(year)
+                segments[year] = MappingProxyType(
+                    {date_str: _freeze_day(day_events) for date_str, day_events in days.items()})
+            else:
+                years.discard(year)
+                segments.pop(year, None)
+        return ArchiveTier(self.directory, years, segments, self._lock_for)
+
+    def changed_dates(self, other, years):
+        """与新实例 other 相比，years 中内容不同的日期
+
+        只比较本实例已经读取过的年份：没有读取过的分段不可能被任何读取者看到过。
+        """
+        changed = set()
+        for year in years:
+            old = self.cached(year)
+            if old is None:
+                continue
+            new = other.segment(year)
+            changed.update(date_str for date_str in set(old) | set(new)
+                           if old.get(date_str, ()) != new.get(date_str, ()))
+        return changed
+
+
+EMPTY_TIER = ArchiveTier()
@@ -0,0 +1,248 @@
+"""批处理命令行：对一个目录下的所有工作簿执行 读取 -> 校验 -> 优化下周 -> 保存，不需要界面
+
+解析工作簿在进程池中并行执行；LLM调用在主进程的线程池中执行，并发数单独限制。
+每处理完一个工作簿就把结果写入进度文件，中断后重新运行会跳过已完成且未再修改的工作簿。
+最后输出汇总报告（JSON），并在终端打印统计。
+用法:
+  python batch.py 工作簿目录 [-o 输出目录 | --in-place] [--week YYYY-MM-DD] [--no-optimize]
+                  [--workers 4] [--llm-concurrency 2] [--progress 进度文件] [--report 报告文件] [--retry-failed]
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from engine import read_workbook_checked, validate_events, optimize_events_week
+from preoptimizer import next_week_range
+from schedule_store import write_workbook, BASE_DIR
+from xlsx_stream import atomic_file
+
+PROGRESS_FILE_NAME = "batch_progress.json"
+REPORT_FILE_NAME = "batch_report.json"
+
+
+def find_workbooks(directory):
+    """递归列出目录下的工作簿，跳过临时文件、锁文件和归档目录"""
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = [name for name in dirs if not name.endswith("_archive") and not name.startswith(".")]
+        for name in files:
+            if name.lower().endswith(".xlsx") and not name.startswith((".", "~$")):
+                paths.append(os.path.join(root, name))
+    return sorted(paths)
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def inspect_workbook(path):
+    """在工作进程中读取并校验一个工作簿（结果需可序列化）"""
+    started = time.perf_counter()
+    try:
+        events, skipped, rows = read_workbook_checked(path)
+    except Exception as e:
+        return {"path": path, "error": f"读取失败: {str(e)}"}
+    return {
+        "path": path,
+        "events": events,
+        "rows": rows,
+        "skipped": skipped,
+        "issues": validate_events(events),
+        "parse_seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+class BatchProgress:
+    """进度文件：{工作簿路径: 处理结果}，每次更新后原子地重写"""
+
+    def __init__(self, path, options):
+        self.path = path
+        self.options = options
+        self._lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            # 参数（如优化的周）不同的运行不能复用之前的进度
+            if data.get("options") == options:
+                self.entries = data.get("entries", {})
+            else:
+                print("批处理参数与进度文件不同，重新处理全部工作簿")
+
+    def is_done(self, path, signature, retry_failed):
+        entry = self.entries.get(path)
+        if entry is None:
+            return False
+        # --in-place 时文件已被本次批处理改写，与写入后的签名一致也视为未再修改
+        unchanged = signature == entry.get("input_signature") or (
+            entry.get("output") == path and signature == entry.get("output_signature"))
+        if not unchanged:
+            return False
+        return entry.get("status") == "done" or (entry.get("status") == "failed" and not retry_failed)
+
+    def record(self, path, entry):
+        with self._lock:
+            self.entries[path] = entry
+            data = json.dumps({"options": self.options, "entries": self.entries}, ensure_ascii=False, indent=1)
+            with atomic_file(self.path) as f:
+                f.write(data.encode("utf-8"))
+
+
+def output_path_for(path, input_dir, output_dir):
+    if output_dir is None:
+        return path
+    return os.path.join(output_dir, os.path.relpath(path, input_dir))
+
+
+def finish_workbook(result, llm_api, monday, output_path):
+    """在主进程中优化并保存一个已解析的工作簿，返回进度记录"""
+    started = time.perf_counter()
+    events = result["events"]
+    entry = {
+        "rows": result["rows"],
+        "events": sum(len(day_events) for day_events in events.values()),
+        "skipped_rows": [row_number for row_number, _ in result["skipped"][:20]],
+        "skipped_count": len(result["skipped"]),
+        "issue_counts": result["issues"]["counts"],
+        "issues": {kind: examples for kind, examples in result["issues"].items() if kind != "counts" and examples},
+        "parse_seconds": result["parse_seconds"],
+        "optimized_days": 0,
+    }
+    if llm_api is not None:
+        optimized = optimize_events_week(llm_api, events, monday)
+        if optimized is None:
+            entry.update(status="failed", error="LLM优化失败")
+            return entry
+        for date_str, day_events in optimized.items():
+            if day_events:
+                events[date_str] = day_events
+            else:
+                events.pop(date_str, None)
+        entry["optimized_days"] = len(optimized)
+    # 无法解析的行原样写回，不丢失用户数据
+    entry["saved_rows"] = write_workbook(output_path, events, [values for _, values in result["skipped"]])
+    entry.update(status="done", output=output_path, output_signature=file_signature(output_path),
+                 seconds=round(time.perf_counter() - started, 3))
+    return entry
+
+
+def summarize(entries, paths):
+    """汇总本次涉及的工作簿"""
+    selected = [entries[path] for path in paths if path in entries]
+    summary = {
+        "workbooks": len(paths),
+        "done": sum(1 for entry in selected if entry.get("status") == "done"),
+        "failed": sum(1 for entry in selected if entry.get("status") == "failed"),
+        "events": sum(entry.get("events", 0) for entry in selected),
+        "skipped_rows": sum(entry.get("skipped_count", 0) for entry in selected),
+        "optimized_days": sum(entry.get("optimized_days", 0) for entry in selected),
+        "issue_counts": {},
+    }
+    for entry in selected:
+        for kind, count in entry.get("issue_counts", {}).items():
+            summary["issue_counts"][kind] = summary["issue_counts"].get(kind, 0) + count
+    summary["failures"] = {path: entries[path].get("error") for path in paths
+                           if entries.get(path, {}).get("status") == "failed"}
+    return summary
+
+
+def main(argv=None):
+    from dotenv import load_dotenv
+
+    load_dotenv(os.path.join(BASE_DIR, ".env"))
+    parser = argparse.ArgumentParser(description="批量读取、校验、优化并保存工作簿")
+    parser.add_argument("input_dir", help="包含工作簿的目录（递归查找 .xlsx）")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("-o", "--output", default=None, help="输出目录（保持相对路径）")
+    target.add_argument("--in-place", action="store_true", help="直接覆盖原工作簿（原子替换）")
+    parser.add_argument("--week", default=None, help="要优化的那一周中任意一天，默认下周")
+    parser.add_argument("--no-optimize", action="store_true", help="只校验并规范化保存，不调用LLM")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="解析工作簿的进程数")
+    parser.add_argument("--llm-concurrency", type=int, default=2, help="同时进行的LLM请求数")
+    parser.add_argument("--progress", default=None, help="进度文件，默认在输出目录（或输入目录）下")
+    parser.add_argument("--report", default=None, help="汇总报告文件，默认在进度文件旁")
+    parser.add_argument("--retry-failed", action="store_true", help="重新处理上次失败的工作簿")
+    args = parser.parse_args(argv)
+
+    if not args.output and not args.in_place:
+        parser.error("请指定 -o 输出目录 或 --in-place")
+    input_dir = os.path.abspath(args.input_dir)
+    output_dir = os.path.abspath(args.output) if args.output else None
+    if args.week:
+        day = datetime.strptime(args.week, "%Y-%m-%d").date()
+        monday = day - timedelta(days=day.weekday())
+    else:
+        monday = next_week_range()[0]
+
+    llm_api = None
+    if not args.no_optimize:
+        api_key = os.getenv("DEEPSEEK_API_KEY")
+        if not api_key:
+            parser.error("未配置 DEEPSEEK_API_KEY，无法优化；可使用 --no-optimize 只做校验")
+        from flask_app import LLMAPI
+        llm_api = LLMAPI(api_key)
+
+    state_dir = output_dir or input_dir
+    progress_path = args.progress or os.path.join(state_dir, PROGRESS_FILE_NAME)
+    report_path = args.report or os.path.join(os.path.dirname(progress_path), REPORT_FILE_NAME)
+    options = {"week": monday.strftime("%Y-%m-%d"), "optimize": llm_api is not None, "output": output_dir}
+    progress = BatchProgress(progress_path, options)
+
+    paths = find_workbooks(input_dir)
+    if output_dir:
+        # 输出目录位于输入目录内时不要把上次的输出当作输入
+        paths = [path for path in paths if not path.startswith(output_dir + os.sep)]
+    signatures = {path: file_signature(path) for path in paths}
+    pending = [path for path in paths if not progress.is_done(path, signatures[path], args.retry_failed)]
+    print(f"共 {len(paths)} 个工作簿，跳过已完成 {len(paths) - len(pending)} 个，待处理 {len(pending)} 个；"
+          f"优化周 {options['week'] if llm_api else '（不优化）'}")
+
+    started = time.perf_counter()
+    done_count = 0
+
+    def record(path, entry):
+        nonlocal done_count
+        entry["input_signature"] = signatures[path]
+        progress.record(path, entry)
+        done_count += 1
+        status = "完成" if entry["status"] == "done" else f"失败: {entry.get('error')}"
+        print(f"[{done_count}/{len(pending)}] {os.path.relpath(path, input_dir)} {status}")
+
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as parsers, \
+            ThreadPoolExecutor(max_workers=max(1, args.llm_concurrency)) as finishers:
+        finishing = {}
+        for future in as_completed([parsers.submit(inspect_workbook, path) for path in pending]):
+            result = future.result()
+            path = result["path"]
+            if "error" in result:
+                record(path, {"status": "failed", "error": result["error"]})
+                continue
+            finishing[finishers.submit(finish_workbook, result, llm_api, monday,
+                                       output_path_for(path, input_dir, output_dir))] = path
+        for future in as_completed(finishing):
+            path = finishing[future]
+            try:
+                entry = future.result()
+            except Exception as e:
+                entry = {"status": "failed", "error": str(e)}
+            record(path, entry)
+
+    summary = summarize(progress.entries, paths)
+    summary["seconds"] = round(time.perf_counter() - started, 2)
+    summary["options"] = options
+    with atomic_file(report_path) as f:
+        f.write(json.dumps(summary, ensure_ascii=False, indent=2).encode("utf-8"))
+    print(f"完成 {summary['done']} 个，失败 {summary['failed']} 个，共 {summary['events']} 条事件，"
+          f"跳过无法解析的行 {summary['skipped_rows']} 行，优化 {summary['optimized_days']} 天，"
+          f"问题 {summary['issue_counts']}，耗时 {summary['seconds']} 秒")
+    print(f"报告已写入 {report_path}")
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
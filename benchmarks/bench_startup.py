@@ -0,0 +1,78 @@
+"""启动耗时基准测试
+
+每次在新的子进程中冷启动，分别记录：
+  import   导入 caption（界面依赖）耗时
+  window   创建 CalendarApp 并完成首次绘制耗时（没有图形环境时跳过）
+  loaded   后台加载日程完成耗时
+  heavy    启动过程中是否导入了 pandas / openai / flask
+
+用法: python benchmarks/bench_startup.py [--runs 10]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD_SCRIPT = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import tkinter as tk
+from caption import CalendarApp
+result = {"import": time.perf_counter() - t0}
+app = None
+try:
+    root = tk.Tk()
+    root.withdraw()
+    app = CalendarApp(root)
+    root.update()
+    result["window"] = time.perf_counter() - t0
+    store = app.store
+except tk.TclError:
+    from schedule_store import get_store_registry
+    store = get_store_registry().get()
+    store.load_async()
+while not store.loaded and store.load_error is None:
+    time.sleep(0.005)
+result["loaded"] = time.perf_counter() - t0
+result["heavy"] = sorted(m for m in ("pandas", "openai", "flask") if m in sys.modules)
+print("RESULT " + json.dumps(result))
+"""
+
+
+def run_once():
+    env = dict(os.environ, WATCH_WORKBOOKS="0")
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD_SCRIPT],
+        cwd=ROOT_DIR, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    for line in output.splitlines():
+        # 后台线程的打印可能与结果挤在同一行
+        if "RESULT " in line:
+            return json.loads(line.split("RESULT ", 1)[1])
+    raise RuntimeError(f"子进程没有输出结果:\n{output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="测量冷启动耗时")
+    parser.add_argument("--runs", type=int, default=10, help="重复次数")
+    args = parser.parse_args()
+
+    results = [run_once() for _ in range(args.runs)]
+    print(f"共 {args.runs} 次冷启动（单位: 毫秒）")
+    for stage in ("import", "window", "loaded"):
+        samples = [r[stage] * 1000 for r in results if stage in r]
+        if not samples:
+            print(f"{stage:>8}: 跳过（没有图形环境）")
+            continue
+        samples.sort()
+        p90 = samples[min(len(samples) - 1, int(len(samples) * 0.9))]
+        print(f"{stage:>8}: 中位数 {statistics.median(samples):8.1f}  p90 {p90:8.1f}  最小 {samples[0]:8.1f}")
+    print(f"启动时导入的重量级模块: {results[-1]['heavy'] or '无'}")
+
+
+if __name__ == "__main__":
+    main()
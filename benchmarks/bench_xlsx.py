@@ -0,0 +1,109 @@
+"""工作簿保存基准测试：耗时与峰值内存
+
+每种写法在新的子进程中写入同样的合成日程，分别记录：
+  seconds     写入耗时（含原子替换）
+  rss_mb      子进程的峰值常驻内存（ru_maxrss，仅 Linux/macOS）
+  py_peak_mb  加 --tracemalloc 时另行运行一次，记录 Python 对象的峰值内存（tracemalloc 会使写入慢数倍，不计入耗时）
+写法:
+  pandas      DataFrame.to_excel（改为流式写入之前的做法）
+  openpyxl    openpyxl 普通模式，整张工作表在内存中构建后保存
+  write_only  xlsx_stream.write_xlsx_rows（openpyxl 只写模式 + 原子替换，ScheduleStore.save 使用）
+
+用法: python benchmarks/bench_xlsx.py [--events 60000] [--runs 3] [--methods pandas,openpyxl,write_only] [--tracemalloc]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+METHODS = ("pandas", "openpyxl", "write_only")
+
+CHILD_SCRIPT = r"""
+import json, os, sys, time, tracemalloc
+method, events, path, trace = sys.argv[1], int(sys.argv[2]), sys.argv[3], sys.argv[4] == "1"
+from datetime import date, timedelta
+from schedule_store import EVENT_COLUMNS
+
+def rows():
+    start = date(2020, 1, 1)
+    tasks = ["会议", "项目开发", "阅读", "锻炼", "写报告", "复习"]
+    for i in range(events):
+        day = (start + timedelta(days=i // 6)).strftime("%Y-%m-%d")
+        yield [day, f"{8 + i % 6 * 2:02d}:00-{9 + i % 6 * 2:02d}:00", tasks[i % len(tasks)], "已完成"]
+
+# 先导入依赖，只测量写入本身
+if method == "pandas":
+    import pandas as pd
+else:
+    import openpyxl
+    from xlsx_stream import write_xlsx_rows
+
+if trace:
+    tracemalloc.start()
+started = time.perf_counter()
+if method == "pandas":
+    pd.DataFrame(list(rows()), columns=EVENT_COLUMNS).to_excel(path, index=False)
+elif method == "openpyxl":
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(EVENT_COLUMNS)
+    for values in rows():
+        sheet.append(values)
+    workbook.save(path)
+else:
+    write_xlsx_rows(path, EVENT_COLUMNS, rows())
+seconds = time.perf_counter() - started
+result = {"seconds": seconds, "size_kb": os.path.getsize(path) / 1024}
+if trace:
+    result["py_peak_mb"] = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+try:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以KB为单位，macOS 以字节为单位
+    result["rss_mb"] = rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+except ImportError:
+    pass
+print("RESULT " + json.dumps(result))
+"""
+
+
+def run_once(method, events, path, trace=False):
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD_SCRIPT, method, str(events), path, "1" if trace else "0"],
+        cwd=ROOT_DIR, capture_output=True, text=True, check=True,
+    ).stdout
+    for line in output.splitlines():
+        if line.startswith("RESULT "):
+            return json.loads(line[len("RESULT "):])
+    raise RuntimeError(f"子进程没有输出结果: {output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比较工作簿保存方式的耗时与峰值内存")
+    parser.add_argument("--events", type=int, default=60000)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--methods", default=",".join(METHODS))
+    parser.add_argument("--tracemalloc", action="store_true", help="另外测量 Python 对象的峰值内存")
+    args = parser.parse_args()
+
+    methods = [name.strip() for name in args.methods.split(",") if name.strip()]
+    print(f"{args.events} 条事件，每种写法 {args.runs} 次（取中位数）")
+    with tempfile.TemporaryDirectory(prefix="bebop-xlsx-") as directory:
+        for method in methods:
+            path = os.path.join(directory, f"{method}.xlsx")
+            results = [run_once(method, args.events, path) for _ in range(args.runs)]
+            summary = {key: statistics.median(result[key] for result in results) for key in results[0]}
+            line = f"{method:>10}: 耗时 {summary['seconds']:6.2f}s"
+            if "rss_mb" in summary:
+                line += f"  峰值RSS {summary['rss_mb']:7.1f}MB"
+            if args.tracemalloc:
+                line += f"  Python峰值 {run_once(method, args.events, path, trace=True)['py_peak_mb']:7.1f}MB"
+            print(f"{line}  文件 {summary['size_kb']:7.0f}KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""端到端压测：在本地LLM桩服务上驱动 Flask API 和日程优化流程
+
+默认在进程内启动 llm_stub 桩服务和 Flask 应用（数据目录为临时目录，不会改动 记录.xlsx），
+以固定并发发送请求，输出每个场景的吞吐量和 p50/p95/p99 延迟。
+  api       GET /api/schedule、/api/analytics、/api/export
+  optimize  POST /api/optimize 提交任务并长轮询 /api/optimize/<任务ID> 直到结束（经任务队列、LLMAPI 请求桩服务），
+            队列已满（429）时按 Retry-After 等待后重新提交（最多等待 MAX_RETRY_WAIT 秒）
+进程内启动时限流计数写入临时目录中的数据库（RATE_LIMIT_DB），不影响真实的 ratelimit.sqlite3。
+
+用法:
+  python benchmarks/load_test.py [--scenario api|optimize|all] [--concurrency 8] [--requests 200]
+                                 [--latency 0.2] [--token-rate 0] [--error-rate 0]
+  python benchmarks/load_test.py --api-url http://127.0.0.1:5000 --user admin --password ...   # 压测已运行的服务
+"""
+import argparse
+import base64
+import contextlib
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+API_PATHS = ["/api/schedule", "/api/analytics?period=week", "/api/export?format=csv"]
+# 收到429时最多等待的秒数（Retry-After 更长时提前重试）
+MAX_RETRY_WAIT = 5.0
+OPTIMIZE_WEEKS = 8
+
+
+def percentile(samples, q):
+    if not samples:
+        return float("nan")
+    index = min(len(samples) - 1, max(0, int(round(q * (len(samples) - 1)))))
+    return samples[index]
+
+
+def run_load(name, task, requests, concurrency, verbose=False):
+    """以 concurrency 个并发执行 requests 次 task()，task 返回是否成功
+
+    verbose=False 时压测期间屏蔽程序自身的打印（如LLM输入输出），只输出汇总结果。
+    """
+    latencies, errors = [], 0
+    lock = threading.Lock()
+
+    def worker(index):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            ok = task(index)
+        except Exception as e:
+            print(f"{name} 请求失败: {str(e)}", file=sys.stderr)
+            ok = False
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    quiet = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    with quiet, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(requests)))
+    wall = time.perf_counter() - started
+    latencies.sort()
+    ms = [value * 1000 for value in latencies]
+    print(f"{name:>9}: {requests} 次 / 并发 {concurrency} / 失败 {errors}  "
+          f"吞吐 {requests / wall:7.1f} 次/秒  "
+          f"p50 {percentile(ms, 0.50):8.1f}  p95 {percentile(ms, 0.95):8.1f}  "
+          f"p99 {percentile(ms, 0.99):8.1f}  平均 {statistics.mean(ms):8.1f} 毫秒")
+
+
+def next_monday():
+    return date.today() + timedelta(days=7 - date.today().weekday())
+
+
+def synthetic_week(events_per_day=6):
+    """生成下周的随机日程"""
+    monday = next_monday()
+    tasks = ["会议", "项目开发", "阅读", "锻炼", "写报告", "复习"]
+    week = {}
+    for offset in range(7):
+        day = (monday + timedelta(days=offset)).strftime("%Y-%m-%d")
+        week[day] = [{"time": f"{8 + i * 2:02d}:00-{9 + i * 2:02d}:00",
+                      "task": random.choice(tasks),
+                      "completion": "未开始"} for i in range(events_per_day)]
+    return week
+
+
+def api_json(base_url, token, path, payload=None):
+    """发送请求并解析JSON响应，返回 (状态码, 响应头, 内容)；payload 不为 None 时以 POST 发送"""
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    request = urllib.request.Request(base_url + path, data=data, headers={
+        "Authorization": f"Basic {token}", "Content-Type": "application/json", "Accept": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=120) as response:
+            return response.status, response.headers, json.loads(response.read() or b"null")
+    except urllib.error.HTTPError as e:
+        body = e.read()
+        try:
+            content = json.loads(body) if body else None
+        except ValueError:
+            content = None
+        return e.code, e.headers, content
+
+
+def start_local_api(data_dir, verbose=False):
+    """在进程内启动Flask应用，日程存储指向临时目录，返回 (服务地址, 用户名, 密码)"""
+    import logging
+    from werkzeug.serving import make_server
+    import schedule_store
+
+    if not verbose:
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    username, password = os.environ["API_USERNAME"], os.environ["API_PASSWORD"]
+    # 使用临时数据目录，避免压测写入真实的 记录.xlsx 和 ratelimit.sqlite3
+    os.environ["RATE_LIMIT_DB"] = os.path.join(data_dir, "ratelimit.sqlite3")
+    schedule_store._store_registry = schedule_store.StoreRegistry(data_dir, default_user=username)
+    store = schedule_store._store_registry.get(username)
+    changes = {}
+    for week_index in range(-OPTIMIZE_WEEKS + 1, 52):
+        for day, events in synthetic_week().items():
+            shifted = (date.fromisoformat(day) - timedelta(weeks=week_index)).strftime("%Y-%m-%d")
+            changes[shifted] = events
+    store.commit(changes, source="load-test")
+
+    from flask_app import app
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="load-test-api", daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", username, password
+
+
+def main():
+    parser = argparse.ArgumentParser(description="在本地LLM桩服务上压测API和优化流程")
+    parser.add_argument("--scenario", choices=["api", "optimize", "all"], default="all")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.2, help="桩服务首个token前的延迟（秒）")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="桩服务每秒输出token数，0表示不限速")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="桩服务注入错误的比例")
+    parser.add_argument("--api-url", default=None, help="压测已运行的API服务（默认在进程内启动）")
+    parser.add_argument("--user", default=None, help="API用户名")
+    parser.add_argument("--password", default=None, help="API密码")
+    parser.add_argument("--verbose", action="store_true", help="显示压测期间程序自身的输出")
+    args = parser.parse_args()
+
+    import llm_stub
+
+    stub_config = llm_stub.StubConfig(latency=args.latency, token_rate=args.token_rate, error_rate=args.error_rate)
+    stub_server, stub_url = llm_stub.start_in_thread(stub_config)
+    os.environ["LLM_BASE_URL"] = stub_url
+    os.environ.setdefault("DEEPSEEK_API_KEY", "stub-key")
+    os.environ.setdefault("API_USERNAME", "loadtest")
+    os.environ.setdefault("API_PASSWORD", "loadtest")
+    # 压测流量不应被限流
+    os.environ.setdefault("RATE_LIMIT_DEFAULT", "100000000 per minute")
+    os.environ.setdefault("RATE_LIMIT_LLM", "100000000 per minute")
+    os.environ.setdefault("RATE_LIMIT_POLL", "100000000 per minute")
+    os.environ.setdefault("WATCH_WORKBOOKS", "0")
+    os.environ.setdefault("PREOPTIMIZE", "0")
+    print(f"LLM桩服务: {stub_url}（延迟 {args.latency}s，输出速率 {args.token_rate or '不限'}，错误率 {args.error_rate}）")
+
+    with tempfile.TemporaryDirectory(prefix="bebop-load-") as data_dir:
+        if args.api_url:
+            base_url, username, password = args.api_url.rstrip("/"), args.user, args.password
+        else:
+            base_url, username, password = start_local_api(data_dir, args.verbose)
+        token = base64.b64encode(f"{username}:{password}".encode("utf-8")).decode("ascii")
+
+        if args.scenario in ("api", "all"):
+            def api_task(index):
+                request = urllib.request.Request(base_url + API_PATHS[index % len(API_PATHS)],
+                                                 headers={"Authorization": f"Basic {token}"})
+                try:
+                    with urllib.request.urlopen(request, timeout=60) as response:
+                        response.read()
+                        return response.status == 200
+                except urllib.error.HTTPError:
+                    return False
+
+            run_load("api", api_task, args.requests, args.concurrency, args.verbose)
+
+        if args.scenario in ("optimize", "all"):
+            # 各请求轮流优化下周起的 OPTIMIZE_WEEKS 周
+            weeks = [(next_monday() + timedelta(weeks=i)).strftime("%Y-%m-%d") for i in range(OPTIMIZE_WEEKS)]
+            rejected = []
+
+            def optimize_task(index):
+                while True:
+                    status, headers, body = api_json(base_url, token, "/api/optimize",
+                                                     {"start": weeks[index % len(weeks)]})
+                    if status != 429:
+                        break
+                    rejected.append(index)
+                    time.sleep(min(float(headers.get("Retry-After", 1)), MAX_RETRY_WAIT))
+                if status != 202:
+                    return False
+                while True:
+                    status, _, job = api_json(base_url, token, f"{body['status_url']}?timeout=25")
+                    if status != 200:
+                        return False
+                    if job["status"] in ("done", "failed"):
+                        return job["status"] == "done"
+
+            run_load("optimize", optimize_task, args.requests, args.concurrency, args.verbose)
+            print(f"{'':>9}  队列已满（429）后重新提交 {len(rejected)} 次")
+
+    stub_server.shutdown()
+    print(f"桩服务统计: {stub_config.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import os
+import tempfile
+from schedule_store import iter_rows, row_to_event, EVENT_COLUMNS
+from ics_io import iter_ics_events
+
+# 每次从上传流读取的字节数
+SPOOL_CHUNK_BYTES = 64 * 1024
+# 每批解析并合并到存储的行数
+IMPORT_CHUNK_ROWS = 500
+# 支持导入的文件类型
+SUPPORTED_SUFFIXES = (".xlsx", ".csv", ".ics")
+
+
+class UploadTooLarge(Exception):
+    """上传文件超过大小限制"""
+
+
+def detect_suffix(filename, content_type=None):
+    """根据文件名或Content-Type判断导入格式"""
+    if filename:
+        suffix = os.path.splitext(filename)[1].lower()
+        if suffix in SUPPORTED_SUFFIXES:
+            return suffix
+    if content_type:
+        if "calendar" in content_type:
+            return ".ics"
+        if "csv" in content_type:
+            return ".csv"
+        if "spreadsheetml" in content_type:
+            return ".xlsx"
+    return None
+
+
+def spool_upload(stream, max_size, suffix, spool_dir=None):
+    """将上传流分块写入临时文件，超过 max_size 时删除临时文件并抛出 UploadTooLarge
+
+    返回 (临时文件路径, 字节数)
+    """
+    fd, path = tempfile.mkstemp(prefix="import-", suffix=suffix, dir=spool_dir)
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                chunk = stream.read(SPOOL_CHUNK_BYTES)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadTooLarge(f"文件超过大小限制 {max_size // (1024 * 1024)}MB")
+                f.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, size
+
+
+def iter_ics_chunks(file_path, chunk_rows=IMPORT_CHUNK_ROWS):
+    """逐行解析 .ics 文件，每 chunk_rows 个事件产出一批，格式同 iter_event_chunks"""
+    batch = []
+    with open(file_path, "r", encoding="utf-8", errors="replace", newline="") as f:
+        for item in iter_ics_events(f):
+            batch.append(item)
+            if len(batch) >= chunk_rows:
+                yield batch, len(batch), 0
+                batch = []
+    if batch:
+        yield batch, len(batch), 0
+
+
+def iter_event_chunks(file_path, chunk_rows=IMPORT_CHUNK_ROWS):
+    """逐行解析导入文件，每 chunk_rows 行产出一批
+
+    每批为 (事件列表[(日期, 事件)], 本批读取行数, 本批无效行数)
+    """
+    if file_path.lower().endswith(".ics"):
+        yield from iter_ics_chunks(file_path, chunk_rows)
+        return
+    batch = []
+    rows_read = invalid = 0
+    for index, row in enumerate(iter_rows(file_path)):
+        if index == 0:
+            missing_columns = [col for col in EVENT_COLUMNS if col not in row]
+            if missing_columns:
+                raise ValueError(f"导入文件缺少必要列: {', '.join(missing_columns)}")
+        rows_read += 1
+        parsed = row_to_event(row)
+        if parsed and parsed[1]["task"]:
+            batch.append(parsed)
+        else:
+            invalid += 1
+        if rows_read >= chunk_rows:
+            yield batch, rows_read, invalid
+            batch = []
+            rows_read = invalid = 0
+    if rows_read:
+        yield batch, rows_read, invalid
+
+
+def run_import(job, file_path, store, chunk_rows=IMPORT_CHUNK_ROWS):
+    """后台导入任务：分批解析并合并到存储，全部完成后写回一次工作簿"""
+    job.update(rows_read=0, merged=0, skipped=0, invalid=0,
+               bytes_total=os.path.getsize(file_path))
+    try:
+        for batch, rows_read, invalid in iter_event_chunks(file_path, chunk_rows):
+            merged, skipped = store.merge(batch)
+            job.update(
+                rows_read=job.progress["rows_read"] + rows_read,
+                merged=job.progress["merged"] + merged,
+                skipped=job.progress["skipped"] + skipped,
+                invalid=job.progress["invalid"] + invalid,
+            )
+        if job.progress["merged"]:
+            store.save()
+        return {key: job.progress[key] for key in ("rows_read", "merged", "skipped", "invalid")}
+    finally:
+        os.remove(file_path)
@@ -2,13 +2,17 @@ import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog
 from calendar import monthcalendar, month_name, day_name
 from datetime import datetime, timedelta
-import pandas as pd
 import os
-import re
 import tkinter.simpledialog as sd
 import json  # 添加JSON支持
 import sys
-from flask_app import LLMAPI  # 从flask_app.py中导入LLMAPI类
+from schedule_store import (get_store_registry, parse_date, format_excel_date, normalize_time,
+                            normalize_single_time, time_to_minutes, merge_day_events, ConflictError)
+from preoptimizer import PreOptimizer, next_week_range, collect_week, parse_hours
+from optimizer import generate_for_week, optimize_and_apply
+from undo import UndoHistory
+from engine import brush_target_dates, brush_changes
+import profiling
 
 if getattr(sys, 'frozen', False):
     # 打包后的环境：使用 sys.executable 获取 exe 路径
@@ -21,6 +25,13 @@ else:
 # 构建 Excel 文件路径（保存到 exe 同级目录）
 EXCEL_FILE_PATH = os.path.join(BASE_DIR, "记录.xlsx")
 
+# 检查存储变更流的间隔（毫秒）
+CHANGE_POLL_MS = 500
+# 设置 PROFILE=1 时被采样剖析的界面回调
+PROFILED_CALLBACKS = ("show_events", "update_calendar", "apply_format_brush", "adjust_next_week_schedule")
+# 撤销/重做按钮上显示的操作名称的最大长度
+UNDO_LABEL_CHARS = 8
+
 class CalendarApp:
     def __init__(self, root):
         self.root = root
@@ -29,44 +40,80 @@ class CalendarApp:
         self.root.resizable(True, True)
 
         self.api_key = os.getenv('DEEPSEEK_API_KEY')
-        self.llm_api = LLMAPI(self.api_key) if self.api_key else None  # 使用flask_app.py中的LLMAPI类
+        self._llm_api = None  # 首次使用时才创建，见 llm_api 属性
         self.SCHEDULE_FILE = "schedules.json"
         self.FEEDBACK_FILE = "feedbacks.json"
 
-        # 存储事件的数据结构 {日期: [{"time": "", "task": "", "completion": ""}, ...]}
-        self.events = {}
+        # 本机用户的日程分区（与同名API用户共用，读写都经过分区的文件锁）
+        # 事件保存在存储的写时复制快照中 {日期: ({"time": "", "task": "", "completion": ""}, ...)}
+        self.store = get_store_registry().get()
+        # 界面发起的修改经 self.history.commit() 发布，可撤销/重做
+        self.history = UndoHistory(self.store)
 
         # 当前显示的日期
         self.current_date = datetime.now()
 
-        # 尝试从Excel加载事件
-        self.load_events_from_excel()
+        # 在回调绑定到控件之前替换为被剖析的版本（未启用剖析时不做任何事）
+        profiling.instrument(self, PROFILED_CALLBACKS)
+        self.stall_detector = profiling.start_stall_detector(self.root)
 
-        # 创建UI
+        # 先创建UI并显示空日历，事件在后台加载完成后通过变更流填充
         self.create_widgets()
         self.update_calendar()
+        self.date_label.config(text="正在加载日程...")
+        self.store.load_async()
+
+        # 订阅存储变更流：后台加载完成、工作簿被外部修改或API写入时只刷新受影响的日期
+        self._seen_version = self.store.peek().version
+        self.root.after(CHANGE_POLL_MS, self.poll_store_changes)
+
+        # 修改下周并停止编辑后在后台预先优化下周日程（设置 PREOPTIMIZE=0 关闭）
+        self.preoptimizer = None
+        if self.api_key and os.getenv("PREOPTIMIZE", "1") == "1":
+            self.preoptimizer = PreOptimizer(
+                self.store, self.optimize_with_llm,
+                off_peak_hours=parse_hours(os.getenv("PREOPTIMIZE_OFF_PEAK", "")),
+            ).start()
 
         # 设置关闭窗口事件处理
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
         self.modified = False  # 跟踪是否有未保存的修改
 
+    @property
+    def events(self):
+        """当前版本日程的只读快照（get() 包含归档层），修改需通过 self.history.commit() 发布"""
+        return self.store.peek()
+
+    @property
+    def llm_api(self):
+        """首次使用时才导入flask_app中的LLMAPI（连带openai等依赖），加快启动"""
+        if self._llm_api is None and self.api_key:
+            from flask_app import LLMAPI
+            self._llm_api = LLMAPI(self.api_key)
+        return self._llm_api
+
+    def events_ready(self, notify=True):
+        """日程是否已加载完成，未完成时禁止修改，避免用空数据覆盖尚未加载的日期"""
+        if self.store.loaded:
+            return True
+        if notify:
+            messagebox.showinfo("提示", "日程正在加载，请稍候")
+        return False
+
     def adjust_next_week_schedule(self):
+        if not self.events_ready():
+            return
         try:
-            # 1. 从Excel加载所有事件
-            self.load_events_from_excel()
+            # 1. 内存中的快照由文件监视器保持与工作簿同步，无需重新加载
 
             # 2. 获取下周日期范围
-            today = datetime.now().date()
-            next_monday = today + timedelta(days=(7 - today.weekday()))
-            next_sunday = next_monday + timedelta(days=6)
-
-            # 3. 提取下周所有事件
-            next_week_events = {}
-            current_date = next_monday
-            while current_date <= next_sunday:
-                date_str = current_date.strftime("%Y-%m-%d")
-                next_week_events[date_str] = self.events.get(date_str, [])
-                current_date += timedelta(days=1)
+            next_monday, next_sunday = next_week_range()
+
+            # 3. 提取下周所有事件（从同一个快照读取，避免读到其他线程写了一半的修改）
+            snapshot = self.store.snapshot()
+            next_week_events = collect_week(snapshot, next_monday)
+            # 等待LLM期间这些日期被其他来源修改时，不覆盖对方的修改
+            expected = snapshot.versions_for(next_week_events)
 
             total_events = sum(len(events) for events in next_week_events.values())
             if total_events == 0:
@@ -75,25 +122,48 @@ class CalendarApp:
 
             print(f"找到下周 {len(next_week_events)} 天的 {total_events} 个事件")
 
-            # 4. 调用LLM进行优化
-            optimized_events = self.optimize_with_llm(next_week_events)
+            # 4. 下周内容与后台预优化时一致则直接使用
+            optimized_events = None
+            if self.preoptimizer:
+                optimized_events = self.preoptimizer.take(next_week_events)
+                if optimized_events and not messagebox.askyesno("提示", "已在后台预先优化好下周日程，是否直接使用？"):
+                    optimized_events = None
+            try:
+                if optimized_events:
+                    # 5. 以一个新版本整体发布优化结果并保存到Excel
+                    self.history.commit(optimized_events, "自动调整下周日程", expected=expected)
+                    saved = self.save_events_to_excel()
+                else:
+                    if not self.llm_api:
+                        messagebox.showerror("错误", "未配置API密钥，无法使用优化功能")
+                        return
+                    # 4-5. 调用LLM优化并写回；API或脚本同时优化同一周时合并为一次生成、一次写入
+                    optimized_events, _ = optimize_and_apply(
+                        self.store, self.llm_api, next_week_events, source="gui", expected=expected,
+                        commit=lambda changes, source, expected: self.history.commit(
+                            changes, "自动调整下周日程", source, expected))
+                    saved = bool(optimized_events)
+            except ConflictError as e:
+                optimized_events = self.apply_unconflicted(e, "自动调整下周日程")
+                if optimized_events is None:
+                    return
+                saved = self.save_events_to_excel()
 
             if not optimized_events:
                 messagebox.showerror("失败", "无法自动调整下周日程")
                 return
+            if self.preoptimizer:
+                # 优化后的下周不需要再在后台优化一次
+                self.preoptimizer.note_optimized(collect_week(self.store.snapshot(), next_monday))
 
-            # 5. 更新内存中的事件并保存到Excel
-            for date_str, events in optimized_events.items():
-                self.events[date_str] = events
-
-            if self.save_events_to_excel():
+            if saved:
                 # 更新日历显示
                 self.update_calendar()
                 # 如果当前正在查看下周，刷新显示
                 if self.selected_date in optimized_events:
                     self.show_events(self.context_row, self.context_col)
 
-                messagebox.showinfo("成功", "下周日程已自动调整并保存")
+                messagebox.showinfo("成功", "下周日程已自动调整并保存，可点击“撤销”恢复")
             else:
                 messagebox.showerror("失败", "保存调整后的日程失败")
         except Exception as e:
@@ -101,138 +171,12 @@ class CalendarApp:
             messagebox.showerror("错误", f"调整下周日程时出错: {str(e)}")
 
     def optimize_with_llm(self, events_data):
-        """使用LLM优化事件安排"""
-        try:
-            if not self.llm_api:
-                messagebox.showerror("错误", "未配置API密钥，无法使用优化功能")
-                return None
-
-            # 准备LLM提示（移除了多余的缩进）
-            prompt = f"""你是一个专业的日程优化顾问，请根据以下事件安排优化下周日程：
-
-## 原始日程安排
-{json.dumps(events_data, indent=2, ensure_ascii=False)}
-
-## 优化要求
-1. 保持每天的核心事件不变
-2. 优化时间分配，避免冲突
-3. 确保重要任务有足够时间
-4. 添加必要的休息时间
-5. 保持总事件数量大致相同
-6. 时间格式统一为"HH:MM-HH:MM"
-7. 对于已完成的事件，保持原样不变
-8. 对于未开始的事件，可以调整时间
-9. 如果一天任务太多，可以将任务调到之后的日期
-## 输出要求
-返回优化后的完整日程JSON对象，格式必须严格如下:
-{{
-  "2024-06-10": [
-    {{"time": "09:00-10:00", "task": "会议", "completion": "待评价"}},
-    {{"time": "10:30-12:00", "task": "项目开发", "completion": "待评价"}}
-  ],
-  "2024-06-11": [
-    // 其他日期...
-  ]
-}}
-只返回纯JSON，不要包含任何解释性文字或额外内容。"""
-
-            # 调用LLM
-            print("请求LLM优化日程...")
-            response = self.llm_api.generate_response(prompt, max_tokens=2000)
-            print(f"LLM响应: {response[:500]}...")
-
-            # 更健壮的JSON解析方法
-            optimized_events = self.extract_json_from_response(response)
-            if not optimized_events:
-                # 记录详细的响应内容以便调试
-                print(f"无效的LLM响应: {response}")
-                return None
-
-            # 验证格式
-            if not self.validate_optimized_events(optimized_events):
-                print(f"验证失败的优化结果: {optimized_events}")
-                return None
-
-            return optimized_events
-
-        except ValueError as ve:
-            # 处理JSON解析错误
-            print(f"JSON解析错误: {str(ve)}")
-            return None
-        except AttributeError as ae:
-            # 处理API调用错误
-            print(f"API调用错误: {str(ae)}")
+        """使用LLM优化事件安排（不写入，实现见 optimizer.optimize_week）"""
+        if not self.llm_api:
+            messagebox.showerror("错误", "未配置API密钥，无法使用优化功能")
             return None
-        except Exception as e:
-            # 处理其他未知错误
-            print(f"LLM优化失败: {str(e)}")
-            return None
-
-    def extract_json_from_response(self, response):
-        """从LLM响应中提取JSON"""
-        try:
-            # 尝试找到JSON开始和结束位置
-            start_idx = response.find('{')
-            end_idx = response.rfind('}')
-
-            if start_idx == -1 or end_idx == -1:
-                print("未找到有效的JSON结构")
-                return None
-
-            json_str = response[start_idx:end_idx+1]
-            return json.loads(json_str)
-        except Exception as e:
-            print(f"解析JSON时出错: {str(e)}")
-            return None
-
-    
-    def extract_json_from_response(self, response):
-        """从LLM响应中提取JSON"""
-        try:
-            # 尝试找到JSON开始和结束位置
-            start_idx = response.find('{')
-            end_idx = response.rfind('}')
-            
-            if start_idx == -1 or end_idx == -1:
-                print("未找到有效的JSON结构")
-                return None
-            
-            json_str = response[start_idx:end_idx+1]
-            return json.loads(json_str)
-        except Exception as e:
-            print(f"解析JSON失败: {str(e)}")
-            return None
-    
-    def validate_optimized_events(self, events):
-        """验证优化后的事件格式"""
-        if not isinstance(events, dict):
-            print("优化后事件格式错误: 应为字典")
-            return False
-        
-        for date_str, event_list in events.items():
-            # 验证日期格式
-            try:
-                datetime.strptime(date_str, "%Y-%m-%d")
-            except ValueError:
-                print(f"无效日期格式: {date_str}")
-                return False
-            
-            # 验证事件列表
-            if not isinstance(event_list, list):
-                print(f"{date_str} 的事件格式错误: 应为列表")
-                return False
-                
-            for event in event_list:
-                if not all(key in event for key in ["time", "task", "completion"]):
-                    print(f"事件缺少必要字段: {event}")
-                    return False
-                
-                # 验证时间格式
-                if not re.match(r"\d{2}:\d{2}-\d{2}:\d{2}", event["time"]):
-                    print(f"时间格式错误: {event['time']} (应为HH:MM-HH:MM)")
-                    return False
-                    
-        return True
+        # 相同内容的并发请求（如后台预优化与手动调整）共用一次生成
+        return generate_for_week(self.store, self.llm_api, events_data)
 
     def create_widgets(self):
         # 创建主框架
@@ -276,10 +220,30 @@ class CalendarApp:
         button_frame.pack(side=tk.RIGHT)
         
         tk.Button(button_frame, text="今天", command=self.show_today).pack(side=tk.LEFT, padx=2)
+        # 按钮随撤销栈启用/禁用，并显示下一步要撤销/重做的操作，见 update_undo_buttons()
+        self.undo_button = tk.Button(button_frame, text="撤销", command=self.undo, state=tk.DISABLED)
+        self.undo_button.pack(side=tk.LEFT, padx=2)
+        self.redo_button = tk.Button(button_frame, text="重做", command=self.redo, state=tk.DISABLED)
+        self.redo_button.pack(side=tk.LEFT, padx=2)
+        self.root.bind("<Control-z>", self.undo)
+        self.root.bind("<Control-y>", self.redo)
+        if profiling.enabled():
+            self.root.bind("<Control-M>", self.show_memory_snapshot)
         tk.Button(button_frame, text="保存", command=self.save_events).pack(side=tk.LEFT, padx=2)
         tk.Button(button_frame, text="加载", command=self.load_events).pack(side=tk.LEFT, padx=2)
         # 添加新按钮
         tk.Button(button_frame, text="自动调整下周日程", command=self.adjust_next_week_schedule).pack(side=tk.LEFT, padx=2)
+        tk.Button(button_frame, text="年度概览", command=self.show_year_overview).pack(side=tk.LEFT, padx=2)
+
+        # 搜索栏
+        search_frame = tk.Frame(left_frame, padx=10)
+        search_frame.pack(fill=tk.X, pady=(0, 5))
+        tk.Label(search_frame, text="搜索任务:").pack(side=tk.LEFT)
+        self.search_var = tk.StringVar()
+        search_entry = tk.Entry(search_frame, textvariable=self.search_var, width=30)
+        search_entry.pack(side=tk.LEFT, padx=5)
+        search_entry.bind("<Return>", self.search_events)
+        tk.Button(search_frame, text="搜索", command=self.search_events).pack(side=tk.LEFT, padx=2)
         
         # 日历显示区域
         calendar_frame = tk.Frame(left_frame, relief=tk.GROOVE, borderwidth=2)
@@ -378,180 +342,50 @@ class CalendarApp:
         self.selected_date = None
         self.context_row = None
         self.context_col = None
+        # 事件面板显示时该日期的版本和事件，保存时据此检测并合并其他来源的修改
+        self.shown_version = 0
+        self.shown_events = ()
         
         # 当前日历数据
         self.current_cal = None
 
+    # 日期/时间格式处理与工作簿读写共用 schedule_store 中的实现
     def parse_excel_date(self, date_str):
         """解析Excel中的日期格式(年.月.日)"""
-        try:
-            # 尝试解析"年.月.日"格式
-            if isinstance(date_str, str) and re.match(r"\d{4}\.\d{1,2}\.\d{1,2}", date_str):
-                parts = date_str.split('.')
-                if len(parts) == 3:
-                    year = int(parts[0])
-                    month = int(parts[1])
-                    day = int(parts[2])
-                    return f"{year}-{month:02d}-{day:02d}"
-            
-            # 处理pandas日期类型
-            if isinstance(date_str, pd.Timestamp):
-                return date_str.strftime("%Y-%m-%d")
-            
-            # 处理datetime对象
-            if isinstance(date_str, datetime):
-                return date_str.strftime("%Y-%m-%d")
-            
-            # 处理字符串格式的日期
-            if isinstance(date_str, str):
-                # 尝试解析其他常见格式
-                for fmt in ("%Y-%m-%d", "%Y/%m/%d", "%Y.%m.%d", "%Y-%m-%d %H:%M:%S"):
-                    try:
-                        dt = datetime.strptime(date_str, fmt)
-                        return dt.strftime("%Y-%m-%d")
-                    except ValueError:
-                        continue
-            
-            # 尝试解析Excel序列号日期
-            try:
-                if isinstance(date_str, (int, float)):
-                    # Excel日期是从1900-01-01开始的天数
-                    base_date = datetime(1900, 1, 1)
-                    parsed_date = base_date + timedelta(days=date_str - 2)  # Excel有1900年闰年错误
-                    return parsed_date.strftime("%Y-%m-%d")
-            except:
-                pass
-            
-            return None
-        except Exception as e:
-            print(f"解析日期错误: {date_str} - {str(e)}")
-            return None
+        return parse_date(date_str)
 
     def format_excel_date(self, date_str):
         """将日期格式化为年.月.日格式"""
-        try:
-            # 解析标准日期格式
-            if isinstance(date_str, str) and re.match(r"\d{4}-\d{2}-\d{2}", date_str):
-                year, month, day = date_str.split('-')
-                return f"{int(year)}.{int(month)}.{int(day)}"
-            return date_str
-        except Exception as e:
-            print(f"格式化日期错误: {date_str} - {str(e)}")
-            return date_str
+        return format_excel_date(date_str)
 
     def normalize_time(self, time_str):
         """标准化时间格式"""
-        if not isinstance(time_str, str):
-            return ""
-        
-        # 尝试统一时间分隔符
-        time_str = time_str.replace("：", ":")  # 替换中文冒号
-        time_str = time_str.replace("—", "-")   # 替换中文破折号
-        time_str = time_str.replace("~", "-")   # 替换波浪号
-        
-        # 确保时间段分隔符统一
-        if "-" in time_str:
-            parts = time_str.split("-")
-            if len(parts) == 2:
-                start = self.normalize_single_time(parts[0].strip())
-                end = self.normalize_single_time(parts[1].strip())
-                return f"{start} - {end}"
-        
-        # 处理单个时间点
-        return self.normalize_single_time(time_str.strip())
-    
+        return normalize_time(time_str)
+
     def normalize_single_time(self, time_str):
         """标准化单个时间点格式"""
-        # 尝试解析时间格式
-        if re.match(r"\d{1,2}:\d{2}", time_str):
-            # 已经是标准格式
-            return time_str
-        
-        # 尝试添加分钟部分
-        if re.match(r"\d{1,2}$", time_str):
-            return f"{time_str}:00"
-        
-        # 其他格式直接返回
-        return time_str
+        return normalize_single_time(time_str)
 
     def time_to_minutes(self, time_str):
         """将时间字符串转换为分钟数用于排序"""
-        # 处理时间段（取开始时间）
-        if " - " in time_str:
-            time_str = time_str.split(" - ")[0].strip()
-        
-        # 尝试解析时间
-        try:
-            if ":" in time_str:
-                parts = time_str.split(":")
-                hours = int(parts[0])
-                minutes = int(parts[1]) if len(parts) > 1 else 0
-                return hours * 60 + minutes
-            elif time_str.isdigit():
-                return int(time_str) * 60
-            else:
-                return 0
-        except:
-            return 0
+        return time_to_minutes(time_str)
 
     def load_events_from_excel(self):
         """从Excel文件加载事件"""
         try:
-            if os.path.exists(EXCEL_FILE_PATH):
-                # 读取Excel文件
-                df = pd.read_excel(EXCEL_FILE_PATH, dtype=str)  # 全部读取为字符串
-                print(f"成功读取Excel文件，共{len(df)}行数据")
-                
-                # 检查必要的列
-                required_columns = ["日期", "时间", "任务", "完成度"]
-                missing_columns = [col for col in required_columns if col not in df.columns]
-                
-                if missing_columns:
-                    print(f"Excel文件缺少必要列: {', '.join(missing_columns)}")
-                    messagebox.showwarning("警告", f"Excel文件缺少必要列: {', '.join(missing_columns)}")
-                    return False
-                
-                # 清空当前事件
-                self.events = {}
-                
-                # 处理每一行数据
-                for index, row in df.iterrows():
-                    date_str = str(row["日期"])
-                    parsed_date = self.parse_excel_date(date_str)
-                    
-                    if not parsed_date:
-                        print(f"跳过无法解析的日期: {date_str} (行 {index+2})")
-                        continue
-                    
-                    # 处理时间
-                    time_str = self.normalize_time(str(row["时间"]))
-                    
-                    # 创建事件
-                    event = {
-                        "time": time_str,
-                        "task": str(row["任务"]) if pd.notna(row["任务"]) else "",
-                        "completion": str(row["完成度"]) if pd.notna(row["完成度"]) else "未开始"
-                    }
-                    
-                    if parsed_date not in self.events:
-                        self.events[parsed_date] = []
-                    
-                    self.events[parsed_date].append(event)
-                    print(f"添加事件: {parsed_date} - {time_str} - {event['task']}")
-                
-                # 对所有日期的事件按时间排序
-                for date in self.events:
-                    self.events[date] = sorted(
-                        self.events[date], 
-                        key=lambda x: self.time_to_minutes(x["time"])
-                    )
-                    print(f"排序后 {date} 有 {len(self.events[date])} 个事件")
-                
-                print(f"成功从Excel加载 {len(df)} 条事件记录")
-                return True
-            else:
+            if not self.store.by_year and not os.path.exists(self.store.file_path):
                 print("未找到记录.xlsx文件，将使用空事件集")
                 return False
+
+            # 读取工作簿（持有分区文件锁，避免读到其他写入者写了一半的文件）
+            snapshot = self.store.load()
+            print(f"成功从Excel加载 {snapshot.event_count()} 条事件记录")
+            return True
+        except ValueError as e:
+            # 缺少必要列
+            print(str(e))
+            messagebox.showwarning("警告", str(e))
+            return False
         except Exception as e:
             print(f"加载Excel文件时出错: {str(e)}")
             messagebox.showerror("错误", f"加载Excel文件时出错: {str(e)}")
@@ -560,33 +394,8 @@ class CalendarApp:
     def save_events_to_excel(self):
         """将事件保存到Excel文件"""
         try:
-            # 准备数据
-            data = []
-            event_count = 0
-            
-            for date, events in self.events.items():
-                for event in events:
-                    formatted_date = self.format_excel_date(date)
-                    data.append({
-                        "日期": formatted_date,
-                        "时间": event["time"],
-                        "任务": event["task"],
-                        "完成度": event["completion"]
-                    })
-                    event_count += 1
-                    print(f"保存事件: {formatted_date} - {event['time']} - {event['task']}")
-            
-            # 创建数据框
-            df = pd.DataFrame(data)
-            
-            # 确保列顺序正确
-            if not df.empty:
-                df = df[["日期", "时间", "任务", "完成度"]]
-            
-            # 保存到Excel
-            df.to_excel(EXCEL_FILE_PATH, index=False)
-            print(f"成功保存 {event_count} 条事件到Excel")
-            return True
+            # 保存当前快照，只有内容变化的分区会被重写，写入时持有对应的文件锁
+            return self.store.save()
         except Exception as e:
             print(f"保存Excel文件时出错: {str(e)}")
             messagebox.showerror("错误", f"保存Excel文件时出错: {str(e)}")
@@ -613,18 +422,85 @@ class CalendarApp:
                         btn = self.day_buttons[week_idx][day_idx]
                         btn.config(text=str(day))
                         
-                        # 标记有事件的日期
+                        # 标记有事件的日期和今天
                         date_str = f"{year}-{month:02d}-{day:02d}"
-                        if date_str in self.events and self.events[date_str]:
-                            btn.config(bg="#ADD8E6")
-                        # 标记今天
-                        today = datetime.now()
-                        if year == today.year and month == today.month and day == today.day:
-                            btn.config(bg="#FFD700")
+                        btn.config(bg=self.day_cell_color(date_str))
             print(f"日历更新为: {year}年{month}月")
         except Exception as e:
             print(f"更新日历时出错: {str(e)}")
 
+    def day_cell_color(self, date_str):
+        """日历格子的背景色：今天为金色，有事件为浅蓝色"""
+        if date_str == datetime.now().strftime("%Y-%m-%d"):
+            return "#FFD700"
+        if self.events.get(date_str):
+            return "#ADD8E6"
+        return "SystemButtonFace"
+
+    def refresh_day_cell(self, date_str):
+        """只刷新某一天对应的日历格子，不在当前显示月份时忽略"""
+        if not self.current_cal:
+            return
+        year, month, day = (int(part) for part in date_str.split("-"))
+        if year != int(self.year_var.get()) or month != list(month_name).index(self.month_var.get()):
+            return
+        for week_idx, week in enumerate(self.current_cal):
+            if day in week:
+                self.day_buttons[week_idx][week.index(day)].config(bg=self.day_cell_color(date_str))
+                return
+
+    def poll_store_changes(self):
+        """定期读取存储变更流，只刷新外部修改涉及的日历格子和事件面板"""
+        try:
+            if not self.store.loaded and self.store.load_error:
+                # 后台加载失败，提示一次后允许用户通过"加载"按钮重试
+                self.date_label.config(text="日程加载失败")
+                messagebox.showerror("错误", f"加载Excel文件时出错: {self.store.load_error}")
+                self.store.load_error = None
+            changes = self.store.changes_since(self._seen_version)
+            if changes is None:
+                # 变更记录不连续，整体刷新
+                self._seen_version = self.store.snapshot().version
+                self.update_calendar()
+                if self.selected_date:
+                    self.show_events(self.context_row, self.context_col)
+            elif changes:
+                if self._seen_version == 0:
+                    # 后台首次加载完成
+                    self.date_label.config(text="选择日期查看事件")
+                self._seen_version = changes[-1][0]
+                # 界面自己发布的修改已经刷新过，这里只处理来自文件、API等其他来源的修改
+                dates = set()
+                for version, changed_dates, source in changes:
+                    if source != "gui":
+                        dates |= changed_dates
+                for date_str in dates:
+                    self.refresh_day_cell(date_str)
+                if self.selected_date in dates:
+                    self.show_events(self.context_row, self.context_col)
+                if dates:
+                    print(f"同步外部修改: {', '.join(sorted(dates))}")
+            if changes != []:
+                # 界面的修改都经过 self.history.commit()，发布后在这里更新撤销/重做按钮
+                self.update_undo_buttons()
+        except Exception as e:
+            print(f"刷新外部修改时出错: {str(e)}")
+        finally:
+            self.root.after(CHANGE_POLL_MS, self.poll_store_changes)
+
+    def apply_unconflicted(self, error, label):
+        """一组修改的部分日期已被其他来源修改：询问是否只应用其余日期，返回已应用的修改或 None"""
+        remaining = {date_str: day_events for date_str, day_events in error.changes.items()
+                     if date_str not in error.conflicts}
+        message = f"{label}期间以下日期已被其他来源修改:\n{', '.join(sorted(error.conflicts))}\n"
+        if not remaining:
+            messagebox.showwarning("修改冲突", message + "结果未应用，可重新操作")
+            return None
+        if not messagebox.askyesno("修改冲突", message + "是否只应用其余日期的结果？（这些日期保持当前内容）"):
+            return None
+        self.history.commit(remaining, label, expected=error.snapshot.versions_for(remaining))
+        return remaining
+
     def show_today(self):
         today = datetime.now()
         self.month_var.set(month_name[today.month])
@@ -642,6 +518,128 @@ class CalendarApp:
                 break
         self.show_events(row, col)
 
+    def jump_to_date(self, date_str):
+        """切换日历到该日所在月份并显示该日事件"""
+        day = datetime.strptime(date_str, "%Y-%m-%d")
+        self.year_var.set(str(day.year))
+        self.month_var.set(month_name[day.month])
+        self.update_calendar()
+        for row_idx, week in enumerate(self.current_cal):
+            if day.day in week:
+                self.show_events(row_idx + 1, week.index(day.day))
+                return
+
+    def search_events(self, event=None):
+        """在倒排索引中搜索任务名，结果按日期从新到旧列出，双击跳转到该日"""
+        query = self.search_var.get().strip()
+        if not query or not self.events_ready():
+            return
+        from search_index import get_search_index
+
+        total, hits = get_search_index(self.store).search(query, limit=500, newest_first=True)
+        window = tk.Toplevel(self.root)
+        window.title(f"搜索: {query}")
+        window.geometry("520x400")
+        shown = f"，显示最近 {len(hits)} 条" if total > len(hits) else ""
+        tk.Label(window, text=f"共找到 {total} 个事件{shown}（双击跳转）", anchor="w").pack(fill=tk.X, padx=10, pady=5)
+        list_frame = tk.Frame(window)
+        list_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
+        scrollbar = tk.Scrollbar(list_frame)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        listbox = tk.Listbox(list_frame, yscrollcommand=scrollbar.set)
+        listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.config(command=listbox.yview)
+        for hit in hits:
+            listbox.insert(tk.END, f"{hit['date']}  {hit['time']}  {hit['task']}  [{hit['completion']}]")
+
+        def on_select(event=None):
+            selection = listbox.curselection()
+            if selection:
+                self.jump_to_date(hits[selection[0]]["date"])
+
+        listbox.bind("<Double-Button-1>", on_select)
+
+    def show_year_overview(self):
+        """年度热力图：每格一天，颜色深浅表示已安排时长或完成率，数据来自统计汇总表"""
+        if not self.events_ready():
+            return
+        from rollups import get_rollups, STATES, MINUTES
+
+        rollups = get_rollups(self.store)
+        window = tk.Toplevel(self.root)
+        window.title("年度概览")
+        window.resizable(False, False)
+
+        top_frame = tk.Frame(window)
+        top_frame.pack(fill=tk.X, padx=10, pady=5)
+        year_var = tk.StringVar(value=self.year_var.get())
+        metric_var = tk.StringVar(value="已安排时长")
+        tk.Label(top_frame, text="年份:").pack(side=tk.LEFT)
+        year_combo = ttk.Combobox(top_frame, textvariable=year_var, width=6,
+                                  values=[str(y) for y in range(2020, 2031)])
+        year_combo.pack(side=tk.LEFT, padx=5)
+        tk.Label(top_frame, text="指标:").pack(side=tk.LEFT, padx=(10, 0))
+        metric_combo = ttk.Combobox(top_frame, textvariable=metric_var, width=10, state="readonly",
+                                    values=["已安排时长", "完成率"])
+        metric_combo.pack(side=tk.LEFT, padx=5)
+        info_label = tk.Label(window, text="点击日期跳转到该日", anchor="w")
+
+        cell, gap, left, top = 14, 2, 30, 20
+        canvas = tk.Canvas(window, width=left + 54 * (cell + gap), height=top + 7 * (cell + gap), bg="white")
+        canvas.pack(padx=10, pady=5)
+        info_label.pack(fill=tk.X, padx=10, pady=(0, 10))
+        done_index = STATES.index("已完成")
+        cancel_index = STATES.index("取消")
+
+        def cell_value(vector):
+            if vector is None:
+                return None
+            if metric_var.get() == "完成率":
+                effective = sum(vector[:len(STATES)]) - vector[cancel_index]
+                return vector[done_index] / effective if effective else None
+            return vector[MINUTES] or None
+
+        def color_for(ratio):
+            # 从浅绿到深绿
+            if ratio is None:
+                return "#EEEEEE"
+            light, dark = (214, 240, 214), (0, 100, 0)
+            rgb = [int(l + (d - l) * ratio) for l, d in zip(light, dark)]
+            return "#%02x%02x%02x" % tuple(rgb)
+
+        def describe(date_str, vector):
+            if vector is None:
+                return f"{date_str}: 无日程"
+            counts = "，".join(f"{state}{int(vector[i])}" for i, state in enumerate(STATES) if vector[i])
+            return f"{date_str}: {counts or '无事件'}，已安排 {int(vector[MINUTES]) // 60} 小时 {int(vector[MINUTES]) % 60} 分钟"
+
+        def redraw(event=None):
+            canvas.delete("all")
+            try:
+                year = int(year_var.get())
+            except ValueError:
+                return
+            days = rollups.daily(f"{year}-01-01", f"{year}-12-31")
+            values = [cell_value(vector) for _, vector in days]
+            peak = max((v for v in values if v), default=0)
+            for label_row, name in ((0, "一"), (2, "三"), (4, "五")):
+                canvas.create_text(left - 8, top + label_row * (cell + gap) + cell // 2, text=name, anchor="e")
+            first_weekday = datetime(year, 1, 1).weekday()
+            for index, ((date_str, vector), value) in enumerate(zip(days, values)):
+                column, row = divmod(index + first_weekday, 7)
+                x, y = left + column * (cell + gap), top + row * (cell + gap)
+                if date_str.endswith("-01"):
+                    canvas.create_text(x, top - 10, text=f"{int(date_str[5:7])}月", anchor="w")
+                ratio = None if value is None else (value / peak if peak and metric_var.get() != "完成率" else value)
+                item = canvas.create_rectangle(x, y, x + cell, y + cell, fill=color_for(ratio), outline="")
+                canvas.tag_bind(item, "<Enter>", lambda e, d=date_str, v=vector: info_label.config(text=describe(d, v)))
+                canvas.tag_bind(item, "<Button-1>", lambda e, d=date_str: self.jump_to_date(d))
+
+        year_combo.bind("<<ComboboxSelected>>", redraw)
+        year_combo.bind("<Return>", redraw)
+        metric_combo.bind("<<ComboboxSelected>>", redraw)
+        redraw()
+
     def show_events(self, row, col):
         try:
             # 获取点击的日期 - 从日历数据中获取而不是按钮文本
@@ -674,11 +672,12 @@ class CalendarApp:
                 completion_combo.set("")
             
             # 填充表格（按时间排序）
-            if date_str in self.events:
-                events = self.events[date_str]
-                
+            snapshot = self.store.peek()
+            self.shown_version = snapshot.day_version(date_str)
+            self.shown_events = snapshot.get(date_str)
+            if self.shown_events:
                 # 确保事件按时间排序
-                sorted_events = sorted(events, key=lambda x: self.time_to_minutes(x["time"]))
+                sorted_events = sorted(self.shown_events, key=lambda x: self.time_to_minutes(x["time"]))
                 
                 for i, event in enumerate(sorted_events):
                     if i < 10:  # 最多显示10个事件
@@ -691,6 +690,8 @@ class CalendarApp:
 
     def save_current_events(self):
         """保存当前日期的所有事件"""
+        if not self.events_ready():
+            return
         if not self.selected_date:
             messagebox.showwarning("警告", "请先选择一个日期")
             return
@@ -719,18 +720,50 @@ class CalendarApp:
         # 按时间排序
         new_events = sorted(new_events, key=lambda x: self.time_to_minutes(x["time"]))
         
-        # 更新内存中的事件
-        if new_events:
-            self.events[self.selected_date] = new_events
-        elif self.selected_date in self.events:
-            del self.events[self.selected_date]
+        # 发布新版本（事件列表为空时删除该日期）
+        if not self.commit_selected_day(new_events, f"编辑 {self.selected_date}"):
+            return
         
         # 更新日历显示
         self.update_calendar()
         self.modified = True
 
+    def commit_selected_day(self, new_events, label):
+        """以面板显示时的版本提交当前日期的修改，返回是否已提交
+
+        显示之后该日期被文件或API修改过时询问：合并双方的修改、用界面内容覆盖或放弃界面修改。
+        """
+        date_str = self.selected_date
+        conflicted = False
+        while True:
+            try:
+                snapshot = self.history.commit({date_str: new_events}, label,
+                                               expected={date_str: self.shown_version})
+                break
+            except ConflictError as e:
+                conflicted = True
+                choice = messagebox.askyesnocancel(
+                    "修改冲突", f"{date_str} 在编辑期间已被其他来源（文件或API）修改。\n"
+                                "是：合并双方的修改\n否：用界面中的内容覆盖\n取消：放弃界面中的修改")
+                if choice is None:
+                    self.show_events(self.context_row, self.context_col)
+                    return False
+                if choice:
+                    new_events = merge_day_events(self.shown_events, new_events, e.snapshot.get(date_str))
+                self.shown_version = e.snapshot.day_version(date_str)
+                self.shown_events = e.snapshot.get(date_str)
+        if conflicted:
+            # 显示合并后的结果
+            self.show_events(self.context_row, self.context_col)
+        else:
+            self.shown_version = snapshot.day_version(date_str)
+            self.shown_events = snapshot.get(date_str)
+        return True
+
     def delete_event(self):
         """删除选定行的事件"""
+        if not self.events_ready():
+            return
         try:
             if not self.selected_date:
                 messagebox.showwarning("警告", "请先选择一个日期")
@@ -747,13 +780,14 @@ class CalendarApp:
                 messagebox.showwarning("警告", "没有可删除的事件")
                 return
             
-            # 删除事件
-            if self.selected_date in self.events and selected_row < len(self.events[self.selected_date]):
-                del self.events[self.selected_date][selected_row]
+            # 删除事件（基于面板显示的版本，期间被其他来源修改时由 commit_selected_day 处理）
+            day_events = list(self.shown_events)
+            if selected_row < len(day_events):
+                del day_events[selected_row]
                 
-                # 如果没有事件了，删除日期键
-                if not self.events[self.selected_date]:
-                    del self.events[self.selected_date]
+                # 如果没有事件了，commit会删除日期键
+                if not self.commit_selected_day(day_events, f"删除 {self.selected_date} 的事件"):
+                    return
                 
                 # 更新UI
                 self.show_events(self.context_row, self.context_col)
@@ -765,13 +799,15 @@ class CalendarApp:
             print(f"删除事件时出错: {str(e)}")
 
     def clear_events(self):
+        if not self.events_ready():
+            return
         try:
             if not self.selected_date:
                 messagebox.showwarning("警告", "请先选择一个日期")
                 return
             
-            if self.selected_date in self.events:
-                del self.events[self.selected_date]
+            if self.shown_events and not self.commit_selected_day([], f"清空 {self.selected_date}"):
+                return
             
             # 更新UI
             self.show_events(self.context_row, self.context_col)
@@ -780,6 +816,55 @@ class CalendarApp:
         except Exception as e:
             print(f"清空事件时出错: {str(e)}")
 
+    def undo(self, event=None):
+        """撤销上一步界面修改"""
+        self.replay_history(self.history.undo, "撤销", "没有可撤销的操作")
+
+    def redo(self, event=None):
+        """重做上一步撤销的修改"""
+        self.replay_history(self.history.redo, "重做", "没有可重做的操作")
+
+    def update_undo_buttons(self):
+        """按撤销/重做栈启用或禁用按钮，按钮文字附上下一步的操作名称"""
+        for button, name, available, label in (
+                (self.undo_button, "撤销", self.history.can_undo(), self.history.undo_label()),
+                (self.redo_button, "重做", self.history.can_redo(), self.history.redo_label())):
+            if label and len(label) > UNDO_LABEL_CHARS:
+                label = label[:UNDO_LABEL_CHARS] + "…"
+            button.config(state=tk.NORMAL if available else tk.DISABLED,
+                          text=f"{name}: {label}" if label else name)
+
+    def show_memory_snapshot(self, event=None):
+        """Ctrl+Shift+M（启用剖析时）：第一次开始跟踪内存分配，之后显示自上次以来增长最多的位置"""
+        result = profiling.memory_snapshot(limit=10)
+        if result["started"]:
+            messagebox.showinfo("内存快照", "已开始跟踪内存分配，稍后再次按 Ctrl+Shift+M 查看增长最多的位置")
+            return
+        messagebox.showinfo("内存快照", f"当前 {result['current'] / 1024 / 1024:.1f}MB，"
+                                      f"峰值 {result['peak'] / 1024 / 1024:.1f}MB\n\n" + "\n".join(result["top"]))
+
+    def replay_history(self, action, name, empty_message):
+        if not self.events_ready():
+            return
+        try:
+            result = action()
+            if result is None:
+                messagebox.showinfo("提示", empty_message)
+                return
+            step, applied, skipped = result
+            self.update_calendar()
+            if self.selected_date in applied:
+                self.show_events(self.context_row, self.context_col)
+            self.modified = True
+            print(f"{name}: {step.label}（{len(applied)} 天）")
+            if skipped:
+                messagebox.showwarning("提示", f"{name}“{step.label}”时以下日期已被其他来源修改，保持不变:\n{', '.join(skipped)}")
+        except Exception as e:
+            print(f"{name}时出错: {str(e)}")
+            messagebox.showerror("错误", f"{name}时出错: {str(e)}")
+        finally:
+            self.update_undo_buttons()
+
     def save_events(self):
         if self.save_events_to_excel():
             self.modified = False
@@ -801,6 +886,8 @@ class CalendarApp:
         
     def on_event_modified(self, event=None):
         """当事件被修改时调用"""
+        if not self.events_ready(notify=False):
+            return
         self.modified = True
         # 自动保存当前日期的更改（不显示提示）
         self.save_current_events()
@@ -827,6 +914,8 @@ class CalendarApp:
         
     def apply_format_brush(self, row_index, mode):
         """应用格式刷"""
+        if not self.events_ready():
+            return
         try:
             # 获取当前事件信息
             time_val = self.time_entries[row_index].get().strip()
@@ -839,111 +928,59 @@ class CalendarApp:
             # 获取当前日期
             current_date = datetime.strptime(self.selected_date, "%Y-%m-%d")
             
-            # 根据模式获取目标日期
-            target_dates = []
-            
+            # 根据模式询问参数，目标日期由 engine.brush_target_dates 计算
             if mode == "weekly":
-                # 按星期：复制到指定的星期几
-                weekdays = ["周一", "周二", "周三", "周四", "周五", "周六", "周日"]
+                # 按星期：复制到未来四周内指定的星期几
                 selected = sd.askstring("按星期复制", "选择星期几(用逗号分隔, 如: 1,3,5)\n1:周一 2:周二 ... 7:周日", 
                                       initialvalue=str(current_date.isoweekday()))
-                
                 if not selected:
                     return
-                    
                 try:
                     days = [int(d.strip()) for d in selected.split(",") if d.strip()]
-                    for day in days:
-                        if day < 1 or day > 7:
-                            raise ValueError("星期值必须在1-7之间")
+                    target_dates = brush_target_dates(mode, current_date, weekdays=days)
                 except Exception as e:
                     messagebox.showerror("错误", f"无效的输入: {str(e)}")
                     return
                 
-                # 计算未来四周内指定的星期几
-                for week_offset in range(1, 5):  # 未来4周
-                    for day in days:
-                        # 计算目标日期
-                        target_date = current_date + timedelta(weeks=week_offset)
-                        # 调整到指定的星期几
-                        target_date = target_date - timedelta(days=target_date.weekday()) + timedelta(days=day-1)
-                        target_dates.append(target_date.strftime("%Y-%m-%d"))
-                
             elif mode == "biweekly":
-                # 单双周：复制到隔周的指定星期几
-                weekdays = ["周一", "周二", "周三", "周四", "周五", "周六", "周日"]
+                # 单双周：复制到未来8周内隔周的指定星期几
                 selected = sd.askstring("单双周复制", "选择星期几(1-7)\n1:周一 2:周二 ... 7:周日", 
                                       initialvalue=str(current_date.isoweekday()))
-                
                 if not selected:
                     return
-                    
                 try:
-                    day = int(selected.strip())
-                    if day < 1 or day > 7:
-                        raise ValueError("星期值必须在1-7之间")
+                    target_dates = brush_target_dates(mode, current_date, weekdays=[int(selected.strip())])
                 except Exception as e:
                     messagebox.showerror("错误", f"无效的输入: {str(e)}")
                     return
                 
-                # 计算未来8周内隔周的指定星期几
-                for week_offset in range(1, 9, 2):  # 隔周，共8周
-                    # 计算目标日期
-                    target_date = current_date + timedelta(weeks=week_offset)
-                    # 调整到指定的星期几
-                    target_date = target_date - timedelta(days=target_date.weekday()) + timedelta(days=day-1)
-                    target_dates.append(target_date.strftime("%Y-%m-%d"))
-                
             elif mode == "daily":
                 # 按日期：复制到指定日期范围内的每一天
                 start_date = sd.askstring("按日期复制", "开始日期(YYYY-MM-DD)", 
                                          initialvalue=self.selected_date)
                 end_date = sd.askstring("按日期复制", "结束日期(YYYY-MM-DD)", 
                                        initialvalue=(current_date + timedelta(days=7)).strftime("%Y-%m-%d"))
-                
                 if not start_date or not end_date:
                     return
-                    
                 try:
-                    start = datetime.strptime(start_date, "%Y-%m-%d")
-                    end = datetime.strptime(end_date, "%Y-%m-%d")
-                    
-                    if start > end:
-                        messagebox.showerror("错误", "开始日期不能晚于结束日期")
-                        return
-                        
-                    # 生成日期范围内的所有日期
-                    current = start
-                    while current <= end:
-                        target_dates.append(current.strftime("%Y-%m-%d"))
-                        current += timedelta(days=1)
+                    target_dates = brush_target_dates(mode, current_date, start=start_date, end=end_date)
                 except Exception as e:
-                    messagebox.showerror("错误", f"日期格式错误: {str(e)}")
+                    messagebox.showerror("错误", f"日期错误: {str(e)}")
                     return
+            else:
+                return
             
-            # 将事件复制到所有目标日期
-            count = 0
-            for date_str in target_dates:
-                # 创建新事件
-                new_event = {
-                    "time": time_val,
-                    "task": task_val,
-                    "completion": "待评价"  # 设置为待评价
-                }
-                
-                if date_str not in self.events:
-                    self.events[date_str] = []
-                
-                # 添加到事件列表
-                self.events[date_str].append(new_event)
-                
-                # 按时间排序
-                self.events[date_str] = sorted(
-                    self.events[date_str], 
-                    key=lambda x: self.time_to_minutes(x["time"])
-                )
-                
-                count += 1
+            # 将事件复制到所有目标日期（设置为待评价，一次性发布）
+            count = len(target_dates)
+            while True:
+                snapshot = self.store.snapshot()
+                changes = brush_changes(snapshot, target_dates, time_val, task_val)
+                try:
+                    self.history.commit(changes, f"格式刷复制“{task_val}”", expected=snapshot.versions_for(changes))
+                    break
+                except ConflictError:
+                    # 目标日期刚被其他来源修改，基于最新版本重新复制
+                    continue
             
             # 更新日历和显示
             self.update_calendar()
@@ -0,0 +1,156 @@
+"""面向数据分析的分块导出（CSV / Parquet）
+
+按日期顺序遍历存储快照，每次只在内存中保留一个固定大小的块。
+列: date(日期), start_minute(开始分钟), end_minute(结束分钟), task(任务), completion(完成度)
+命令行用法:
+  python data_export.py --format csv|parquet [--user 用户] [--start YYYY-MM-DD] [--end YYYY-MM-DD]
+                        [--completion 已完成,进行中] -o 输出文件
+"""
+import argparse
+import csv
+import io
+import os
+import sys
+import tempfile
+from schedule_store import parse_time_range
+
+EXPORT_COLUMNS = ["date", "start_minute", "end_minute", "task", "completion"]
+# 每块的行数，CSV每块产出一次，Parquet每块写一个行组
+EXPORT_CHUNK_ROWS = 50000
+# 流式发送Parquet文件时每次读取的字节数
+STREAM_CHUNK_BYTES = 256 * 1024
+
+
+def iter_event_records(snapshot, start=None, end=None, completions=None):
+    """按日期顺序产出 (日期, 开始分钟, 结束分钟, 任务, 完成度)，无法解析的时间对应分钟为 None"""
+    for date_str, day_events in snapshot.iter_days(start, end):
+        for event in day_events:
+            if completions and event["completion"] not in completions:
+                continue
+            time_range = parse_time_range(event["time"]) or (None, None)
+            yield date_str, time_range[0], time_range[1], event["task"], event["completion"]
+
+
+def iter_record_chunks(records, chunk_rows=EXPORT_CHUNK_ROWS):
+    """把记录流切分为固定大小的块"""
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_rows:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_csv(records, chunk_rows=EXPORT_CHUNK_ROWS):
+    """逐块生成CSV文本（首块带表头）"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(EXPORT_COLUMNS)
+    for chunk in iter_record_chunks(records, chunk_rows):
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _parquet_schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ("date", pa.date32()),
+        ("start_minute", pa.int16()),
+        ("end_minute", pa.int16()),
+        ("task", pa.string()),
+        ("completion", pa.dictionary(pa.int8(), pa.string())),
+    ])
+
+
+def write_parquet(records, output, chunk_rows=EXPORT_CHUNK_ROWS):
+    """按块写入Parquet文件（每块一个行组），output 为路径或可写的二进制文件对象
+
+    返回写入的行数。需要安装可选依赖 pyarrow。
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("导出Parquet需要安装 pyarrow: pip install pyarrow")
+
+    schema = _parquet_schema()
+    total = 0
+    with pq.ParquetWriter(output, schema, compression="zstd") as writer:
+        for chunk in iter_record_chunks(records, chunk_rows):
+            dates, starts, ends, tasks, completions = zip(*chunk)
+            batch = pa.record_batch([
+                # 日期字符串在pyarrow内部批量转换，避免逐行创建date对象
+                pa.array(dates, type=pa.string()).cast(pa.date32()),
+                pa.array(starts, type=pa.int16()),
+                pa.array(ends, type=pa.int16()),
+                pa.array(tasks, type=pa.string()),
+                pa.array(completions, type=pa.string()).dictionary_encode().cast(schema.field("completion").type),
+            ], schema=schema)
+            writer.write_batch(batch)
+            total += len(chunk)
+    return total
+
+
+def iter_parquet(records, chunk_rows=EXPORT_CHUNK_ROWS):
+    """先按块写入临时文件（Parquet的元数据在文件末尾），再分块读出，结束后删除临时文件"""
+    fd, path = tempfile.mkstemp(prefix="export-", suffix=".parquet")
+    os.close(fd)
+    try:
+        write_parquet(records, path, chunk_rows)
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(STREAM_CHUNK_BYTES)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.remove(path)
+
+
+def parse_completions(value):
+    """解析以逗号分隔的完成度过滤条件"""
+    if not value:
+        return None
+    return {item.strip() for item in value.split(",") if item.strip()}
+
+
+def main(argv=None):
+    from dotenv import load_dotenv
+    from schedule_store import BASE_DIR, get_store_registry
+
+    load_dotenv(os.path.join(BASE_DIR, ".env"))
+    parser = argparse.ArgumentParser(description="分块导出日程数据（CSV / Parquet）")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv", help="导出格式")
+    parser.add_argument("--user", default=None, help="用户名（默认为本机用户）")
+    parser.add_argument("--start", default=None, help="开始日期 YYYY-MM-DD")
+    parser.add_argument("--end", default=None, help="结束日期 YYYY-MM-DD")
+    parser.add_argument("--completion", default=None, help="只导出这些完成度，逗号分隔")
+    parser.add_argument("-o", "--output", default=None, help="输出文件（CSV默认输出到标准输出）")
+    args = parser.parse_args(argv)
+
+    snapshot = get_store_registry().get(args.user).snapshot()
+    records = iter_event_records(snapshot, args.start, args.end, parse_completions(args.completion))
+    if args.format == "parquet":
+        if not args.output:
+            parser.error("导出Parquet需要指定 -o 输出文件")
+        count = write_parquet(records, args.output)
+        print(f"已导出 {count} 行到 {args.output}")
+    elif args.output:
+        with open(args.output, "w", encoding="utf-8-sig", newline="") as f:
+            for chunk in iter_csv(records):
+                f.write(chunk)
+        print(f"已导出到 {args.output}")
+    else:
+        for chunk in iter_csv(records):
+            sys.stdout.write(chunk)
+
+
+if __name__ == "__main__":
+    main()
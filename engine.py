@@ -0,0 +1,152 @@
+"""与界面无关的日程处理核心：工作簿读取与校验、格式刷、下周优化
+
+桌面端和批处理命令行（batch.py）共用这里的实现。不依赖 tkinter，
+出错时抛出异常或返回问题列表，由调用方决定弹窗还是写入报告。
+"""
+from datetime import datetime, timedelta
+from schedule_store import (iter_rows, row_to_event, parse_time_range, time_to_minutes,
+                            freeze_event, ScheduleSnapshot, EVENT_COLUMNS)
+from rollups import COMPLETION_STATES
+
+# 校验报告中每类问题最多列出的条数
+MAX_ISSUE_EXAMPLES = 20
+# 格式刷：按星期复制到未来几周，单双周复制到未来几周（隔周）
+BRUSH_WEEKLY_WEEKS = 4
+BRUSH_BIWEEKLY_WEEKS = 8
+# 不需要具体时间的事件
+UNTIMED_VALUES = ("全天", "")
+
+
+def read_workbook_checked(file_path):
+    """读取工作簿并记录无法解析的行，返回 ({日期: [事件]}, 跳过的行, 数据行数)
+
+    跳过的行为 [(行号, [日期, 时间, 任务, 完成度 原值]), ...]，保存时应原样写回，避免丢失用户数据。
+    缺少必要列时抛出 ValueError。
+    """
+    events, skipped, rows = {}, [], 0
+    for index, row in enumerate(iter_rows(file_path)):
+        if index == 0:
+            missing_columns = [col for col in EVENT_COLUMNS if col not in row]
+            if missing_columns:
+                raise ValueError(f"工作簿缺少必要列: {', '.join(missing_columns)}")
+        rows += 1
+        parsed = row_to_event(row)
+        if not parsed:
+            skipped.append((index + 2, [row.get(col) for col in EVENT_COLUMNS]))
+            continue
+        date_str, event = parsed
+        events.setdefault(date_str, []).append(event)
+    for day_events in events.values():
+        day_events.sort(key=lambda x: time_to_minutes(x["time"]))
+    return events, skipped, rows
+
+
+def validate_events(events):
+    """检查日程内容：无法解析的时间、未知的完成度、同一天内时间重叠
+
+    返回 {"bad_times": [...], "unknown_states": [...], "overlaps": [...], "counts": {类别: 问题数}}，
+    列表中最多保留 MAX_ISSUE_EXAMPLES 条示例。
+    """
+    issues = {"bad_times": [], "unknown_states": [], "overlaps": []}
+    counts = dict.fromkeys(issues, 0)
+
+    def add(kind, item):
+        counts[kind] += 1
+        if len(issues[kind]) < MAX_ISSUE_EXAMPLES:
+            issues[kind].append(item)
+
+    for date_str in sorted(events):
+        ranges = []
+        for event in events[date_str]:
+            if event.get("completion") not in COMPLETION_STATES:
+                add("unknown_states", f"{date_str} {event.get('task')}: {event.get('completion')}")
+            time_range = parse_time_range(event.get("time", ""))
+            if time_range is None:
+                if str(event.get("time", "")).strip() not in UNTIMED_VALUES:
+                    add("bad_times", f"{date_str} {event.get('task')}: {event.get('time')}")
+                continue
+            ranges.append((time_range, event.get("task")))
+        ranges.sort()
+        for (previous, previous_task), (current, task) in zip(ranges, ranges[1:]):
+            if current[0] < previous[1]:
+                add("overlaps", f"{date_str} {previous_task} 与 {task}")
+    issues["counts"] = counts
+    return issues
+
+
+def brush_target_dates(mode, current_date, weekdays=None, start=None, end=None):
+    """格式刷的目标日期（YYYY-MM-DD 列表）
+
+    mode="weekly": 未来4周中 weekdays（1=周一 ... 7=周日）对应的日期
+    mode="biweekly": 未来8周中隔周的 weekdays[0]
+    mode="daily": start 到 end（含）的每一天
+    参数无效时抛出 ValueError。
+    """
+    if isinstance(current_date, str):
+        current_date = datetime.strptime(current_date, "%Y-%m-%d")
+    if mode in ("weekly", "biweekly"):
+        weekdays = list(weekdays or [])
+        if not weekdays:
+            raise ValueError("请至少选择一个星期几")
+        for day in weekdays:
+            if day < 1 or day > 7:
+                raise ValueError("星期值必须在1-7之间")
+        if mode == "weekly":
+            offsets = range(1, BRUSH_WEEKLY_WEEKS + 1)
+        else:
+            offsets, weekdays = range(1, BRUSH_BIWEEKLY_WEEKS + 1, 2), weekdays[:1]
+        target_dates = []
+        for week_offset in offsets:
+            for day in weekdays:
+                target = current_date + timedelta(weeks=week_offset)
+                # 调整到指定的星期几
+                target = target - timedelta(days=target.weekday()) + timedelta(days=day - 1)
+                target_dates.append(target.strftime("%Y-%m-%d"))
+        return target_dates
+    if mode == "daily":
+        start = datetime.strptime(start, "%Y-%m-%d") if isinstance(start, str) else start
+        end = datetime.strptime(end, "%Y-%m-%d") if isinstance(end, str) else end
+        if start > end:
+            raise ValueError("开始日期不能晚于结束日期")
+        return [(start + timedelta(days=offset)).strftime("%Y-%m-%d") for offset in range((end - start).days + 1)]
+    raise ValueError(f"未知的格式刷模式: {mode}")
+
+
+def brush_changes(days, target_dates, time_val, task_val, completion="待评价"):
+    """把一个事件复制到目标日期，返回可直接提交的 {日期: 新的事件列表}"""
+    changes = {}
+    for date_str in target_dates:
+        if date_str not in changes:
+            changes[date_str] = list(days.get(date_str, ()))
+        changes[date_str].append({"time": time_val, "task": task_val, "completion": completion})
+    return changes
+
+
+def collect_week_from(events, monday):
+    """从 {日期: [事件]} 中取出 monday 所在一周，没有事件的日期为空列表"""
+    week = {}
+    for offset in range(7):
+        date_str = (monday + timedelta(days=offset)).strftime("%Y-%m-%d")
+        week[date_str] = [dict(event) for event in events.get(date_str, ())]
+    return week
+
+
+def history_from_events(events):
+    """由 {日期: [事件]} 生成历史画像文本（不含反馈评分）"""
+    from history_profile import HistoryProfile
+
+    days = {date_str: tuple(freeze_event(event) for event in day_events)
+            for date_str, day_events in events.items() if day_events}
+    profile = HistoryProfile()
+    profile.rebuild(ScheduleSnapshot(0, days))
+    return profile.to_prompt()
+
+
+def optimize_events_week(llm_api, events, monday):
+    """优化 events 中 monday 所在一周，返回优化后的 {日期: [事件]}；该周没有事件时返回 {}，失败时返回 None"""
+    from optimizer import optimize_week
+
+    week = collect_week_from(events, monday)
+    if not any(week.values()):
+        return {}
+    return optimize_week(llm_api, week, history_from_events(events))
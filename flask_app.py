@@ -1,31 +1,39 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context
+from werkzeug.exceptions import RequestEntityTooLarge
 import os
-import numpy as np
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
-from openai import OpenAI
 import re
-import pandas as pd
-from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
 from flask_httpauth import HTTPBasicAuth
-from filelock import FileLock
 import traceback
 import sys
+import importlib.util
+import time
+from rate_limit import TokenBucketLimiter
+from api_users import verify_credentials, is_known_user
+from http_codec import ResponseCodec
+import profiling
+from schedule_store import get_store_registry, parse_time_range, normalize_time, ConflictError
+from jobs import JobRegistry, JobQueue, QueueFull, PRIORITIES
+from bulk_import import detect_suffix, spool_upload, run_import, UploadTooLarge
+from ics_io import iter_ics
+from data_export import iter_event_records, iter_csv, iter_parquet, parse_completions
+from rollups import get_rollups, PERIODS
+from search_index import get_search_index
+from free_slots import get_busy_index, find_free_slots, iter_dates, DEFAULT_DAY_START, DEFAULT_DAY_END
+from token_budget import choose_max_tokens, usage_recorder
+from hedging import build_hedger, hedging_summary
+from optimizer import optimize_and_apply
+from preoptimizer import next_week_range, collect_week
 
 app = Flask(__name__)
 
-# 安全配置
-auth = HTTPBasicAuth()
-limiter = Limiter(
-    get_remote_address,
-    app=app,
-    default_limits=["1000 per day", "100 per hour"],
-    storage_uri="memory://",
-)
-
 # 存储用户日程和反馈的数据结构
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+# multipart 表单的边界和头部开销
+UPLOAD_OVERHEAD = 64 * 1024
+# 请求体上限：Werkzeug 读取请求体（包括没有 Content-Length 的分块上传）时超过即返回413
+app.config["MAX_CONTENT_LENGTH"] = MAX_FILE_SIZE + UPLOAD_OVERHEAD
 
 if getattr(sys, 'frozen', False):
     # 打包后的环境：使用 sys.executable 获取 exe 路径
@@ -34,26 +42,73 @@ else:
     # 开发环境：使用 __file__ 获取脚本路径
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-# 加载 .env 文件（打包时已包含）
+# 加载 .env 文件（打包时已包含）；须在读取 RATE_LIMIT_*、COMPRESS_MIN_SIZE 等配置的初始化之前
 load_dotenv(os.path.join(BASE_DIR, ".env"))
 
+# 安全配置
+auth = HTTPBasicAuth()
+# 限流计数保存在本地SQLite中（RATE_LIMIT_DB，默认为程序目录下的 ratelimit.sqlite3），多个工作进程共享且重启后不丢失
+# 普通请求使用 default 预算，调用LLM的路由通过 @limiter.limit("llm") 使用更严格的预算
+limiter = TokenBucketLimiter(
+    os.getenv("RATE_LIMIT_DB") or os.path.join(BASE_DIR, "ratelimit.sqlite3"),
+    key_func=lambda: request.remote_addr or "127.0.0.1",
+)
+limiter.init_app(app)
+# JSON 由 orjson 序列化，可按 Accept 返回 MessagePack，较大的响应按 Accept-Encoding 使用 zstd/gzip 压缩
+ResponseCodec().init_app(app)
+# 设置 PROFILE=1 时采样剖析每个请求（见 profiling.py）
+profiling.init_app(app)
+
 # 构建 Excel 文件路径（保存到 exe 同级目录）
 EXCEL_FILE_PATH = os.path.join(BASE_DIR, "记录.xlsx")
 
-# 认证配置
+# 后台任务登记；日程存储按 HTTPBasicAuth 用户分区，见 get_store_registry()
+job_registry = JobRegistry()
+# 日程优化一次要等待LLM数十秒，由固定数量的工作线程在后台执行，请求线程只负责提交和查询
+optimize_queue = JobQueue(
+    job_registry,
+    workers=int(os.getenv("OPTIMIZE_WORKERS", 2)),
+    max_depth=int(os.getenv("OPTIMIZE_QUEUE_DEPTH", 20)),
+    max_per_owner=int(os.getenv("OPTIMIZE_QUEUE_PER_USER", 3)),
+)
+# 导入任务同样由固定数量的工作线程执行：同时解析合并的文件数有上限，排队过多时返回429
+import_queue = JobQueue(
+    job_registry,
+    workers=int(os.getenv("IMPORT_WORKERS", 2)),
+    max_depth=int(os.getenv("IMPORT_QUEUE_DEPTH", 10)),
+    max_per_owner=int(os.getenv("IMPORT_QUEUE_PER_USER", 2)),
+    expected_seconds=5.0,
+)
+
+# 认证配置：API_USERNAME/API_PASSWORD 与账号文件中的用户（见 api_users.py），日程按登录的用户分区
 @auth.verify_password
 def verify_password(username, password):
-    return username == os.getenv("API_USERNAME", "admin") and \
-           password == os.getenv("API_PASSWORD", "password")
+    return verify_credentials(username, password)
 
 class ModelIntegrator:
-    def __init__(self, api_key, base_url="https://api.siliconflow.cn/v1"):
-        self.client = OpenAI(
-            api_key=api_key,
-            base_url=base_url
-        )
+    def __init__(self, api_key, base_url=None):
+        self.api_key = api_key
+        # 可通过 LLM_BASE_URL 指向其他兼容OpenAI的服务（如本地桩服务 llm_stub.py）
+        self.base_url = base_url or os.getenv("LLM_BASE_URL", "https://api.siliconflow.cn/v1")
+        self._client = None
 
-    def chat(self, messages, model="deepseek-ai/DeepSeek-V3", temperature=0.7, top_p=1.0, max_tokens=3000):
+    @property
+    def client(self):
+        """首次调用时才导入openai并创建客户端，避免拖慢启动"""
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url
+            )
+        return self._client
+
+    def chat_completion(self, messages, model="deepseek-ai/DeepSeek-V3", temperature=0.7, top_p=1.0, max_tokens=None):
+        """非流式调用，返回 (内容, 结束原因)；max_tokens 为空时按提示词长度选择，并记录token用量"""
+        prompt_text = "\n".join(message["content"] for message in messages)
+        if max_tokens is None:
+            max_tokens = choose_max_tokens(prompt_text, model)
+        started = time.perf_counter()
         response = self.client.chat.completions.create(
             model=model,
             messages=messages,
@@ -62,47 +117,76 @@ class ModelIntegrator:
             max_tokens=max_tokens,
             stream=False
         )
+        choice = response.choices[0]
+        usage_recorder.record(model, prompt_text, max_tokens, getattr(response, "usage", None),
+                              choice.finish_reason, time.perf_counter() - started)
+        return choice.message.content, choice.finish_reason
+
+    def chat(self, messages, model="deepseek-ai/DeepSeek-V3", temperature=0.7, top_p=1.0, max_tokens=None):
         # 返回完整内容
-        return response.choices[0].message.content
+        return self.chat_completion(messages, model, temperature, top_p, max_tokens)[0]
 
-    def chat_stream(self, messages, model="deepseek-ai/DeepSeek-V3", temperature=0.7, top_p=1.0, max_tokens=3000):
+    def chat_stream(self, messages, model="deepseek-ai/DeepSeek-V3", temperature=0.7, top_p=1.0, max_tokens=None):
+        if max_tokens is None:
+            max_tokens = choose_max_tokens("\n".join(message["content"] for message in messages), model)
         return self.client.chat.completions.create(
             model=model,
             messages=messages,
             temperature=temperature,
             top_p=top_p,
             max_tokens=max_tokens,
-            stream=True
+            stream=True,
+            # 最后一个分块带上token用量，流式调用也能记录实际用量
+            stream_options={"include_usage": True}
         )
 
 class LLMAPI:
     def __init__(self, api_key, model="deepseek-ai/DeepSeek-V3"):
         self.integrator = ModelIntegrator(api_key)
         self.model = model
+        # 配置了备用模型/服务时启用对冲请求，见 hedging.py
+        self.hedger = build_hedger(self.integrator, model, ModelIntegrator)
 
-    def generate_response(self, prompt, temperature=0.7, top_p=1.0, max_tokens=3000):  
-        try:
-            print(f"调用LLM API - 模型: {self.model}, 温度: {temperature}, top_p: {top_p}, max_tokens: {max_tokens}")
-            print(f"LLM输入内容: {prompt[:]}...")  # 只打印前500个字符
-            
-            response = self.integrator.chat(
-                messages=[{"role": "user", "content": prompt}],
+    def complete(self, prompt, temperature=0.7, top_p=1.0, max_tokens=None, expected_output_tokens=None, validate=None):
+        """返回 (内容, 结束原因)，结束原因为 "length" 表示输出被 max_tokens 截断
+
+        max_tokens 为空时根据提示词长度和预计输出 expected_output_tokens 选择。
+        启用对冲时 validate(内容) 用于判断哪一路的结果有效。
+        """
+        if max_tokens is None:
+            max_tokens = choose_max_tokens(prompt, self.model, expected_output_tokens)
+        print(f"调用LLM API - 模型: {self.model}, 温度: {temperature}, top_p: {top_p}, max_tokens: {max_tokens}")
+        print(f"LLM输入内容: {prompt[:]}...")  # 只打印前500个字符
+
+        messages = [{"role": "user", "content": prompt}]
+        if self.hedger is not None:
+            response, finish_reason = self.hedger.complete(messages, temperature, top_p, max_tokens, validate)
+        else:
+            response, finish_reason = self.integrator.chat_completion(
+                messages=messages,
                 model=self.model,
                 temperature=temperature,
                 top_p=top_p,
                 max_tokens=max_tokens
             )
-            
-            print(f"LLM返回内容: {response[:]}...")  # 只打印前500个字符
-            return response
+
+        print(f"LLM返回内容: {response[:]}...")  # 只打印前500个字符
+        return response, finish_reason
+
+    def generate_response(self, prompt, temperature=0.7, top_p=1.0, max_tokens=None, expected_output_tokens=None):
+        try:
+            return self.complete(prompt, temperature, top_p, max_tokens, expected_output_tokens)[0]
         except Exception as e:
             return f"生成响应时发生错误: {str(e)}"
 
-    def generate_response_stream(self, prompt, temperature=0.7, top_p=1.0, max_tokens=512):
+    def generate_response_stream(self, prompt, temperature=0.7, top_p=1.0, max_tokens=None):
         try:
+            if max_tokens is None:
+                max_tokens = choose_max_tokens(prompt, self.model)
             print(f"调用LLM流式API - 模型: {self.model}, 温度: {temperature}, top_p: {top_p}, max_tokens: {max_tokens}")
             print(f"LLM输入内容: {prompt[:]}...")
             
+            started = time.perf_counter()
             gen = self.integrator.chat_stream(
                 messages=[{"role": "user", "content": prompt}],
                 model=self.model,
@@ -111,12 +195,16 @@ class LLMAPI:
                 max_tokens=max_tokens
             )
             
+            usage = finish_reason = None
             for chunk in gen:
                 # 打印流式返回的内容
                 if hasattr(chunk, 'choices') and chunk.choices and hasattr(chunk.choices[0], 'delta'):
                     content = chunk.choices[0].delta.content or ""
                     print(f"LLM流式返回内容: {content[:]}...")  # 只打印前100个字符
+                    finish_reason = chunk.choices[0].finish_reason or finish_reason
+                usage = getattr(chunk, "usage", None) or usage
                 yield chunk
+            usage_recorder.record(self.model, prompt, max_tokens, usage, finish_reason, time.perf_counter() - started)
         except Exception as e:
             yield f"生成响应时发生错误: {str(e)}"
 
@@ -132,11 +220,7 @@ def get_next_week_id():
 def parse_excel_date(date_str):
     """将Excel中的日期字符串解析为标准日期格式"""
     try:
-        # 处理pandas日期类型
-        if isinstance(date_str, pd.Timestamp):
-            return date_str.strftime('%Y-%m-%d')
-        
-        # 处理datetime对象
+        # 处理datetime对象（pandas.Timestamp 是 datetime 的子类）
         if isinstance(date_str, datetime):
             return date_str.strftime('%Y-%m-%d')
         
@@ -180,6 +264,8 @@ def parse_excel_date(date_str):
     
 def parse_excel_schedule(file_path):
     """使用与caption.py相同的方法解析Excel文件"""
+    import pandas as pd
+
     try:
         df = pd.read_excel(file_path, dtype=str)
         print(f"成功读取Excel文件，共{len(df)}行数据")
@@ -299,6 +385,8 @@ def parse_excel_schedule(file_path):
 
 def parse_excel_feedback(file_path):
     """解析反馈Excel文件"""
+    import pandas as pd
+
     try:
         df = pd.read_excel(file_path, dtype=str)
         print(f"成功读取反馈Excel文件，共{len(df)}行数据")
@@ -346,38 +434,32 @@ def parse_excel_feedback(file_path):
         print(f"解析反馈Excel出错: {str(e)}")
         print(traceback.format_exc())
         return None, f"解析反馈Excel出错: {str(e)}"
-def save_schedule_to_excel(schedule_data, file_path=EXCEL_FILE_PATH):
-    """将日程数据保存到Excel文件（使用caption.py相同的格式）"""
+def save_schedule_to_excel(schedule_data, store=None, versions=None):
+    """将日程数据按天写入日程存储并保存到Excel（使用caption.py相同的格式）
+
+    只替换 schedule_data 中出现的日期，其余日期保持不变，不会覆盖界面或其他请求对别的日期的修改。
+    versions 为读取时各天的版本号，其中的日期已被其他写入者修改时不写入并抛出 ConflictError。
+    """
+    store = store or get_store_registry().get()
     try:
-        # 创建数据框
-        rows = []
-        for date, day_data in schedule_data.items():
-            for activity in day_data.get("activities", []):
-                rows.append({
-                    "日期": date,
-                    "时间": activity.get("time", "00:00"),
-                    "任务": activity.get("type", ""),
-                    "完成度": activity.get("completion", "待评价")
-                })
-        
-        df = pd.DataFrame(rows)
-        
-        # 确保列顺序正确
-        if not df.empty:
-            df = df[["日期", "时间", "任务", "完成度"]]
-        
-        # 写入Excel
-        with pd.ExcelWriter(file_path, engine='openpyxl', mode='w') as writer:
-            df.to_excel(writer, sheet_name='Schedule', index=False)
-        
-        print(f"成功将日程写入Excel: {file_path}")
+        changes = {date: [{"time": activity.get("time", "00:00"), "task": activity.get("type", ""),
+                           "completion": activity.get("completion", "待评价")}
+                          for activity in day_data.get("activities", [])]
+                   for date, day_data in schedule_data.items()}
+        store.commit(changes, source="api", expected=versions)
+        store.save()
+        print(f"成功将日程写入Excel: {store.file_path}")
         return True, None
+    except ConflictError:
+        raise
     except Exception as e:
         print(f"写入Excel时出错: {str(e)}")
         return False, str(e)
 
 def validate_excel_export(schedule_data, file_path):
     """验证Excel导出是否正确"""
+    import pandas as pd
+
     try:
         # 读取刚刚导出的Excel文件
         df = pd.read_excel(file_path, dtype=str)
@@ -507,7 +589,374 @@ def time_to_minutes(time_str):
             return 0
     except:
         return 0
-    
+
+# ========== API 路由 ==========
+def get_date_range_args():
+    """读取请求中的 start/end 日期参数（YYYY-MM-DD），格式错误时抛出 ValueError"""
+    start = request.args.get("start") or None
+    end = request.args.get("end") or None
+    for value in (start, end):
+        if value:
+            datetime.strptime(value, "%Y-%m-%d")
+    return start, end
+
+def get_clock_arg(name, default):
+    """读取 HH:MM 格式的时间参数并转换为分钟数，格式错误时抛出 ValueError"""
+    value = request.args.get(name)
+    if not value:
+        return default
+    time_range = parse_time_range(value)
+    if time_range is None:
+        raise ValueError(f"无效的时间: {value}")
+    return time_range[0]
+
+@app.route('/api/schedule', methods=['GET'])
+@auth.login_required
+def get_schedule():
+    """读取当前用户的日程，直接引用当前版本快照，不会阻塞GUI或其他写入者"""
+    try:
+        start, end = get_date_range_args()
+    except ValueError:
+        return jsonify({"error": "日期格式应为YYYY-MM-DD"}), 400
+    snapshot = get_store_registry().get(auth.current_user()).snapshot()
+    dates = [date for date, _ in snapshot.iter_days(start, end)]
+    return jsonify({"version": snapshot.version, "events": snapshot.to_dict(dates),
+                    "day_versions": snapshot.versions_for(dates)})
+
+def conflict_response(error):
+    """409 响应：冲突日期的期望版本、当前版本和当前内容"""
+    conflicts = {date: {"expected": expected, "version": version,
+                        "events": [dict(event) for event in error.snapshot.get(date)]}
+                 for date, (expected, version) in error.conflicts.items()}
+    return jsonify({"error": str(error), "conflicts": conflicts}), 409
+
+@app.route('/api/schedule', methods=['PUT'])
+@auth.login_required
+def put_schedule():
+    """按天替换当前用户的日程（比较并交换）
+
+    events 为 {日期: [{"time", "task", "completion"}, ...]}，空列表删除该天；
+    versions 为读取时各天的版本号（GET /api/schedule 返回的 day_versions，没有事件的日期为0），每个写入的日期都必须提供。
+    任何一天已被其他写入者修改时整组不写入，返回 409 和这些日期的当前版本与内容，客户端合并后重新提交；
+    修改不同日期的写入互不影响。
+    """
+    payload = request.get_json(silent=True) or {}
+    events, versions = payload.get("events"), payload.get("versions") or {}
+    if not isinstance(events, dict) or not isinstance(versions, dict):
+        return jsonify({"error": "events 和 versions 应为以日期为键的对象"}), 400
+    changes = {}
+    try:
+        for date, day_events in events.items():
+            datetime.strptime(date, "%Y-%m-%d")
+            changes[date] = [{"time": normalize_time(str(event.get("time", ""))) or "全天",
+                              "task": str(event["task"]).strip(),
+                              "completion": event.get("completion") or "待评价"}
+                             for event in day_events or []]
+        expected = {date: int(versions[date]) for date in changes if date in versions}
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return jsonify({"error": "日期格式应为YYYY-MM-DD，事件需包含 task，版本号应为整数"}), 400
+    missing = sorted(set(changes) - set(expected))
+    if missing:
+        return jsonify({"error": "缺少以下日期的版本号", "dates": missing}), 428
+
+    store = get_store_registry().get(auth.current_user())
+    try:
+        snapshot = store.commit(changes, source="api", expected=expected)
+    except ConflictError as e:
+        return conflict_response(e)
+    store.save()
+    return jsonify({"version": snapshot.version, "day_versions": snapshot.versions_for(changes)})
+
+@app.route('/api/changes', methods=['GET'])
+@limiter.limit("poll")
+@auth.login_required
+def get_changes():
+    """长轮询变更流：返回 since 版本之后发生变化的日期，没有变化时最多等待 timeout 秒"""
+    try:
+        since = int(request.args.get("since", 0))
+        timeout = min(float(request.args.get("timeout", 25)), 60)
+    except ValueError:
+        return jsonify({"error": "since/timeout 参数无效"}), 400
+    store = get_store_registry().get(auth.current_user())
+    changes = store.wait_for_changes(since, timeout=timeout) if timeout > 0 else store.changes_since(since)
+    if changes is None:
+        # 变更记录已被丢弃，客户端需要通过 /api/schedule 整体刷新
+        return jsonify({"version": store.snapshot().version, "reset": True})
+    version = changes[-1][0] if changes else since
+    dates = sorted(set().union(*(entry[1] for entry in changes)))
+    return jsonify({"version": version, "reset": False, "dates": dates})
+
+@app.route('/api/export.ics', methods=['GET'])
+@auth.login_required
+def export_ics():
+    """以分块响应流式导出 iCalendar，start/end 为可选的日期范围"""
+    try:
+        start, end = get_date_range_args()
+    except ValueError:
+        return jsonify({"error": "日期格式应为YYYY-MM-DD"}), 400
+    snapshot = get_store_registry().get(auth.current_user()).snapshot()
+    response = Response(stream_with_context(iter_ics(snapshot, start, end)), mimetype="text/calendar")
+    response.headers["Content-Disposition"] = "attachment; filename=schedule.ics"
+    return response
+
+@app.route('/api/export', methods=['GET'])
+@auth.login_required
+def export_data():
+    """分块下载日程数据：format=csv|parquet，可按日期范围和完成度（逗号分隔）过滤"""
+    try:
+        start, end = get_date_range_args()
+    except ValueError:
+        return jsonify({"error": "日期格式应为YYYY-MM-DD"}), 400
+    export_format = request.args.get("format", "csv").lower()
+    if export_format not in ("csv", "parquet"):
+        return jsonify({"error": "format 只支持 csv 或 parquet"}), 400
+    if export_format == "parquet" and importlib.util.find_spec("pyarrow") is None:
+        return jsonify({"error": "服务器未安装 pyarrow，无法导出Parquet"}), 501
+
+    snapshot = get_store_registry().get(auth.current_user()).snapshot()
+    records = iter_event_records(snapshot, start, end, parse_completions(request.args.get("completion")))
+    if export_format == "parquet":
+        response = Response(stream_with_context(iter_parquet(records)), mimetype="application/vnd.apache.parquet")
+    else:
+        response = Response(stream_with_context(iter_csv(records)), mimetype="text/csv")
+    response.headers["Content-Disposition"] = f"attachment; filename=schedule.{export_format}"
+    return response
+
+@app.route('/api/analytics', methods=['GET'])
+@auth.login_required
+def get_analytics():
+    """统计汇总：period=day|week|month|weekday，返回各周期的完成度分布、完成率、已安排分钟数和平均评分"""
+    try:
+        start, end = get_date_range_args()
+    except ValueError:
+        return jsonify({"error": "日期格式应为YYYY-MM-DD"}), 400
+    period = request.args.get("period", "month")
+    if period not in PERIODS:
+        return jsonify({"error": f"period 只支持 {', '.join(PERIODS)}"}), 400
+    store = get_store_registry().get(auth.current_user())
+    rollups = get_rollups(store)
+    return jsonify({"version": store.snapshot().version, "period": period,
+                    "rows": rollups.summary(period, start, end)})
+
+@app.route('/api/search', methods=['GET'])
+@auth.login_required
+def search_events():
+    """按任务名全文搜索：q 为关键词，可按日期范围和完成度（逗号分隔）过滤，order=asc|desc，limit 最多1000"""
+    query = (request.args.get("q") or "").strip()
+    if not query:
+        return jsonify({"error": "缺少搜索关键词 q"}), 400
+    try:
+        start, end = get_date_range_args()
+        limit = min(max(int(request.args.get("limit", 100)), 1), 1000)
+    except ValueError:
+        return jsonify({"error": "日期格式应为YYYY-MM-DD，limit 应为整数"}), 400
+    store = get_store_registry().get(auth.current_user())
+    total, hits = get_search_index(store).search(
+        query, limit, start, end, parse_completions(request.args.get("completion")),
+        newest_first=request.args.get("order") == "desc")
+    return jsonify({"version": store.snapshot().version, "query": query, "total": total, "hits": hits})
+
+# /api/free-slots 一次最多合并的其他用户数
+MAX_FREE_BUSY_USERS = 10
+
+@app.route('/api/free-slots', methods=['GET'])
+@auth.login_required
+def get_free_slots():
+    """查找空闲时段：duration 分钟以上，users（逗号分隔）的日程都空闲，按时间顺序返回前 limit 个
+
+    start/end 默认为今天起7天，day_start/day_end 为每天的时间范围（默认 09:00-18:00），日期范围最多366天。
+    """
+    try:
+        duration = int(request.args.get("duration", 60))
+        limit = min(max(int(request.args.get("limit", 10)), 1), 200)
+        start, end = get_date_range_args()
+        day_start = get_clock_arg("day_start", DEFAULT_DAY_START)
+        day_end = get_clock_arg("day_end", DEFAULT_DAY_END)
+    except ValueError:
+        return jsonify({"error": "duration/limit 应为整数，日期格式应为YYYY-MM-DD，时间格式应为HH:MM"}), 400
+    start = start or datetime.now().strftime("%Y-%m-%d")
+    end = end or (datetime.strptime(start, "%Y-%m-%d") + timedelta(days=6)).strftime("%Y-%m-%d")
+    span = (datetime.strptime(end, "%Y-%m-%d") - datetime.strptime(start, "%Y-%m-%d")).days
+    if duration <= 0 or day_end <= day_start or span < 0 or span > 365:
+        return jsonify({"error": "duration 应为正数，day_end 应晚于 day_start，日期范围应在366天以内"}), 400
+
+    users = [name.strip() for name in (request.args.get("users") or "").split(",") if name.strip()]
+    users = list(dict.fromkeys([auth.current_user()] + users))
+    if len(users) > MAX_FREE_BUSY_USERS + 1:
+        return jsonify({"error": f"users 最多 {MAX_FREE_BUSY_USERS} 个"}), 400
+    # 只查询可以登录的账号，不为未知用户名创建存储；返回内容只有空闲时段，不含任务
+    unknown = [user for user in users[1:] if not is_known_user(user)]
+    if unknown:
+        return jsonify({"error": "以下用户不存在", "users": unknown}), 404
+    registry = get_store_registry()
+    stores = [registry.get(user) for user in users]
+    sources = [get_busy_index(store).busy for store in stores]
+    slots = find_free_slots(sources, iter_dates(start, end), duration, day_start, day_end, limit)
+    return jsonify({"users": users, "start": start, "end": end, "duration": duration, "slots": slots})
+
+@app.route('/api/debug/memory', methods=['GET'])
+@auth.login_required
+def debug_memory():
+    """按需的内存快照（需设置 PROFILE=1）：第一次请求开始跟踪，之后返回自上次以来增长最多的分配位置"""
+    if not profiling.enabled():
+        return jsonify({"error": "未启用剖析，请设置 PROFILE=1 后重启"}), 404
+    try:
+        limit = min(max(int(request.args.get("limit", 20)), 1), 200)
+    except ValueError:
+        return jsonify({"error": "limit 应为整数"}), 400
+    return jsonify(profiling.memory_snapshot(limit))
+
+@app.route('/api/llm/usage', methods=['GET'])
+@auth.login_required
+def get_llm_usage():
+    """本进程LLM调用的token用量统计、最近的调用记录和对冲统计"""
+    summary = usage_recorder.summary()
+    summary["hedging"] = hedging_summary()
+    return jsonify(summary)
+
+def queue_full_response(error):
+    """任务队列已满：429 和建议的重试等待秒数"""
+    response = jsonify({"error": str(error), "retry_after": error.retry_after})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response
+
+@app.route('/api/import', methods=['POST'])
+@auth.login_required
+def import_schedule():
+    """批量导入xlsx/CSV/ics日程：上传流写入临时文件后在后台分批解析合并"""
+    too_large = f"文件超过大小限制 {MAX_FILE_SIZE // (1024 * 1024)}MB"
+    # 在读取请求体（解析表单）之前检查声明的长度和导入队列
+    if request.content_length and request.content_length > MAX_FILE_SIZE + UPLOAD_OVERHEAD:
+        return jsonify({"error": too_large}), 413
+    try:
+        import_queue.check_room(auth.current_user())
+    except QueueFull as e:
+        return queue_full_response(e)
+    try:
+        upload = request.files.get("file") if request.mimetype == "multipart/form-data" else None
+        if upload is not None:
+            stream, filename, content_type = upload.stream, upload.filename, upload.mimetype
+        else:
+            # 也支持直接把文件作为请求体上传，文件名通过参数或请求头传入
+            stream = request.stream
+            filename = request.args.get("filename") or request.headers.get("X-Filename")
+            content_type = request.mimetype
+
+        suffix = detect_suffix(filename, content_type)
+        if not suffix:
+            return jsonify({"error": "仅支持导入 .xlsx、.csv 或 .ics 文件"}), 400
+        spool_path, size = spool_upload(stream, MAX_FILE_SIZE, suffix)
+    except (UploadTooLarge, RequestEntityTooLarge):
+        return jsonify({"error": too_large}), 413
+
+    try:
+        job = import_queue.submit("import", auth.current_user(), run_import, spool_path,
+                                  get_store_registry().get(auth.current_user()))
+    except QueueFull as e:
+        # 接收上传期间队列被占满
+        os.remove(spool_path)
+        return queue_full_response(e)
+    job.update(filename=filename, bytes_received=size)
+    return jsonify({"job_id": job.id, "status_url": f"/api/import/{job.id}",
+                    "queue_position": import_queue.position(job)}), 202
+
+@app.route('/api/import/<job_id>', methods=['GET'])
+@auth.login_required
+def import_status(job_id):
+    """查询导入任务进度"""
+    job = job_registry.get(job_id)
+    if job is None or job.kind != "import" or job.owner != auth.current_user():
+        return jsonify({"error": "任务不存在"}), 404
+    return jsonify(job.to_dict())
+
+_llm_api = None
+
+def get_llm_api():
+    """首次使用时才创建LLMAPI，未配置 DEEPSEEK_API_KEY 时返回 None"""
+    global _llm_api
+    if _llm_api is None and os.getenv("DEEPSEEK_API_KEY"):
+        _llm_api = LLMAPI(os.getenv("DEEPSEEK_API_KEY"))
+    return _llm_api
+
+def run_optimize(job, store, llm_api, week_events, expected=None):
+    """优化任务：调用LLM优化一周日程并写回存储
+
+    等待LLM期间被其他来源修改的日期不会被覆盖：只写入其余日期，
+    冲突日期的当前内容和优化结果放在 conflicts 中返回，由客户端合并后通过 PUT /api/schedule 提交。
+    """
+    job.update(stage="optimizing", dates=sorted(week_events))
+    try:
+        optimized, shared = optimize_and_apply(store, llm_api, week_events, source="api", expected=expected)
+    except ConflictError as e:
+        applied = {date: day_events for date, day_events in e.changes.items() if date not in e.conflicts}
+        snapshot = store.commit(applied, source="api", expected=e.snapshot.versions_for(applied))
+        store.save()
+        conflicts = {date: {"version": e.snapshot.day_version(date),
+                            "events": [dict(event) for event in e.snapshot.get(date)],
+                            "proposed": e.changes.get(date) or []}
+                     for date in e.conflicts}
+        return {"version": snapshot.version, "shared": False, "events": applied, "conflicts": conflicts}
+    if not optimized:
+        raise RuntimeError("LLM优化失败，日程未修改")
+    return {"version": store.snapshot().version, "shared": shared, "events": optimized, "conflicts": {}}
+
+@app.route('/api/optimize', methods=['POST'])
+@limiter.limit("llm")
+@auth.login_required
+def submit_optimize():
+    """提交日程优化任务，立即返回任务ID；start 为要优化的那一周中任意一天（默认下周），priority=high|normal|low"""
+    payload = request.get_json(silent=True) or {}
+    start = payload.get("start") or request.args.get("start")
+    priority = payload.get("priority") or request.args.get("priority", "normal")
+    if priority not in PRIORITIES:
+        return jsonify({"error": f"priority 只支持 {', '.join(PRIORITIES)}"}), 400
+    try:
+        day = datetime.strptime(start, "%Y-%m-%d").date() if start else None
+    except ValueError:
+        return jsonify({"error": "日期格式应为YYYY-MM-DD"}), 400
+    monday = day - timedelta(days=day.weekday()) if day else next_week_range()[0]
+
+    llm_api = get_llm_api()
+    if llm_api is None:
+        return jsonify({"error": "服务器未配置 DEEPSEEK_API_KEY"}), 503
+    store = get_store_registry().get(auth.current_user())
+    snapshot = store.snapshot()
+    week_events = collect_week(snapshot, monday)
+    try:
+        job = optimize_queue.submit("optimize", auth.current_user(), run_optimize, store, llm_api, week_events,
+                                    snapshot.versions_for(week_events), priority=PRIORITIES[priority])
+    except QueueFull as e:
+        return queue_full_response(e)
+    return jsonify({"job_id": job.id, "status_url": f"/api/optimize/{job.id}",
+                    "queue_position": optimize_queue.position(job),
+                    "estimated_wait": optimize_queue.estimated_wait(job)}), 202
+
+@app.route('/api/optimize/<job_id>', methods=['GET'])
+@limiter.limit("poll")
+@auth.login_required
+def optimize_status(job_id):
+    """查询优化任务；任务未结束时最多等待 timeout 秒（长轮询），结束后立即返回结果"""
+    job = job_registry.get(job_id)
+    if job is None or job.kind != "optimize" or job.owner != auth.current_user():
+        return jsonify({"error": "任务不存在"}), 404
+    try:
+        timeout = min(float(request.args.get("timeout", 25)), 60)
+    except ValueError:
+        return jsonify({"error": "timeout 参数无效"}), 400
+    if timeout > 0:
+        job.wait(timeout)
+    status = job.to_dict()
+    status["queue_position"] = optimize_queue.position(job)
+    status["estimated_wait"] = optimize_queue.estimated_wait(job)
+    return jsonify(status)
+
+@app.route('/api/optimize/queue', methods=['GET'])
+@auth.login_required
+def optimize_queue_summary():
+    """优化任务队列的排队、执行和拒绝统计"""
+    return jsonify(optimize_queue.summary())
+
 if __name__ == '__main__':
     # 验证必要的环境变量
     required_env_vars = ["DEEPSEEK_API_KEY", "API_USERNAME", "API_PASSWORD"]
@@ -0,0 +1,161 @@
+"""空闲时段查询：每天的忙碌区间按开始时间排序保存，多份日程用 k 路归并合并
+
+单个存储的忙碌区间由 BusyIndex 随每次提交增量维护（只重算变化的日期），
+查询多个用户共同的空闲时间时，把各自当天已排序的区间用 heapq.merge 归并，
+一遍扫描即可得到合并后的忙碌区间和其间的空档。
+"取消" 的事件和 "全天" 等没有具体时间的事件不占用时间。
+"""
+import heapq
+import threading
+from datetime import datetime, timedelta
+from schedule_store import parse_time_range, format_minutes
+
+# 默认的工作时间范围（分钟）
+DEFAULT_DAY_START = 9 * 60
+DEFAULT_DAY_END = 18 * 60
+DEFAULT_LIMIT = 10
+# 不占用时间的完成度
+FREE_STATES = ("取消",)
+
+
+def busy_intervals(day_events):
+    """一天事件的忙碌区间，按开始时间排序并合并重叠部分，返回 ((开始分钟, 结束分钟), ...)"""
+    ranges = []
+    for event in day_events:
+        if event.get("completion") in FREE_STATES:
+            continue
+        time_range = parse_time_range(str(event.get("time", "")))
+        if time_range is not None and time_range[1] > time_range[0]:
+            ranges.append(time_range)
+    ranges.sort()
+    return tuple(coalesce(ranges))
+
+
+def coalesce(sorted_ranges):
+    """合并已按开始时间排序的区间中重叠或相接的部分"""
+    current = None
+    for start, end in sorted_ranges:
+        if current is None:
+            current = [start, end]
+        elif start <= current[1]:
+            current[1] = max(current[1], end)
+        else:
+            yield tuple(current)
+            current = [start, end]
+    if current is not None:
+        yield tuple(current)
+
+
+def merge_busy(interval_lists):
+    """k 路归并多份已排序的忙碌区间并合并重叠部分"""
+    if len(interval_lists) == 1:
+        return list(interval_lists[0])
+    return list(coalesce(heapq.merge(*interval_lists)))
+
+
+def gaps(busy, day_start=DEFAULT_DAY_START, day_end=DEFAULT_DAY_END, min_minutes=1):
+    """[day_start, day_end) 内不与 busy 重叠且不短于 min_minutes 的空档"""
+    cursor = day_start
+    for start, end in busy:
+        if end <= cursor:
+            continue
+        if start >= day_end:
+            break
+        if start - cursor >= min_minutes:
+            yield cursor, start
+        cursor = max(cursor, end)
+    if day_end - cursor >= min_minutes:
+        yield cursor, day_end
+
+
+def iter_dates(start, end):
+    """start 到 end（含）的每个日期字符串"""
+    day = datetime.strptime(start, "%Y-%m-%d")
+    last = datetime.strptime(end, "%Y-%m-%d")
+    while day <= last:
+        yield day.strftime("%Y-%m-%d")
+        day += timedelta(days=1)
+
+
+def find_free_slots(busy_sources, dates, duration, day_start=DEFAULT_DAY_START, day_end=DEFAULT_DAY_END,
+                    limit=DEFAULT_LIMIT, weekdays=None):
+    """按时间顺序返回所有日程都空闲、且不短于 duration 分钟的前 limit 个时段
+
+    busy_sources 为若干个 日期 -> 忙碌区间 的函数（如 BusyIndex.busy），
+    weekdays 为可选的星期集合（0=周一 ... 6=周日）。
+    返回 [{"date", "start", "end", "minutes"}, ...]
+    """
+    slots = []
+    for date_str in dates:
+        if weekdays is not None and datetime.strptime(date_str, "%Y-%m-%d").weekday() not in weekdays:
+            continue
+        busy = merge_busy([source(date_str) for source in busy_sources])
+        for start, end in gaps(busy, day_start, day_end, duration):
+            slots.append({"date": date_str, "start": format_minutes(start), "end": format_minutes(end),
+                          "minutes": end - start})
+            if len(slots) >= limit:
+                return slots
+    return slots
+
+
+class DayBusy:
+    """{日期: [事件]} 上的忙碌区间（不随存储更新，用于优化结果等临时数据）"""
+
+    def __init__(self, events):
+        self._busy = {date_str: list(busy_intervals(day_events)) for date_str, day_events in events.items()}
+
+    def busy(self, date_str):
+        return self._busy.get(date_str, ())
+
+    def reserve(self, date_str, start, end):
+        """把新放入的事件加入忙碌区间"""
+        merged = self._busy.get(date_str, [])
+        merged.append((start, end))
+        merged.sort()
+        self._busy[date_str] = list(coalesce(merged))
+
+
+class BusyIndex:
+    """单个日程存储每天的忙碌区间，通过 ScheduleStore.subscribe() 增量维护"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._busy = {}  # 日期 -> 已排序合并的忙碌区间元组
+
+    def rebuild(self, snapshot):
+        with self._lock:
+            self._busy = {}
+            # 只读取工作簿层：归档层都是早于期限且已经结束的日期，不影响空闲时段的查询
+            for date_str, day_events in snapshot.days.items():
+                busy = busy_intervals(day_events)
+                if busy:
+                    self._busy[date_str] = busy
+
+    def on_commit(self, previous, snapshot, changed_dates):
+        """存储监听器：只重算变化的日期"""
+        with self._lock:
+            for date_str in changed_dates:
+                busy = busy_intervals(snapshot.get(date_str))
+                if busy:
+                    self._busy[date_str] = busy
+                else:
+                    self._busy.pop(date_str, None)
+
+    def busy(self, date_str):
+        # 区间元组不可变，读取时不需要复制
+        return self._busy.get(date_str, ())
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_busy_index(store):
+    """获取存储对应的忙碌区间索引（首次调用时建立并订阅存储的变更）"""
+    with _indexes_lock:
+        index = _indexes.get(store.file_path)
+        if index is None:
+            index = BusyIndex()
+            store.subscribe(index.on_commit, initialize=index.rebuild)
+            _indexes[store.file_path] = index
+        return index
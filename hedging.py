@@ -0,0 +1,290 @@
+"""对冲LLM请求：主模型迟迟没有输出首个token时，向备用模型/服务发出同样的请求
+
+两路请求都以流式方式发送，先返回有效结果的一方获胜，另一方被取消（关闭其响应流）。
+两路的token用量都会记录：服务端在流的最后返回用量，被取消的一方按已收到的输出估算。
+主请求在首个token前就失败时立即改用备用请求。
+对冲延迟可以是固定秒数（如 "2.5"），也可以是主请求首token延迟的分位数（如 "p90"），
+样本不足时使用 DEFAULT_HEDGE_DELAY。对冲率和胜负统计用于调整延迟。
+环境变量:
+  LLM_HEDGE_MODEL     备用模型（默认与主模型相同）
+  LLM_HEDGE_BASE_URL  备用服务地址（默认与主服务相同）
+  LLM_HEDGE_API_KEY   备用服务密钥（默认与主服务相同）
+  LLM_HEDGE_DELAY     对冲延迟，默认 p90
+设置了 LLM_HEDGE_MODEL 或 LLM_HEDGE_BASE_URL 时启用。
+"""
+import os
+import queue
+import threading
+import time
+from collections import deque
+from types import SimpleNamespace
+from token_budget import usage_recorder, estimate_tokens, raw_estimate
+
+DEFAULT_HEDGE_DELAY = 3.0
+# 使用分位数前至少需要的首token延迟样本数
+HEDGE_MIN_SAMPLES = 20
+FIRST_TOKEN_HISTORY = 200
+
+
+def parse_hedge_delay(value):
+    """解析对冲延迟配置，返回 ("percentile", 0.9) 或 ("fixed", 2.5)"""
+    value = (value or "p90").strip().lower()
+    if value.startswith("p"):
+        return "percentile", min(0.999, float(value[1:]) / 100)
+    return "fixed", float(value)
+
+
+class _Attempt:
+    """一路流式请求，在单独的线程中读取响应
+
+    on_first_token(延迟) 在收到首个token时于读取线程中调用；token 用量（服务端返回的，
+    或被取消时按已收到的输出估算的）在请求结束时记录，落败的一方同样计入。
+    """
+
+    def __init__(self, name, integrator, model, on_first_token=None):
+        self.name = name
+        self.integrator = integrator
+        self.model = model
+        self.on_first_token = on_first_token
+        self.first_token = threading.Event()
+        # 收到首个token或请求结束时设置
+        self.progress = threading.Event()
+        self.cancelled = threading.Event()
+        self.first_token_latency = None
+        self.started = None
+        self.error = None
+        self.thread = None
+        # 正在读取的响应流，cancel() 时从其他线程关闭
+        self._stream = None
+        self._stream_lock = threading.Lock()
+        # 首token延迟（或被取消时的截尾值）只上报一次
+        self._latency_reported = False
+
+    def start(self, messages, params, results):
+        self.started = time.perf_counter()
+        self.thread = threading.Thread(target=self._run, args=(messages, params, results),
+                                       name=f"llm-hedge-{self.name}", daemon=True)
+        self.thread.start()
+        return self
+
+    def _report_latency(self, latency):
+        with self._stream_lock:
+            if self._latency_reported:
+                return
+            self._latency_reported = True
+        if self.on_first_token is not None:
+            self.on_first_token(latency)
+
+    def censor_first_token(self):
+        """没有输出首个token就被取消时，把已等待的时间作为首token延迟的下限上报
+
+        只统计获胜一方的延迟会让分位数偏向快的请求，对冲延迟越来越短、对冲率越来越高。
+        """
+        if self.error is None and not self.first_token.is_set():
+            self._report_latency(time.perf_counter() - self.started)
+
+    def _run(self, messages, params, results):
+        parts, finish_reason, usage, connected, finished = [], None, None, False, False
+        try:
+            stream = self.integrator.chat_stream(messages, model=self.model, **params)
+            connected = True
+            with self._stream_lock:
+                self._stream = stream
+            if self.cancelled.is_set():
+                # 建立连接期间已被取消
+                self._close_stream()
+            for chunk in stream:
+                usage = getattr(chunk, "usage", None) or usage
+                if self.cancelled.is_set():
+                    break
+                if not getattr(chunk, "choices", None):
+                    continue
+                choice = chunk.choices[0]
+                content = getattr(choice.delta, "content", None) or ""
+                if content and not self.first_token.is_set():
+                    self.first_token_latency = time.perf_counter() - self.started
+                    self.first_token.set()
+                    self.progress.set()
+                    self._report_latency(self.first_token_latency)
+                parts.append(content)
+                finish_reason = choice.finish_reason or finish_reason
+            else:
+                finished = True
+            if self.cancelled.is_set() and not finished:
+                results.put((self, None, None, None))
+            else:
+                results.put((self, "".join(parts), finish_reason, None))
+        except Exception as e:
+            # 被取消时关闭响应流会使读取抛出异常，不算作失败
+            if not self.cancelled.is_set():
+                self.error = e
+            results.put((self, None, None, self.error))
+        finally:
+            self._close_stream()
+            if connected:
+                self._record_usage(messages, params, parts, usage, finish_reason, cancelled=not finished)
+            self.progress.set()
+
+    def _record_usage(self, messages, params, parts, usage, finish_reason, cancelled):
+        """记录这一路的token用量；中途被取消或出错时服务端不再返回用量，按提示词和已收到的输出估算"""
+        prompt_text = "\n".join(message["content"] for message in messages)
+        cancelled = cancelled and usage is None
+        if cancelled:
+            usage = SimpleNamespace(prompt_tokens=estimate_tokens(prompt_text),
+                                    completion_tokens=raw_estimate("".join(parts)))
+        usage_recorder.record(self.model, prompt_text, params.get("max_tokens"), usage, finish_reason,
+                              time.perf_counter() - self.started, cancelled=cancelled)
+
+    def _close_stream(self):
+        with self._stream_lock:
+            stream, self._stream = self._stream, None
+        if hasattr(stream, "close"):
+            try:
+                stream.close()
+            except Exception as e:
+                print(f"关闭LLM响应流失败: {str(e)}")
+
+    def cancel(self):
+        """取消请求：立即关闭响应流，服务端随之停止生成，读取线程不必等到下一个token"""
+        self.cancelled.set()
+        self._close_stream()
+
+
+class HedgedCompleter:
+    """主/备两路对冲的补全调用，complete() 返回 (内容, 结束原因)"""
+
+    def __init__(self, primary, primary_model, secondary, secondary_model, delay="p90"):
+        self.primary = primary
+        self.primary_model = primary_model
+        self.secondary = secondary
+        self.secondary_model = secondary_model
+        self.delay_mode, self.delay_value = parse_hedge_delay(delay)
+        self._lock = threading.Lock()
+        self._first_token_latencies = deque(maxlen=FIRST_TOKEN_HISTORY)
+        self.stats = {"requests": 0, "hedged": 0, "fallbacks": 0, "failed": 0,
+                      "wins": {"primary": 0, "secondary": 0}}
+
+    def _record_first_token(self, latency):
+        with self._lock:
+            self._first_token_latencies.append(latency)
+
+    def current_delay(self):
+        """当前的对冲延迟（秒）"""
+        if self.delay_mode == "fixed":
+            return self.delay_value
+        with self._lock:
+            samples = sorted(self._first_token_latencies)
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return DEFAULT_HEDGE_DELAY
+        return samples[min(len(samples) - 1, int(self.delay_value * len(samples)))]
+
+    def complete(self, messages, temperature=0.7, top_p=1.0, max_tokens=None, validate=None):
+        """validate(内容) 返回False的结果不算获胜；两路都没有有效结果时返回先完成的结果，都失败则抛出异常"""
+        params = {"temperature": temperature, "top_p": top_p, "max_tokens": max_tokens}
+        results = queue.Queue()
+        with self._lock:
+            self.stats["requests"] += 1
+
+        primary = _Attempt("primary", self.primary, self.primary_model,
+                           on_first_token=self._record_first_token).start(messages, params, results)
+        attempts = [primary]
+        secondary = None
+
+        def fire_secondary(reason):
+            nonlocal secondary
+            secondary = _Attempt("secondary", self.secondary, self.secondary_model).start(messages, params, results)
+            attempts.append(secondary)
+            with self._lock:
+                self.stats[reason] += 1
+            print(f"LLM对冲: {'主请求失败，改用' if reason == 'fallbacks' else '主请求未及时输出，同时请求'}备用模型 {self.secondary_model}")
+
+        # 等到主请求输出首个token、结束或超过对冲延迟
+        delay = self.current_delay()
+        if not primary.progress.wait(delay):
+            fire_secondary("hedged")
+
+        pending = list(attempts)
+        fallback_result = None
+        last_error = None
+        try:
+            while pending:
+                attempt, content, finish_reason, error = results.get()
+                if attempt in pending:
+                    pending.remove(attempt)
+                if content is None:
+                    if error is not None:
+                        last_error = error
+                        print(f"LLM请求（{attempt.name}）失败: {str(error)}")
+                        # 主请求失败且还没有发出备用请求时立即改用备用请求
+                        if attempt is primary and secondary is None:
+                            fire_secondary("fallbacks")
+                            pending.append(secondary)
+                    continue
+                if validate is None or validate(content):
+                    with self._lock:
+                        self.stats["wins"][attempt.name] += 1
+                    return content, finish_reason
+                if fallback_result is None:
+                    fallback_result = (attempt, content, finish_reason)
+                if attempt is primary and secondary is None:
+                    fire_secondary("fallbacks")
+                    pending.append(secondary)
+            if fallback_result is not None:
+                attempt, content, finish_reason = fallback_result
+                return content, finish_reason
+            with self._lock:
+                self.stats["failed"] += 1
+            raise last_error or RuntimeError("LLM请求失败")
+        finally:
+            # 备用请求获胜时主请求还没有输出：已等待的时间计入首token延迟（截尾值），分位数不会偏低
+            primary.censor_first_token()
+            for attempt in attempts:
+                attempt.cancel()
+
+    def summary(self):
+        with self._lock:
+            stats = {key: (dict(value) if isinstance(value, dict) else value) for key, value in self.stats.items()}
+            samples = len(self._first_token_latencies)
+        requests = stats["requests"] or 1
+        stats.update({
+            "primary_model": self.primary_model,
+            "secondary_model": self.secondary_model,
+            "delay_setting": f"p{round(self.delay_value * 100)}" if self.delay_mode == "percentile" else self.delay_value,
+            "current_delay": round(self.current_delay(), 3),
+            "hedge_rate": round(stats["hedged"] / requests, 4),
+            "first_token_samples": samples,
+        })
+        return stats
+
+
+_hedgers = {}
+_hedgers_lock = threading.Lock()
+
+
+def build_hedger(primary, primary_model, integrator_factory):
+    """根据环境变量创建对冲调用，未配置时返回 None
+
+    相同配置的 LLMAPI 共用一个实例，首token延迟样本和统计在进程内汇总。
+    integrator_factory(api_key, base_url) 用于创建备用服务的客户端。
+    """
+    secondary_model = os.getenv("LLM_HEDGE_MODEL")
+    secondary_url = os.getenv("LLM_HEDGE_BASE_URL")
+    if not secondary_model and not secondary_url:
+        return None
+    key = (primary.base_url, primary_model, secondary_url, secondary_model)
+    with _hedgers_lock:
+        hedger = _hedgers.get(key)
+        if hedger is None:
+            secondary = integrator_factory(os.getenv("LLM_HEDGE_API_KEY") or primary.api_key,
+                                           secondary_url or primary.base_url)
+            hedger = _hedgers[key] = HedgedCompleter(primary, primary_model, secondary,
+                                                     secondary_model or primary_model,
+                                                     os.getenv("LLM_HEDGE_DELAY", "p90"))
+        return hedger
+
+
+def hedging_summary():
+    """进程内各对冲配置的统计，未启用时为空列表"""
+    with _hedgers_lock:
+        hedgers = list(_hedgers.values())
+    return [hedger.summary() for hedger in hedgers]
@@ -0,0 +1,168 @@
+"""供日程优化提示词使用的历史画像
+
+只统计今天之前的日期，随存储的每次提交增量更新：
+  - 每个任务的出现次数、完成情况和时长分布（按15分钟取整的直方图，用于取典型时长）
+  - 按星期几 × 时段（上午/下午/晚上）的完成率
+  - 最近两周的反馈评分（来自统计汇总表）
+to_prompt() 输出固定上限大小的文本块，历史再长，提示词长度也不会增长。
+"""
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from schedule_store import EMPTY_SNAPSHOT, parse_time_range
+from rollups import get_rollups
+
+WEEKDAY_NAMES = ("周一", "周二", "周三", "周四", "周五", "周六", "周日")
+SLOT_NAMES = ("上午", "下午", "晚上")
+# 提示词中最多列出的任务数、任务名长度和评分条数
+PROFILE_MAX_TASKS = 12
+PROFILE_TASK_NAME_LENGTH = 20
+PROFILE_RECENT_DAYS = 14
+PROFILE_MAX_RATINGS = 7
+# 时长直方图的粒度（分钟）和上限
+DURATION_BUCKET = 15
+DURATION_MAX_BUCKET = 32
+# 结果未知的完成度不计入完成率
+UNSETTLED_STATES = ("取消", "待评价")
+
+
+def time_slot(start_minutes):
+    """开始时间所属的时段序号"""
+    if start_minutes < 12 * 60:
+        return 0
+    if start_minutes < 18 * 60:
+        return 1
+    return 2
+
+
+def format_rate(done, effective):
+    return f"{round(done * 100 / effective)}%" if effective else "-"
+
+
+class HistoryProfile:
+    """单个日程存储的历史画像，通过 ScheduleStore.subscribe() 增量维护"""
+
+    def __init__(self, rollups=None):
+        self.rollups = rollups
+        self._lock = threading.RLock()
+        self._reset()
+        self._snapshot = EMPTY_SNAPSHOT
+
+    def _reset(self):
+        # 任务名 -> [次数, 已完成, 计入完成率的次数, 时长直方图]
+        self._tasks = {}
+        # [星期][时段] -> [已完成, 计入完成率的次数]
+        self._slots = [[[0, 0] for _ in SLOT_NAMES] for _ in WEEKDAY_NAMES]
+        self._day_count = 0
+        # 已计入画像的日期都早于 horizon
+        self._horizon = datetime.now().strftime("%Y-%m-%d")
+
+    def _apply_day(self, date_str, day_events, sign):
+        """把一天的事件计入（sign=1）或移出（sign=-1）画像"""
+        if not day_events:
+            return
+        self._day_count += sign
+        weekday = datetime.strptime(date_str, "%Y-%m-%d").weekday()
+        for event in day_events:
+            done = 1 if event.get("completion") == "已完成" else 0
+            settled = 0 if event.get("completion") in UNSETTLED_STATES else 1
+            stats = self._tasks.get(event["task"])
+            if stats is None:
+                stats = self._tasks[event["task"]] = [0, 0, 0, Counter()]
+            stats[0] += sign
+            stats[1] += sign * done
+            stats[2] += sign * settled
+            time_range = parse_time_range(event["time"])
+            if time_range:
+                bucket = min(round((time_range[1] - time_range[0]) / DURATION_BUCKET), DURATION_MAX_BUCKET)
+                stats[3][bucket] += sign
+                if stats[3][bucket] <= 0:
+                    del stats[3][bucket]
+                slot = self._slots[weekday][time_slot(time_range[0])]
+                slot[0] += sign * done
+                slot[1] += sign * settled
+            if stats[0] <= 0:
+                del self._tasks[event["task"]]
+
+    def rebuild(self, snapshot):
+        with self._lock:
+            self._reset()
+            self._snapshot = snapshot
+            for date_str, day_events in snapshot.iter_days():
+                if date_str < self._horizon:
+                    self._apply_day(date_str, day_events, 1)
+
+    def on_commit(self, previous, snapshot, changed_dates):
+        """存储监听器：只对今天之前的变化日期先移出旧事件、再计入新事件"""
+        with self._lock:
+            self._snapshot = snapshot
+            for date_str in changed_dates:
+                if date_str < self._horizon:
+                    self._apply_day(date_str, previous.get(date_str), -1)
+                    self._apply_day(date_str, snapshot.get(date_str), 1)
+
+    def advance(self, today=None):
+        """日期推进后，把新成为历史的日期计入画像（只处理推进的天数）"""
+        today = today or datetime.now().strftime("%Y-%m-%d")
+        with self._lock:
+            if today <= self._horizon:
+                return
+            current = datetime.strptime(self._horizon, "%Y-%m-%d")
+            last = datetime.strptime(today, "%Y-%m-%d")
+            while current < last:
+                date_str = current.strftime("%Y-%m-%d")
+                self._apply_day(date_str, self._snapshot.get(date_str), 1)
+                current += timedelta(days=1)
+            self._horizon = today
+
+    def typical_minutes(self, histogram):
+        """时长直方图的中位数（分钟）"""
+        total = sum(histogram.values())
+        seen = 0
+        for bucket in sorted(histogram):
+            seen += histogram[bucket]
+            if seen * 2 >= total:
+                return bucket * DURATION_BUCKET
+        return None
+
+    def to_prompt(self, max_tasks=PROFILE_MAX_TASKS):
+        """序列化为提示词中的固定大小文本块（最多 max_tasks 个任务 + 7 行时段完成率 + 1 行评分）"""
+        self.advance()
+        with self._lock:
+            if not self._day_count:
+                return "暂无历史记录"
+            lines = [f"统计截至 {self._horizon} 之前的 {self._day_count} 天"]
+            lines.append("常见任务（次数 / 典型时长 / 完成率）:")
+            top_tasks = sorted(self._tasks.items(), key=lambda item: (-item[1][0], item[0]))[:max_tasks]
+            for task, (count, done, settled, histogram) in top_tasks:
+                minutes = self.typical_minutes(histogram)
+                duration = f"约{minutes}分钟" if minutes else "时长不定"
+                name = task[:PROFILE_TASK_NAME_LENGTH].replace("\n", " ")
+                lines.append(f"- {name}: {count}次 / {duration} / {format_rate(done, settled)}")
+            lines.append("各时段完成率（" + "/".join(SLOT_NAMES) + "）:")
+            for name, slots in zip(WEEKDAY_NAMES, self._slots):
+                lines.append(f"- {name}: " + " / ".join(format_rate(done, settled) for done, settled in slots))
+            horizon = self._horizon
+        ratings = self.rollups.recent_ratings(horizon, PROFILE_RECENT_DAYS) if self.rollups else []
+        if ratings:
+            average = sum(rating for _, rating in ratings) / len(ratings)
+            recent = "，".join(f"{date_str[5:]} {rating:g}" for date_str, rating in ratings[-PROFILE_MAX_RATINGS:])
+            lines.append(f"最近{PROFILE_RECENT_DAYS}天反馈评分: 平均 {average:.1f}（{len(ratings)}次），最近: {recent}")
+        else:
+            lines.append(f"最近{PROFILE_RECENT_DAYS}天反馈评分: 无")
+        return "\n".join(lines)
+
+
+_profiles = {}
+_profiles_lock = threading.Lock()
+
+
+def get_history_profile(store):
+    """获取存储对应的历史画像（首次调用时建立并订阅存储的变更）"""
+    with _profiles_lock:
+        profile = _profiles.get(store.file_path)
+        if profile is None:
+            profile = HistoryProfile(get_rollups(store))
+            store.subscribe(profile.on_commit, initialize=profile.rebuild)
+            _profiles[store.file_path] = profile
+        return profile
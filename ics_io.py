@@ -0,0 +1,308 @@
+"""iCalendar (.ics) 流式导入导出
+
+导出时逐个日期生成 VEVENT，导入时逐行解析，内存占用不随日历跨度增长。
+命令行用法:
+  python ics_io.py export [--user 用户] [--start YYYY-MM-DD] [--end YYYY-MM-DD] [-o 文件]
+  python ics_io.py import 文件 [--user 用户]
+"""
+import argparse
+import hashlib
+import sys
+from datetime import datetime, timedelta, timezone
+from schedule_store import parse_time_range, format_minutes, normalize_time
+
+# 完成度与 VEVENT STATUS 的对应关系，原始完成度另存于 X-BEBOP-COMPLETION，
+# 原始时间字符串另存于 X-BEBOP-TIME，重新导入本程序导出的文件时事件保持不变（不会产生重复）
+COMPLETION_TO_STATUS = {
+    "未开始": "TENTATIVE",
+    "待评价": "TENTATIVE",
+    "进行中": "CONFIRMED",
+    "已完成": "CONFIRMED",
+    "延期": "CONFIRMED",
+    "取消": "CANCELLED",
+}
+STATUS_TO_COMPLETION = {
+    "CANCELLED": "取消",
+}
+# 每次向调用方产出的行数，减少分块响应的开销
+LINES_PER_CHUNK = 200
+
+
+def escape_text(text):
+    """按 RFC 5545 转义文本值"""
+    return (text.replace("\\", "\\\\").replace(";", "\\;")
+            .replace(",", "\\,").replace("\n", "\\n"))
+
+
+def unescape_text(text):
+    """还原 RFC 5545 转义的文本值"""
+    result = []
+    chars = iter(text)
+    for ch in chars:
+        if ch == "\\":
+            nxt = next(chars, "")
+            result.append("\n" if nxt in ("n", "N") else nxt)
+        else:
+            result.append(ch)
+    return "".join(result)
+
+
+def fold_line(line):
+    """超过75字节的内容行按 RFC 5545 折行"""
+    encoded = line.encode("utf-8")
+    if len(encoded) <= 75:
+        return line + "\r\n"
+    parts = []
+    current = ""
+    limit = 75
+    for ch in line:
+        if len((current + ch).encode("utf-8")) > limit:
+            parts.append(current)
+            current = ""
+            limit = 74  # 续行以一个空格开头
+        current += ch
+    parts.append(current)
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def event_to_vevent(date_str, index, event, stamp):
+    """将一个事件转换为 VEVENT 内容行"""
+    day = date_str.replace("-", "")
+    uid_source = f"{date_str}|{index}|{event['time']}|{event['task']}"
+    uid = hashlib.sha1(uid_source.encode("utf-8")).hexdigest()
+    lines = ["BEGIN:VEVENT", f"UID:{uid}@bebop", f"DTSTAMP:{stamp}"]
+
+    time_range = parse_time_range(event["time"])
+    if time_range is None:
+        # 无法解析的时间（如"全天"）导出为全天事件
+        next_day = (datetime.strptime(date_str, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y%m%d")
+        lines += [f"DTSTART;VALUE=DATE:{day}", f"DTEND;VALUE=DATE:{next_day}"]
+    else:
+        start, end = time_range
+        lines.append(f"DTSTART:{day}T{start // 60:02d}{start % 60:02d}00")
+        # 只有时间段才写结束时间，单个时间点只有开始时间
+        if " - " in normalize_time(event["time"]):
+            if end >= 24 * 60:
+                next_day = (datetime.strptime(date_str, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y%m%d")
+                lines.append(f"DTEND:{next_day}T000000")
+            else:
+                lines.append(f"DTEND:{day}T{end // 60:02d}{end % 60:02d}00")
+
+    completion = event.get("completion") or "未开始"
+    lines += [
+        f"SUMMARY:{escape_text(event['task'])}",
+        f"STATUS:{COMPLETION_TO_STATUS.get(completion, 'CONFIRMED')}",
+        f"X-BEBOP-COMPLETION:{escape_text(completion)}",
+        f"X-BEBOP-TIME:{escape_text(event['time'])}",
+        "END:VEVENT",
+    ]
+    return lines
+
+
+def iter_ics(snapshot, start=None, end=None, calendar_name="BEBOP日程"):
+    """按日期顺序逐块生成 .ics 文本，start/end 为可选的 YYYY-MM-DD 闭区间"""
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    buffer = [fold_line(line) for line in (
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//BEBOP//Schedule Manager//CN",
+        "CALSCALE:GREGORIAN",
+        f"X-WR-CALNAME:{escape_text(calendar_name)}",
+    )]
+    for date_str, day_events in snapshot.iter_days(start, end):
+        for index, event in enumerate(day_events):
+            buffer.extend(fold_line(line) for line in event_to_vevent(date_str, index, event, stamp))
+        if len(buffer) >= LINES_PER_CHUNK:
+            yield "".join(buffer)
+            buffer = []
+    buffer.append(fold_line("END:VCALENDAR"))
+    yield "".join(buffer)
+
+
+def iter_unfolded_lines(lines):
+    """合并折行后的内容行"""
+    current = None
+    for raw in lines:
+        if isinstance(raw, bytes):
+            raw = raw.decode("utf-8", errors="replace")
+        raw = raw.rstrip("\r\n")
+        if raw[:1] in (" ", "\t") and current is not None:
+            current += raw[1:]
+            continue
+        if current is not None:
+            yield current
+        current = raw
+    if current:
+        yield current
+
+
+def parse_ics_datetime(value, params):
+    """解析 DTSTART/DTEND 的值，返回 (datetime, 是否为全天)"""
+    if params.get("VALUE") == "DATE" or len(value) == 8:
+        return datetime.strptime(value[:8], "%Y%m%d"), True
+    if value.endswith("Z"):
+        # UTC时间转换为本地时间
+        utc = datetime.strptime(value, "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc)
+        return utc.astimezone().replace(tzinfo=None), False
+    return datetime.strptime(value[:15], "%Y%m%dT%H%M%S"), False
+
+
+def parse_duration(value):
+    """解析 DURATION 值（如 PT1H30M、P1D）"""
+    sign = -1 if value.startswith("-") else 1
+    value = value.lstrip("+-").lstrip("P")
+    days = hours = minutes = 0
+    number = ""
+    in_time = False
+    for ch in value:
+        if ch == "T":
+            in_time = True
+        elif ch.isdigit():
+            number += ch
+        elif ch == "W":
+            days += int(number or 0) * 7
+            number = ""
+        elif ch == "D":
+            days += int(number or 0)
+            number = ""
+        elif ch == "H" and in_time:
+            hours += int(number or 0)
+            number = ""
+        elif ch == "M" and in_time:
+            minutes += int(number or 0)
+            number = ""
+        elif ch == "S":
+            number = ""
+    return sign * timedelta(days=days, hours=hours, minutes=minutes)
+
+
+def vevent_to_event(props):
+    """将解析出的 VEVENT 属性转换为 (日期, 事件)，缺少开始时间时返回 None"""
+    if "DTSTART" not in props:
+        return None
+    start, all_day = parse_ics_datetime(*props["DTSTART"])
+    date_str = start.strftime("%Y-%m-%d")
+    if "X-BEBOP-TIME" in props:
+        # 本程序导出的事件，使用原始时间字符串
+        time_str = unescape_text(props["X-BEBOP-TIME"][0])
+    elif all_day:
+        time_str = "全天"
+    else:
+        end = None
+        if "DTEND" in props:
+            end, _ = parse_ics_datetime(*props["DTEND"])
+        elif "DURATION" in props:
+            end = start + parse_duration(props["DURATION"][0])
+        start_minutes = start.hour * 60 + start.minute
+        if end is None:
+            time_str = format_minutes(start_minutes)
+        else:
+            # 跨天事件截断到当天结束（次日 00:00 结束即 24:00）
+            end_minutes = 24 * 60 if end.date() > start.date() else end.hour * 60 + end.minute
+            time_str = normalize_time(f"{format_minutes(start_minutes)}-{format_minutes(end_minutes)}")
+
+    completion = None
+    if "X-BEBOP-COMPLETION" in props:
+        completion = unescape_text(props["X-BEBOP-COMPLETION"][0])
+    if not completion and "STATUS" in props:
+        completion = STATUS_TO_COMPLETION.get(props["STATUS"][0].upper())
+    return date_str, {
+        "time": time_str,
+        "task": unescape_text(props.get("SUMMARY", ("",))[0]).strip(),
+        "completion": completion or "未开始",
+    }
+
+
+def iter_ics_events(lines):
+    """逐行解析 .ics，依次产出 (日期, 事件)；不支持重复规则(RRULE)，只取首次发生"""
+    props = None
+    depth = 0
+    for line in iter_unfolded_lines(lines):
+        if not line:
+            continue
+        name_part, _, value = line.partition(":")
+        name, *param_parts = name_part.split(";")
+        name = name.upper()
+        if name == "BEGIN" and value.upper() == "VEVENT":
+            props, depth = {}, 0
+            continue
+        if props is None:
+            continue
+        if name == "BEGIN":
+            # 忽略嵌套的 VALARM 等组件
+            depth += 1
+        elif name == "END" and value.upper() == "VEVENT":
+            try:
+                parsed = vevent_to_event(props)
+            except ValueError as e:
+                print(f"跳过无法解析的事件: {str(e)}")
+                parsed = None
+            if parsed and parsed[1]["task"]:
+                yield parsed
+            props = None
+        elif name == "END":
+            depth -= 1
+        elif depth == 0 and name not in props:
+            params = {}
+            for param in param_parts:
+                key, _, param_value = param.partition("=")
+                params[key.upper()] = param_value
+            props[name] = (value, params)
+
+
+def import_ics(lines, store, batch_size=500):
+    """分批把 .ics 中的事件合并到存储，返回 (合并数量, 跳过数量)"""
+    merged = skipped = 0
+    batch = []
+    for item in iter_ics_events(lines):
+        batch.append(item)
+        if len(batch) >= batch_size:
+            m, s = store.merge(batch)
+            merged, skipped = merged + m, skipped + s
+            batch = []
+    if batch:
+        m, s = store.merge(batch)
+        merged, skipped = merged + m, skipped + s
+    return merged, skipped
+
+
+def main(argv=None):
+    import os
+    from dotenv import load_dotenv
+    from schedule_store import BASE_DIR, get_store_registry
+
+    load_dotenv(os.path.join(BASE_DIR, ".env"))
+
+    parser = argparse.ArgumentParser(description="iCalendar 导入导出")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="导出为 .ics")
+    export_parser.add_argument("--user", default=None, help="用户名（默认为本机用户）")
+    export_parser.add_argument("--start", default=None, help="开始日期 YYYY-MM-DD")
+    export_parser.add_argument("--end", default=None, help="结束日期 YYYY-MM-DD")
+    export_parser.add_argument("-o", "--output", default=None, help="输出文件（默认输出到标准输出）")
+    import_parser = subparsers.add_parser("import", help="从 .ics 导入")
+    import_parser.add_argument("file", help=".ics 文件")
+    import_parser.add_argument("--user", default=None, help="用户名（默认为本机用户）")
+    args = parser.parse_args(argv)
+
+    store = get_store_registry().get(args.user)
+    if args.command == "export":
+        chunks = iter_ics(store.snapshot(), args.start, args.end)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8", newline="") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            print(f"已导出到 {args.output}")
+        else:
+            for chunk in chunks:
+                sys.stdout.write(chunk)
+    else:
+        with open(args.file, "r", encoding="utf-8", errors="replace", newline="") as f:
+            merged, skipped = import_ics(f, store)
+        if merged:
+            store.save()
+        print(f"导入完成: 新增 {merged} 条，跳过重复 {skipped} 条")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+import heapq
+import math
+import threading
+import time
+import traceback
+import uuid
+from collections import deque
+
+# 优先级名称对应的数值，数值越小越先执行
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+
+
+class Job:
+    """后台任务的状态记录"""
+
+    def __init__(self, kind, owner=None, priority=PRIORITIES["normal"]):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.owner = owner
+        self.priority = priority
+        self.status = "queued"  # queued / running / done / failed
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._finished = threading.Event()
+
+    @property
+    def finished(self):
+        return self._finished.is_set()
+
+    def wait(self, timeout=None):
+        """等待任务结束，返回是否已结束"""
+        return self._finished.wait(timeout)
+
+    def update(self, **progress):
+        """更新进度信息"""
+        self.progress.update(progress)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "priority": self.priority,
+            "progress": dict(self.progress),
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobRegistry:
+    """在内存中登记后台任务，已结束的任务保留一段时间以便查询结果"""
+
+    def __init__(self, retention_seconds=3600):
+        self.retention_seconds = retention_seconds
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, kind, owner=None, priority=PRIORITIES["normal"]):
+        job = Job(kind, owner, priority)
+        with self._lock:
+            self._purge()
+            self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _purge(self):
+        """清理超过保留时间的已结束任务"""
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at and now - job.finished_at > self.retention_seconds]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+def execute(job, target, args, kwargs):
+    """在当前线程中执行任务并记录状态、结果和异常"""
+    job.status = "running"
+    job.started_at = time.time()
+    try:
+        job.result = target(job, *args, **kwargs)
+        job.status = "done"
+    except Exception as e:
+        print(f"后台任务 {job.kind}:{job.id} 失败: {str(e)}")
+        print(traceback.format_exc())
+        job.error = str(e)
+        job.status = "failed"
+    finally:
+        job.finished_at = time.time()
+        job._finished.set()
+
+
+class QueueFull(Exception):
+    """任务队列已满，retry_after 为建议的重试等待秒数"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class JobQueue:
+    """固定大小工作线程池执行的任务队列
+
+    每个用户一个按优先级排序的队列；工作线程总是取各用户队首中优先级最高的任务，
+    优先级相同时在用户之间轮流，一个用户提交大量任务不会饿死其他用户。
+    排队总数或单个用户的排队数超过上限时拒绝提交（QueueFull），
+    建议的重试时间按排队深度和最近任务的平均耗时估算。
+    """
+
+    def __init__(self, registry, workers=2, max_depth=20, max_per_owner=3, expected_seconds=30.0):
+        self.registry = registry
+        self.workers = max(1, workers)
+        self.max_depth = max_depth
+        self.max_per_owner = max_per_owner
+        # 任务平均耗时（秒）的指数平均，用于估算重试时间和排队位置
+        self.average_seconds = expected_seconds
+        self._cond = threading.Condition()
+        self._queues = {}  # owner -> [(优先级, 序号, job, target, args, kwargs)]
+        self._rotation = deque()  # 有排队任务的用户，按轮转顺序
+        self._sequence = 0
+        self._running = 0
+        self._threads = []
+        self.stats = {"submitted": 0, "rejected": 0, "completed": 0, "failed": 0}
+
+    def depth(self):
+        with self._cond:
+            return sum(len(queue) for queue in self._queues.values())
+
+    def _retry_after(self, depth):
+        return max(1, math.ceil((depth + 1) * self.average_seconds / self.workers))
+
+    def _check_room(self, owner):
+        """排队总数或该用户的排队数已达上限时抛出 QueueFull（调用时持有锁）"""
+        depth = sum(len(queue) for queue in self._queues.values())
+        owned = len(self._queues.get(owner, ()))
+        if depth >= self.max_depth or owned >= self.max_per_owner:
+            self.stats["rejected"] += 1
+            scope = "排队任务过多" if depth >= self.max_depth else "您已有过多任务在排队"
+            raise QueueFull(f"{scope}，请稍后再试", self._retry_after(max(depth, owned)))
+
+    def check_room(self, owner):
+        """提交前的预检（如在接收上传文件之前），队列已满时抛出 QueueFull；提交时仍会再次检查"""
+        with self._cond:
+            self._check_room(owner)
+
+    def submit(self, kind, owner, target, *args, priority=PRIORITIES["normal"], **kwargs):
+        """提交任务 target(job, *args, **kwargs)，返回 Job；队列已满时抛出 QueueFull"""
+        with self._cond:
+            self._check_room(owner)
+            job = self.registry.create(kind, owner, priority)
+            if owner not in self._queues:
+                self._queues[owner] = []
+                self._rotation.append(owner)
+            self._sequence += 1
+            heapq.heappush(self._queues[owner], (priority, self._sequence, job, target, args, kwargs))
+            self.stats["submitted"] += 1
+            self._ensure_workers()
+            self._cond.notify()
+        return job
+
+    def _ensure_workers(self):
+        """首次提交时才启动工作线程"""
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name=f"job-worker-{len(self._threads)}", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _take(self):
+        """取出下一个任务：优先级最高者优先，同优先级按用户轮转顺序（调用时持有锁）"""
+        best = None
+        for owner in self._rotation:
+            head = self._queues[owner][0]
+            if best is None or head[0] < best[1][0]:
+                best = (owner, head)
+        owner = best[0]
+        entry = heapq.heappop(self._queues[owner])
+        self._rotation.remove(owner)
+        if self._queues[owner]:
+            # 刚执行过的用户排到轮转末尾
+            self._rotation.append(owner)
+        else:
+            del self._queues[owner]
+        return entry
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._rotation:
+                    self._cond.wait()
+                _, _, job, target, args, kwargs = self._take()
+                self._running += 1
+            started = time.monotonic()
+            execute(job, target, args, kwargs)
+            with self._cond:
+                self._running -= 1
+                self.average_seconds = 0.8 * self.average_seconds + 0.2 * (time.monotonic() - started)
+                self.stats["completed" if job.status == "done" else "failed"] += 1
+
+    def position(self, job):
+        """排队中的任务前面还有几个任务（近似值，按优先级和提交顺序），不在队列中时返回 None"""
+        with self._cond:
+            entries = [entry for queue in self._queues.values() for entry in queue]
+        mine = next((entry for entry in entries if entry[2] is job), None)
+        if mine is None:
+            return None
+        return sum(1 for entry in entries if entry[:2] < mine[:2])
+
+    def estimated_wait(self, job):
+        """任务开始执行前的预计等待秒数"""
+        position = self.position(job)
+        if position is None:
+            return 0
+        return math.ceil((position + 1) * self.average_seconds / self.workers)
+
+    def summary(self):
+        with self._cond:
+            return dict(self.stats, queued=sum(len(queue) for queue in self._queues.values()),
+                        running=self._running, workers=self.workers,
+                        average_seconds=round(self.average_seconds, 2))
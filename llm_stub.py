@@ -0,0 +1,309 @@
+"""兼容OpenAI接口的本地LLM桩服务，用于基准测试和压测，不访问真实的模型服务
+
+支持 POST /v1/chat/completions（流式与非流式）和 GET /v1/models。
+  - 首个token前的延迟（含随机抖动）和每秒输出token数可配置
+  - 按比例注入错误（如 429 / 500 / 503）
+  - 默认把提示词中"原始日程安排"的JSON整理为合法的优化结果返回
+  - --record 模式把请求转发给真实服务并记录响应，--replay 模式回放记录的响应
+用法:
+  python llm_stub.py --port 8901 --latency 0.3 --token-rate 80 --error-rate 0.02
+  python llm_stub.py --record recorded.jsonl --upstream https://api.siliconflow.cn/v1
+  python llm_stub.py --replay recorded.jsonl
+然后设置 LLM_BASE_URL=http://127.0.0.1:8901/v1 启动程序。
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from schedule_store import parse_time_range, format_minutes
+from token_budget import raw_estimate, CJK_PATTERN
+
+DEFAULT_PORT = 8901
+# 模拟输出时每个token最多包含的非中日韩字符数（与 token_budget 的估算规则大致一致）
+ASCII_CHARS_PER_TOKEN = 3
+
+
+def split_tokens(text):
+    """把输出切分为模拟的token：中日韩字符每个一个，其余字符每3个一个"""
+    tokens, current = [], ""
+    for ch in text:
+        if CJK_PATTERN.match(ch):
+            if current:
+                tokens.append(current)
+                current = ""
+            tokens.append(ch)
+            continue
+        current += ch
+        if len(current) >= ASCII_CHARS_PER_TOKEN:
+            tokens.append(current)
+            current = ""
+    if current:
+        tokens.append(current)
+    return tokens
+
+
+def request_key(messages):
+    """请求的回放键：消息内容的SHA1"""
+    canonical = json.dumps(messages, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+def echo_schedule(prompt):
+    """从优化提示词中取出原始日程，整理为 HH:MM-HH:MM 格式后作为优化结果"""
+    marker = prompt.find("## 原始日程安排")
+    start = prompt.find("{", marker) if marker != -1 else -1
+    if start == -1:
+        return "好的。"
+    try:
+        events, _ = json.JSONDecoder().raw_decode(prompt[start:])
+    except ValueError:
+        return "{}"
+    result = {}
+    for date_str, day_events in events.items():
+        result[date_str] = []
+        for event in day_events:
+            time_range = parse_time_range(event.get("time", "")) or (9 * 60, 10 * 60)
+            end = min(time_range[1], 24 * 60 - 1)
+            result[date_str].append({
+                "time": f"{format_minutes(time_range[0])}-{format_minutes(end)}",
+                "task": event.get("task", ""),
+                "completion": event.get("completion", "未开始"),
+            })
+    return json.dumps(result, indent=2, ensure_ascii=False)
+
+
+class StubConfig:
+    def __init__(self, latency=0.2, jitter=0.05, token_rate=0.0, error_rate=0.0, error_status=500,
+                 replay=None, record=None, upstream=None, api_key=None, model="stub-model"):
+        self.latency = latency
+        self.jitter = jitter
+        self.token_rate = token_rate
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.record = record
+        self.upstream = upstream
+        self.api_key = api_key
+        self.model = model
+        self.replay = {}
+        self._replay_order = []
+        self._replay_index = 0
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "errors_injected": 0, "streamed": 0}
+        if replay:
+            with open(replay, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.replay[entry["key"]] = entry
+                        self._replay_order.append(entry)
+
+    def first_token_delay(self):
+        return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+
+    def token_delay(self):
+        return 1.0 / self.token_rate if self.token_rate > 0 else 0.0
+
+    def replayed(self, key):
+        """按请求键回放，没有完全匹配的记录时按顺序轮流回放"""
+        with self._lock:
+            if key in self.replay:
+                return self.replay[key]
+            if not self._replay_order:
+                return None
+            entry = self._replay_order[self._replay_index % len(self._replay_order)]
+            self._replay_index += 1
+            return entry
+
+    def forward(self, body, key):
+        """把请求（改为非流式）转发给真实服务，记录并返回 (内容, 结束原因)"""
+        payload = dict(body, stream=False)
+        payload.pop("stream_options", None)
+        request = urllib.request.Request(
+            self.upstream.rstrip("/") + "/chat/completions",
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json", "Authorization": f"Bearer {self.api_key}"},
+        )
+        with urllib.request.urlopen(request, timeout=300) as response:
+            data = json.loads(response.read().decode("utf-8"))
+        choice = data["choices"][0]
+        entry = {"key": key, "content": choice["message"]["content"], "finish_reason": choice.get("finish_reason")}
+        with self._lock:
+            with open(self.record, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        return entry["content"], entry["finish_reason"]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    server_version = "LLMStub/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def config(self):
+        return self.server.config
+
+    def send_json(self, status, payload, headers=None):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self.send_json(200, {"object": "list", "data": [{"id": self.config.model, "object": "model"}]})
+        else:
+            self.send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_json(404, {"error": {"message": "not found"}})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length).decode("utf-8") or "{}")
+        config = self.config
+        with config._lock:
+            config.stats["requests"] += 1
+
+        if config.error_rate and random.random() < config.error_rate:
+            with config._lock:
+                config.stats["errors_injected"] += 1
+            headers = {"Retry-After": "1"} if config.error_status == 429 else None
+            self.send_json(config.error_status,
+                           {"error": {"message": "injected error", "type": "stub_error"}}, headers)
+            return
+
+        messages = body.get("messages", [])
+        prompt = "\n".join(str(message.get("content", "")) for message in messages)
+        key = request_key(messages)
+        finish_reason = "stop"
+        if config.upstream and config.record:
+            content, finish_reason = config.forward(body, key)
+        else:
+            entry = config.replayed(key) if config.replay else None
+            if entry is not None:
+                content, finish_reason = entry["content"], entry.get("finish_reason") or "stop"
+            else:
+                content = echo_schedule(prompt)
+
+        # 按 max_tokens 截断，模拟真实服务的 finish_reason=length
+        tokens = split_tokens(content)
+        max_tokens = body.get("max_tokens")
+        if max_tokens and len(tokens) > max_tokens:
+            tokens = tokens[:max_tokens]
+            finish_reason = "length"
+        usage = {"prompt_tokens": raw_estimate(prompt), "completion_tokens": len(tokens),
+                 "total_tokens": raw_estimate(prompt) + len(tokens)}
+        model = body.get("model") or config.model
+        created = int(time.time())
+        completion_id = f"chatcmpl-stub-{random.getrandbits(48):012x}"
+
+        time.sleep(config.first_token_delay())
+        if body.get("stream"):
+            with config._lock:
+                config.stats["streamed"] += 1
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+
+            def send_chunk(delta, reason=None, extra=None):
+                chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                         "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": reason}]}
+                chunk.update(extra or {})
+                self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+            try:
+                send_chunk({"role": "assistant", "content": ""})
+                delay = config.token_delay()
+                for token in tokens:
+                    if delay:
+                        time.sleep(delay)
+                    send_chunk({"content": token})
+                include_usage = (body.get("stream_options") or {}).get("include_usage")
+                send_chunk({}, finish_reason, {"usage": usage} if include_usage else None)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # 客户端取消了请求（例如对冲请求中落败的一方）
+                pass
+            self.close_connection = True
+            return
+
+        if config.token_delay():
+            time.sleep(config.token_delay() * len(tokens))
+        self.send_json(200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)},
+                         "finish_reason": finish_reason}],
+            "usage": usage,
+        })
+
+
+def make_server(config, host="127.0.0.1", port=DEFAULT_PORT):
+    """创建桩服务（port=0 时自动选择端口），调用 serve_forever() 开始服务"""
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.config = config
+    return server
+
+
+def start_in_thread(config, host="127.0.0.1", port=0):
+    """在后台线程中启动桩服务，返回 (server, base_url)"""
+    server = make_server(config, host, port)
+    threading.Thread(target=server.serve_forever, name="llm-stub", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def main(argv=None):
+    from dotenv import load_dotenv
+    from schedule_store import BASE_DIR
+
+    load_dotenv(os.path.join(BASE_DIR, ".env"))
+    parser = argparse.ArgumentParser(description="兼容OpenAI接口的本地LLM桩服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency", type=float, default=0.2, help="首个token前的延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.05, help="延迟的随机抖动（秒）")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="每秒输出token数，0表示不限速")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="注入错误的比例 0~1")
+    parser.add_argument("--error-status", type=int, default=500, help="注入错误时的HTTP状态码")
+    parser.add_argument("--replay", default=None, help="回放记录文件（JSONL）")
+    parser.add_argument("--record", default=None, help="记录真实响应到该文件（需同时指定 --upstream）")
+    parser.add_argument("--upstream", default=None, help="真实服务地址，如 https://api.siliconflow.cn/v1")
+    args = parser.parse_args(argv)
+    if bool(args.record) != bool(args.upstream):
+        parser.error("--record 与 --upstream 需要同时指定")
+
+    config = StubConfig(
+        latency=args.latency, jitter=args.jitter, token_rate=args.token_rate,
+        error_rate=args.error_rate, error_status=args.error_status, replay=args.replay,
+        record=args.record, upstream=args.upstream, api_key=os.getenv("DEEPSEEK_API_KEY"),
+    )
+    server = make_server(config, args.host, args.port)
+    print(f"LLM桩服务已启动: http://{args.host}:{server.server_address[1]}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"统计: {config.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,18 @@
 import threading
 import tkinter as tk
 from caption import CalendarApp
-from flask_app import app
 import os
 from dotenv import load_dotenv
+from schedule_store import BASE_DIR
 
-# 加载 .env 文件
+# 加载 .env 文件（打包后 .env 位于 exe 同级目录）
 load_dotenv()
+load_dotenv(os.path.join(BASE_DIR, ".env"))
 
 def run_flask_app():
     """运行 Flask API 服务"""
+    # 在后台线程中导入Flask相关依赖，不阻塞窗口显示
+    from flask_app import app
     print("启动 Flask API 服务...")
     app.run(host='0.0.0.0', port=5000, debug=True, use_reloader=False)
 
@@ -18,6 +21,10 @@ def run_calendar_app():
     print("启动日历事件管理器...")
     root = tk.Tk()
     app = CalendarApp(root)  # 实例化 CalendarApp 类
+
+    # 窗口创建后再启动 Flask 线程，避免导入Flask与创建界面争抢启动时间
+    flask_thread = threading.Thread(target=run_flask_app, daemon=True)
+    root.after(0, flask_thread.start)
     root.mainloop()
 
 if __name__ == "__main__":
@@ -26,11 +33,7 @@ if __name__ == "__main__":
     if not api_key:
         print("警告: 未找到 DEEPSEEK_API_KEY 环境变量，优化功能可能受限")
     
-    # 创建并启动 Flask 线程
-    flask_thread = threading.Thread(target=run_flask_app, daemon=True)
-    flask_thread.start()
-    
-    # 在主线程中运行 Tkinter 应用
+    # 在主线程中运行 Tkinter 应用，Flask 在窗口显示后于后台线程启动
     run_calendar_app()
     
-    print("程序已退出")
\ No newline at end of file
+    print("程序已退出")
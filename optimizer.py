@@ -0,0 +1,272 @@
+"""日程优化（与界面无关的部分）：生成提示词、调用LLM、解析并验证结果
+
+桌面端、后台预优化和压测脚本共用这里的实现。
+"""
+import copy
+import json
+import re
+from datetime import datetime
+from token_budget import split_by_output, output_capacity, estimate_events_output
+from preoptimizer import week_fingerprint
+from singleflight import SingleFlight
+from schedule_store import parse_time_range, format_minutes
+from free_slots import DayBusy, busy_intervals, gaps, find_free_slots
+
+# 进程内共享：同一用户同一周内容相同的并发优化请求只生成一次、写入一次
+flights = SingleFlight()
+# 安排被移动的任务时使用的时间范围（分钟）
+PLACEMENT_DAY_START = 8 * 60
+PLACEMENT_DAY_END = 22 * 60
+# 提示词中每天最多列出的空闲时段数
+PROMPT_SLOTS_PER_DAY = 4
+FIXED_STATES = ("已完成", "取消")
+
+
+def free_slots_text(events_data):
+    """每天可安排任务的空闲时段，供LLM移动任务时参考"""
+    lines = []
+    for date_str in sorted(events_data):
+        busy = busy_intervals(events_data[date_str])
+        slots = [f"{format_minutes(start)}-{format_minutes(end)}"
+                 for start, end in gaps(busy, PLACEMENT_DAY_START, PLACEMENT_DAY_END, 30)]
+        if slots:
+            lines.append(f"{date_str}: {', '.join(slots[:PROMPT_SLOTS_PER_DAY])}")
+    return "\n".join(lines) or "无"
+
+
+def build_optimize_prompt(events_data, history, partial=False):
+    """生成优化提示词，partial=True 表示只是下周的一部分日期（请求被拆分时）"""
+    scope = "\n11. 只返回原始日程中出现的日期，不要把任务调到其他日期" if partial else ""
+    # 准备LLM提示（移除了多余的缩进）
+    return f"""你是一个专业的日程优化顾问，请根据以下事件安排优化下周日程：
+
+## 原始日程安排
+{json.dumps(events_data, indent=2, ensure_ascii=False)}
+
+## 历史画像
+{history}
+
+## 空闲时段
+{free_slots_text(events_data)}
+
+## 优化要求
+1. 保持每天的核心事件不变
+2. 优化时间分配，避免冲突
+3. 确保重要任务有足够时间
+4. 添加必要的休息时间
+5. 保持总事件数量大致相同
+6. 时间格式统一为"HH:MM-HH:MM"
+7. 对于已完成的事件，保持原样不变
+8. 对于未开始的事件，可以调整时间
+9. 如果一天任务太多，可以将任务调到之后的日期，优先放入上面列出的空闲时段
+10. 参考历史画像：任务时长接近其典型时长，尽量安排在完成率较高的时段{scope}
+## 输出要求
+返回优化后的完整日程JSON对象，格式必须严格如下:
+{{
+  "2024-06-10": [
+    {{"time": "09:00-10:00", "task": "会议", "completion": "待评价"}},
+    {{"time": "10:30-12:00", "task": "项目开发", "completion": "待评价"}}
+  ],
+  "2024-06-11": [
+    // 其他日期...
+  ]
+}}
+只返回纯JSON，不要包含任何解释性文字或额外内容。"""
+
+
+def extract_json_from_response(response):
+    """从LLM响应中提取JSON"""
+    try:
+        # 尝试找到JSON开始和结束位置
+        start_idx = response.find('{')
+        end_idx = response.rfind('}')
+
+        if start_idx == -1 or end_idx == -1:
+            print("未找到有效的JSON结构")
+            return None
+
+        json_str = response[start_idx:end_idx+1]
+        return json.loads(json_str)
+    except Exception as e:
+        print(f"解析JSON时出错: {str(e)}")
+        return None
+
+
+def validate_optimized_events(events):
+    """验证优化后的事件格式"""
+    if not isinstance(events, dict):
+        print("优化后事件格式错误: 应为字典")
+        return False
+    
+    for date_str, event_list in events.items():
+        # 验证日期格式
+        try:
+            datetime.strptime(date_str, "%Y-%m-%d")
+        except ValueError:
+            print(f"无效日期格式: {date_str}")
+            return False
+        
+        # 验证事件列表
+        if not isinstance(event_list, list):
+            print(f"{date_str} 的事件格式错误: 应为列表")
+            return False
+            
+        for event in event_list:
+            if not all(key in event for key in ["time", "task", "completion"]):
+                print(f"事件缺少必要字段: {event}")
+                return False
+            
+            # 验证时间格式
+            if not re.match(r"\d{2}:\d{2}-\d{2}:\d{2}", event["time"]):
+                print(f"时间格式错误: {event['time']} (应为HH:MM-HH:MM)")
+                return False
+                
+    return True
+
+
+def place_conflicting(events, day_start=PLACEMENT_DAY_START, day_end=PLACEMENT_DAY_END):
+    """把优化结果中与同一天其他事件重叠的未完成事件移到最早能容纳它的空闲时段（当天或之后的日期）
+
+    已完成/取消的事件保持不动；找不到空闲时段的事件保持原样。原地修改 events，返回移动的事件数。
+    """
+    dates = sorted(events)
+    moving = []
+    for date_str in dates:
+        timed, kept = [], []
+        for event in events[date_str]:
+            time_range = parse_time_range(event["time"])
+            if time_range is None:
+                kept.append(event)
+            else:
+                timed.append((event.get("completion") not in FIXED_STATES, time_range, event))
+        # 固定的事件先占位，其余按开始时间依次放入，与已放入的事件重叠的留待移动
+        timed.sort(key=lambda item: (item[0], item[1]))
+        placed = []
+        for movable, (start, end), event in timed:
+            if movable and any(start < other_end and other_start < end for other_start, other_end in placed):
+                moving.append((date_str, end - start, event))
+                continue
+            placed.append((start, end))
+            kept.append(event)
+        events[date_str] = kept
+
+    busy = DayBusy(events)
+    moved = 0
+    for date_str, duration, event in moving:
+        slots = find_free_slots([busy.busy], dates[dates.index(date_str):], duration, day_start, day_end, limit=1)
+        if slots:
+            start = parse_time_range(slots[0]["start"])[0]
+            target = slots[0]["date"]
+            event["time"] = f"{format_minutes(start)}-{format_minutes(start + duration)}"
+            busy.reserve(target, start, start + duration)
+            moved += 1
+        else:
+            target = date_str
+        events[target].append(event)
+    for date_str in dates:
+        events[date_str].sort(key=lambda event: parse_time_range(event["time"]) or (0, 0))
+    return moved
+
+
+def history_for(store):
+    """生成存储的历史画像文本，失败时不影响优化"""
+    try:
+        from history_profile import get_history_profile
+        return get_history_profile(store).to_prompt()
+    except Exception as e:
+        print(f"生成历史画像失败: {str(e)}")
+        return "暂无历史记录"
+
+
+def optimize_week(llm_api, events_data, history="暂无历史记录"):
+    """使用LLM优化事件安排，成功时返回 {日期: [事件]}，失败时返回 None
+
+    max_tokens 按预计输出长度选择；预计输出超过模型单次上限时按天拆分为多次请求，
+    万一仍被截断（结束原因为 length），把这一组再对半拆分，而不是原样重试。
+    """
+    try:
+        pending = split_by_output(events_data, output_capacity(llm_api.model))
+        partial = len(pending) > 1
+        optimized_events = {}
+        while pending:
+            group = pending.pop(0)
+            prompt = build_optimize_prompt(group, history, partial)
+
+            # 调用LLM
+            print(f"请求LLM优化日程（{len(group)} 天）...")
+            # 启用对冲请求时，以能否解析出JSON判断哪一路结果有效
+            response, finish_reason = llm_api.complete(
+                prompt, expected_output_tokens=estimate_events_output(group),
+                validate=lambda text: extract_json_from_response(text) is not None)
+            print(f"LLM响应: {response[:500]}...")
+            if finish_reason == "length" and len(group) > 1:
+                dates = sorted(group)
+                half = len(dates) // 2
+                print("LLM输出被截断，拆分后重新请求")
+                pending[:0] = [{d: group[d] for d in dates[:half]}, {d: group[d] for d in dates[half:]}]
+                partial = True
+                continue
+
+            # 更健壮的JSON解析方法
+            result = extract_json_from_response(response)
+            if not result:
+                # 记录详细的响应内容以便调试
+                print(f"无效的LLM响应: {response}")
+                return None
+
+            # 验证格式
+            if not validate_optimized_events(result):
+                print(f"验证失败的优化结果: {result}")
+                return None
+
+            if partial:
+                extra = [date_str for date_str in result if date_str not in group]
+                if extra:
+                    print(f"忽略不属于本次请求的日期: {', '.join(extra)}")
+                result = {date_str: result[date_str] for date_str in result if date_str in group}
+            optimized_events.update(result)
+
+        moved = place_conflicting(optimized_events)
+        if moved:
+            print(f"已将 {moved} 个时间冲突的任务移到空闲时段")
+        return optimized_events
+
+    except ValueError as ve:
+        # 处理JSON解析错误
+        print(f"JSON解析错误: {str(ve)}")
+        return None
+    except AttributeError as ae:
+        # 处理API调用错误
+        print(f"API调用错误: {str(ae)}")
+        return None
+    except Exception as e:
+        # 处理其他未知错误
+        print(f"LLM优化失败: {str(e)}")
+        return None
+
+
+def generate_for_week(store, llm_api, week_events):
+    """优化一周日程（不写入），同一存储、内容相同的并发请求共用一次LLM生成"""
+    key = ("generate", store.file_path, week_fingerprint(week_events))
+    result, _ = flights.do(key, lambda: optimize_week(llm_api, copy.deepcopy(week_events), history_for(store)))
+    return copy.deepcopy(result)
+
+
+def optimize_and_apply(store, llm_api, week_events, source=None, commit=None, expected=None):
+    """优化一周日程并写回存储和工作簿
+
+    内容相同的并发请求挂到同一次执行上，只有执行者写入，其余请求直接得到同一结果。
+    commit(修改, source, expected) 用于代替 store.commit 发布结果（如界面记录撤销步骤）。
+    expected 为读取 week_events 时各天的版本号；等待LLM期间这些日期被修改时抛出 ConflictError，
+    其 changes 为未写入的优化结果，调用方可选择只应用未冲突的日期。
+    返回 (优化结果或None, 是否共享了其他请求的结果)
+    """
+    def run():
+        optimized = generate_for_week(store, llm_api, week_events)
+        if optimized:
+            (commit or store.commit)(optimized, source=source, expected=expected)
+            store.save()
+        return optimized
+
+    key = ("apply", store.file_path, week_fingerprint(week_events))
+    return flights.do(key, run)
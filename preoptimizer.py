@@ -0,0 +1,170 @@
+"""下周日程的后台预优化
+
+下周被修改且编辑停止一段时间后，在后台线程中对下周日程预先调用一次优化，结果以下周事件的指纹保存。
+用户点击“自动调整下周日程”时，若下周内容与指纹一致即可直接使用，省去一次LLM往返。
+  - 只在本次运行中下周有修改后，或处于配置的低峰时段（PREOPTIMIZE_OFF_PEAK，如 "1-6"）时调用；
+    程序启动后不会因为已有的下周日程立即调用
+  - 下周内容未变化（指纹与上次优化时相同）时不会重复调用
+  - 编辑进行中、距离上次预优化不足 min_interval 秒时不调用，避免在编辑高峰消耗额度
+  - 对下周任意一天的修改都会使已有结果失效
+"""
+import copy
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+
+# 最后一次编辑后等待多久才开始预优化（秒）
+SETTLE_SECONDS = 30
+# 两次预优化之间的最短间隔（秒）
+MIN_INTERVAL_SECONDS = 300
+
+
+def parse_hours(text):
+    """解析 "起始小时-结束小时"（可跨午夜，如 "22-6"）为小时集合，空字符串返回空集合"""
+    text = (text or "").strip()
+    if not text:
+        return frozenset()
+    start, _, end = text.partition("-")
+    start, end = int(start), int(end or start + 1)
+    if not (0 <= start <= 23 and 0 <= end <= 24):
+        raise ValueError(f"无效的时段: {text}")
+    if start < end:
+        return frozenset(range(start, end))
+    return frozenset(range(start, 24)) | frozenset(range(0, end))
+
+
+def next_week_range(today=None):
+    """下周一和下周日的日期"""
+    today = today or datetime.now().date()
+    next_monday = today + timedelta(days=(7 - today.weekday()))
+    return next_monday, next_monday + timedelta(days=6)
+
+
+def collect_week(snapshot, monday):
+    """从快照中取出一周的事件 {日期: [事件, ...]}，没有事件的日期为空列表"""
+    week = {}
+    for offset in range(7):
+        date_str = (monday + timedelta(days=offset)).strftime("%Y-%m-%d")
+        week[date_str] = [dict(event) for event in snapshot.get(date_str)]
+    return week
+
+
+def week_fingerprint(week_events):
+    """一周事件的指纹：规范化JSON的SHA1"""
+    canonical = json.dumps(week_events, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+class PreOptimizer:
+    """订阅日程存储，在后台为下周准备优化结果
+
+    optimize(下周事件) 返回优化后的 {日期: [事件]}，失败时返回 None；在后台线程中调用，不能操作界面。
+    off_peak_hours 为允许在下周未修改时也预优化的小时集合（本地时间）。
+    """
+
+    def __init__(self, store, optimize, settle=SETTLE_SECONDS, min_interval=MIN_INTERVAL_SECONDS,
+                 off_peak_hours=frozenset()):
+        self.store = store
+        self.optimize = optimize
+        self.settle = settle
+        self.min_interval = min_interval
+        self.off_peak_hours = frozenset(off_peak_hours)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        # 最后一次修改下周的时间；None 表示启动后还没有修改
+        self._last_edit = None
+        self._last_run = None
+        # 下周自上次预优化以来是否被修改过
+        self._armed = False
+        # 最近一次（后台或前台）优化过的下周指纹，相同内容不再重复优化
+        self._attempted = None
+        # (指纹, 优化结果)
+        self._ready = None
+        self.stats = {"runs": 0, "hits": 0, "misses": 0, "invalidated": 0}
+
+    def start(self):
+        if self._thread is None:
+            self.store.subscribe(self.on_commit)
+            self._thread = threading.Thread(target=self._run, name="pre-optimizer", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def on_commit(self, previous, snapshot, changed_dates):
+        """存储监听器：下周有修改时使结果失效，并重新计时等待编辑停止"""
+        monday, sunday = next_week_range()
+        first, last = monday.strftime("%Y-%m-%d"), sunday.strftime("%Y-%m-%d")
+        if not any(first <= date_str <= last for date_str in changed_dates):
+            return
+        with self._lock:
+            self._last_edit = time.monotonic()
+            self._armed = True
+            if self._ready is not None:
+                self._ready = None
+                self.stats["invalidated"] += 1
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.settle)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self._maybe_optimize()
+            except Exception as e:
+                print(f"后台预优化失败: {str(e)}")
+
+    def _maybe_optimize(self):
+        now = time.monotonic()
+        with self._lock:
+            if not self._armed and datetime.now().hour not in self.off_peak_hours:
+                return  # 下周没有修改，且不在低峰时段
+            if self._last_edit is not None and now - self._last_edit < self.settle:
+                return  # 仍在编辑
+            if self._last_run is not None and now - self._last_run < self.min_interval:
+                return
+        monday, _ = next_week_range()
+        week = collect_week(self.store.snapshot(), monday)
+        if not any(week.values()):
+            return
+        fingerprint = week_fingerprint(week)
+        with self._lock:
+            self._armed = False
+            if fingerprint == self._attempted:
+                return
+            self._attempted = fingerprint
+            self._last_run = now
+            self.stats["runs"] += 1
+        print("后台预优化下周日程...")
+        result = self.optimize(copy.deepcopy(week))
+        if not result:
+            return
+        # 优化期间下周被修改时丢弃结果，等待下一轮
+        if week_fingerprint(collect_week(self.store.snapshot(), monday)) != fingerprint:
+            return
+        with self._lock:
+            self._ready = (fingerprint, result)
+        print("下周日程预优化完成")
+
+    def take(self, week_events):
+        """下周内容与预优化时一致时返回优化结果的副本，否则返回 None"""
+        fingerprint = week_fingerprint(week_events)
+        with self._lock:
+            if self._ready is not None and self._ready[0] == fingerprint:
+                self.stats["hits"] += 1
+                return copy.deepcopy(self._ready[1])
+            self.stats["misses"] += 1
+            return None
+
+    def note_optimized(self, week_events):
+        """记录前台刚优化（并应用）过的下周内容，后台不再对它重复优化"""
+        with self._lock:
+            self._attempted = week_fingerprint(week_events)
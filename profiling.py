@@ -0,0 +1,297 @@
+"""可选的性能剖析：采样剖析器、界面卡顿检测和按需的内存快照
+
+默认关闭，设置 PROFILE=1 启用；关闭时装饰器原样返回函数、不启动任何线程，几乎没有开销。
+- 采样剖析：被 profiled() 包装的界面回调和 Flask 请求执行期间，后台线程每 PROFILE_INTERVAL_MS 毫秒
+  记录一次该线程的调用栈，按 flamegraph.pl / speedscope 可读取的折叠格式（"帧;帧;帧 次数"）
+  定期写入 PROFILE_DIR/profile-<进程号>.folded
+- 卡顿检测：界面主循环每 HEARTBEAT_MS 毫秒通过 root.after 打一次心跳，超过 STALL_THRESHOLD_MS 毫秒
+  没有心跳时把主线程当前的调用栈写入 PROFILE_DIR/stalls.log
+- 内存快照：memory_snapshot() 首次调用时开始 tracemalloc 跟踪，之后每次返回与上次相比增长最多的分配位置
+"""
+import atexit
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from functools import wraps
+from schedule_store import BASE_DIR
+from xlsx_stream import atomic_file
+
+HEARTBEAT_MS = 100
+# 折叠栈文件的写入间隔（秒）
+FLUSH_INTERVAL = 5.0
+# 超过该耗时（秒）的被剖析调用会打印一行日志
+SLOW_CALL_SECONDS = 0.2
+MAX_STACK_DEPTH = 64
+
+
+# 配置在使用时才读取环境变量：本模块可能在 load_dotenv() 之前被导入
+def enabled():
+    return os.getenv("PROFILE", "0") == "1"
+
+
+def profile_dir():
+    return os.getenv("PROFILE_DIR") or os.path.join(BASE_DIR, "profiles")
+
+
+def sample_interval():
+    return int(os.getenv("PROFILE_INTERVAL_MS", 5)) / 1000
+
+
+def stall_threshold():
+    return int(os.getenv("STALL_THRESHOLD_MS", 500)) / 1000
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def collapse_stack(frame, root=None):
+    """把调用栈折叠为 "根;外层;...;内层" 形式的一行"""
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    if root:
+        labels.append(root)
+    return ";".join(reversed(labels))
+
+
+class SamplingProfiler:
+    """只在被标记的代码段执行期间采样对应线程的调用栈"""
+
+    def __init__(self, output_dir=None, interval=None):
+        self.output_dir = output_dir or profile_dir()
+        self.interval = interval or sample_interval()
+        self._lock = threading.Lock()
+        self._active = {}  # 线程ID -> 正在执行的代码段名称列表（可嵌套）
+        self._counts = Counter()
+        self._dirty = False
+        self._thread = None
+
+    @property
+    def output_path(self):
+        return os.path.join(self.output_dir, f"profile-{os.getpid()}.folded")
+
+    def _ensure_started(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def enter(self, name):
+        thread_id = threading.get_ident()
+        with self._lock:
+            self._ensure_started()
+            self._active.setdefault(thread_id, []).append(name)
+        return thread_id
+
+    def exit(self, thread_id):
+        with self._lock:
+            names = self._active.get(thread_id)
+            if names:
+                names.pop()
+                if not names:
+                    del self._active[thread_id]
+
+    def sample(self):
+        """记录所有活动代码段所在线程的当前调用栈"""
+        with self._lock:
+            active = {thread_id: names[0] for thread_id, names in self._active.items()}
+        if not active:
+            return
+        frames = sys._current_frames()
+        stacks = [collapse_stack(frames[thread_id], name) for thread_id, name in active.items()
+                  if thread_id in frames]
+        with self._lock:
+            self._counts.update(stacks)
+            self._dirty = True
+
+    def _run(self):
+        next_flush = time.monotonic() + FLUSH_INTERVAL
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.sample()
+                if time.monotonic() >= next_flush:
+                    next_flush = time.monotonic() + FLUSH_INTERVAL
+                    self.flush()
+            except Exception as e:
+                print(f"采样剖析出错: {str(e)}")
+
+    def flush(self):
+        """把累计的折叠栈原子地写入文件"""
+        with self._lock:
+            if not self._dirty:
+                return
+            lines = [f"{stack} {count}\n" for stack, count in self._counts.most_common()]
+            self._dirty = False
+        with atomic_file(self.output_path) as f:
+            f.write("".join(lines).encode("utf-8"))
+
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+
+def get_profiler():
+    """启用剖析时返回全局的采样剖析器（首次调用时创建），否则返回 None"""
+    global _profiler
+    if not enabled():
+        return None
+    with _profiler_lock:
+        if _profiler is None:
+            _profiler = SamplingProfiler()
+        return _profiler
+
+
+def profiled(name=None):
+    """装饰器：剖析函数执行期间的调用栈；未启用时原样返回函数"""
+    def decorator(func):
+        profiler = get_profiler()
+        if profiler is None:
+            return func
+        label = name or func.__qualname__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            thread_id = profiler.enter(label)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.exit(thread_id)
+                elapsed = time.perf_counter() - started
+                if elapsed >= SLOW_CALL_SECONDS:
+                    print(f"[profile] {label} 耗时 {elapsed * 1000:.0f}ms")
+        return wrapper
+    return decorator
+
+
+def instrument(obj, method_names, prefix="tk"):
+    """把对象上的若干方法替换为被剖析的版本（需在绑定到控件之前调用）"""
+    if get_profiler() is None:
+        return
+    for method_name in method_names:
+        setattr(obj, method_name, profiled(f"{prefix}:{method_name}")(getattr(obj, method_name)))
+
+
+def init_app(app):
+    """为 Flask 的每个请求开启剖析，代码段以 "flask:<端点>" 命名"""
+    profiler = get_profiler()
+    if profiler is None:
+        return
+    from flask import g, request
+
+    @app.before_request
+    def _start_profile():
+        g.profile_thread = profiler.enter(f"flask:{request.endpoint}")
+        g.profile_started = time.perf_counter()
+
+    @app.teardown_request
+    def _stop_profile(exc=None):
+        thread_id = g.pop("profile_thread", None)
+        if thread_id is None:
+            return
+        profiler.exit(thread_id)
+        elapsed = time.perf_counter() - g.pop("profile_started")
+        if elapsed >= SLOW_CALL_SECONDS:
+            print(f"[profile] {request.method} {request.path} 耗时 {elapsed * 1000:.0f}ms")
+
+
+class StallDetector:
+    """界面主循环卡顿检测：root.after 心跳，后台线程发现心跳中断时记录主线程调用栈"""
+
+    def __init__(self, root, threshold=None, output_dir=None):
+        self.root = root
+        self.threshold = threshold or stall_threshold()
+        self.log_path = os.path.join(output_dir or profile_dir(), "stalls.log")
+        self.main_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._reported = False
+        self.stalls = 0
+
+    def start(self):
+        self.root.after(HEARTBEAT_MS, self._beat)
+        threading.Thread(target=self._watch, name="stall-detector", daemon=True).start()
+        return self
+
+    def _beat(self):
+        now = time.monotonic()
+        if self._reported:
+            self._log(f"界面恢复响应，共卡顿 {(now - self._last_beat) * 1000:.0f}ms\n")
+            self._reported = False
+        self._last_beat = now
+        self.root.after(HEARTBEAT_MS, self._beat)
+
+    def _watch(self):
+        while True:
+            time.sleep(HEARTBEAT_MS / 1000)
+            blocked = time.monotonic() - self._last_beat
+            if blocked < self.threshold or self._reported:
+                continue
+            frame = sys._current_frames().get(self.main_thread_id)
+            if frame is None:
+                return
+            # 每次卡顿只记录一次调用栈
+            self._reported = True
+            self.stalls += 1
+            stack = "".join(traceback.format_stack(frame))
+            self._log(f"{time.strftime('%Y-%m-%d %H:%M:%S')} 界面主循环已 {blocked * 1000:.0f}ms 未响应，"
+                      f"主线程调用栈:\n{stack}{collapse_stack(frame, 'stall')} 1\n")
+
+    def _log(self, text):
+        print(f"[stall] {text.splitlines()[0]}")
+        try:
+            os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(text)
+        except OSError as e:
+            print(f"写入卡顿日志失败: {str(e)}")
+
+
+def start_stall_detector(root):
+    """启用剖析时开始检测界面卡顿，返回检测器或 None"""
+    if not enabled():
+        return None
+    return StallDetector(root).start()
+
+
+_memory_lock = threading.Lock()
+_last_memory_snapshot = None
+
+
+def memory_snapshot(limit=20):
+    """按需的内存快照：首次调用开始 tracemalloc 跟踪，之后返回与上次快照相比增长最多的分配位置
+
+    返回 {"tracing", "current", "peak", "top": [...]}，同时写入 PROFILE_DIR/memory-<进程号>.txt。
+    """
+    import tracemalloc
+    global _last_memory_snapshot
+
+    with _memory_lock:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+            _last_memory_snapshot = tracemalloc.take_snapshot()
+            return {"tracing": True, "started": True, "current": 0, "peak": 0, "top": []}
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        stats = snapshot.compare_to(_last_memory_snapshot, "lineno")[:limit]
+        _last_memory_snapshot = snapshot
+        current, peak = tracemalloc.get_traced_memory()
+    top = [str(stat) for stat in stats]
+    output_dir = profile_dir()
+    path = os.path.join(output_dir, f"memory-{os.getpid()}.txt")
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} 当前 {current} 字节，峰值 {peak} 字节\n")
+            f.write("".join(f"  {line}\n" for line in top))
+    except OSError as e:
+        print(f"写入内存快照失败: {str(e)}")
+    return {"tracing": True, "started": False, "current": current, "peak": peak, "top": top}
@@ -0,0 +1,142 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# 时间单位对应的秒数
+_UNIT_SECONDS = {
+    "second": 1,
+    "minute": 60,
+    "hour": 3600,
+    "day": 86400,
+}
+
+# 默认限流预算：普通读请求与调用LLM的昂贵请求分开计数
+DEFAULT_BUDGETS = {
+    "default": "1000 per day; 100 per hour",
+    "llm": "50 per day; 10 per hour; 2 per minute",
+    # 长轮询接口会被客户端反复调用，单独计数
+    "poll": "5000 per day; 600 per hour",
+}
+
+
+def parse_rate(rate_str):
+    """将"100 per hour"格式的限流字符串解析为(容量, 每秒补充令牌数)"""
+    match = re.match(r"\s*(\d+)\s*(?:per|/)\s*(second|minute|hour|day)s?\s*$", rate_str)
+    if not match:
+        raise ValueError(f"无法解析的限流规则: {rate_str}")
+    capacity = int(match.group(1))
+    period = _UNIT_SECONDS[match.group(2)]
+    return capacity, capacity / period
+
+
+def parse_budget(budget_str):
+    """解析以分号分隔的多条限流规则"""
+    return [parse_rate(part) for part in budget_str.split(";") if part.strip()]
+
+
+class TokenBucketLimiter:
+    """基于SQLite的令牌桶限流器，多个工作进程共享同一个数据库文件"""
+
+    def __init__(self, db_path, key_func, budgets=None):
+        self.db_path = db_path
+        self.key_func = key_func
+        self.budgets = {}
+        for name, budget_str in (budgets or DEFAULT_BUDGETS).items():
+            # 允许通过环境变量覆盖，例如 RATE_LIMIT_LLM="10 per hour; 50 per day"
+            budget_str = os.getenv(f"RATE_LIMIT_{name.upper()}", budget_str)
+            self.budgets[name] = parse_budget(budget_str)
+        self._local = threading.local()
+        self._init_db()
+
+    def _connect(self):
+        """每个线程使用独立的数据库连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+
+    def hit(self, budget, identity, cost=1):
+        """尝试从预算的所有令牌桶中各取出cost个令牌
+
+        返回 (是否允许, 建议重试等待秒数)。多个桶在同一事务中检查，
+        只有全部满足时才扣减，避免某个桶被白白消耗。
+        """
+        buckets = self.budgets.get(budget) or self.budgets["default"]
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            updates = []
+            retry_after = 0.0
+            for capacity, rate in buckets:
+                key = f"{budget}:{capacity}/{rate:.6g}:{identity}"
+                row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    tokens = float(capacity)
+                else:
+                    tokens = min(float(capacity), row[0] + (now - row[1]) * rate)
+                if tokens < cost:
+                    retry_after = max(retry_after, (cost - tokens) / rate)
+                updates.append((key, tokens))
+
+            allowed = retry_after == 0.0
+            for key, tokens in updates:
+                conn.execute(
+                    "INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                    (key, tokens - cost if allowed else tokens, now)
+                )
+            conn.execute("COMMIT")
+            return allowed, retry_after
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def limit(self, budget):
+        """路由装饰器：为该路由指定独立的限流预算"""
+        def decorator(func):
+            func._rate_budget = budget
+            return func
+        return decorator
+
+    def exempt(self, func):
+        """路由装饰器：该路由不参与限流"""
+        func._rate_budget = None
+        return func
+
+    def init_app(self, app):
+        """在每个请求前按路由对应的预算检查限流"""
+        from flask import request, jsonify
+
+        @app.before_request
+        def _check_rate_limit():
+            view = app.view_functions.get(request.endpoint)
+            if view is None:
+                return None
+            budget = getattr(view, "_rate_budget", "default")
+            if budget is None:
+                return None
+            try:
+                allowed, retry_after = self.hit(budget, self.key_func())
+            except sqlite3.Error as e:
+                # 限流存储异常时放行请求，避免影响正常服务
+                print(f"限流检查失败: {str(e)}")
+                return None
+            if not allowed:
+                response = jsonify({"error": "请求过于频繁，请稍后再试", "budget": budget})
+                response.status_code = 429
+                response.headers["Retry-After"] = str(int(retry_after) + 1)
+                return response
+            return None
+
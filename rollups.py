@@ -0,0 +1,284 @@
+"""日程统计汇总（按日 / 周 / 月 / 星期）
+
+每一天汇总为一个固定长度的向量：各完成度的事件数、已安排分钟数、是否有事件、评分合计、评分次数。
+周、月、星期的汇总表是这些日向量之和：
+  - 首次建立时用 numpy 向量化地一次算完
+  - 之后每次提交只对变化的日期计算新旧向量之差，加到所属的周、月、星期上
+查询只读汇总表，耗时与天数（或周数、月数）成正比，与事件数量无关。
+反馈评分读取日程工作簿同目录下的 反馈.xlsx（列: 日期、评分、评论），文件变化时按天增量更新。
+"""
+import os
+import threading
+from datetime import datetime, timedelta
+from schedule_store import EMPTY_SNAPSHOT, iter_rows, parse_date, parse_time_range
+
+COMPLETION_STATES = ("未开始", "进行中", "已完成", "延期", "取消", "待评价")
+OTHER_STATE = "其他"
+STATES = COMPLETION_STATES + (OTHER_STATE,)
+STATE_INDEX = {state: i for i, state in enumerate(STATES)}
+# 日向量中各统计量的位置
+MINUTES = len(STATES)
+ACTIVE_DAYS = MINUTES + 1
+RATING_SUM = MINUTES + 2
+RATING_COUNT = MINUTES + 3
+VECTOR_SIZE = MINUTES + 4
+
+PERIODS = ("day", "week", "month", "weekday")
+FEEDBACK_FILE_NAME = "反馈.xlsx"
+DEFAULT_RATING = 3.0
+
+
+def week_key(date_str):
+    """ISO周编号，如 2024-W05（字符串顺序即时间顺序）"""
+    year, week, _ = datetime.strptime(date_str, "%Y-%m-%d").isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def period_keys(date_str):
+    """某一天所属的 (周, 月, 星期几[0=周一])"""
+    weekday = datetime.strptime(date_str, "%Y-%m-%d").weekday()
+    return week_key(date_str), date_str[:7], weekday
+
+
+def event_minutes(event):
+    """事件占用的分钟数；已取消或时间无法解析（如"全天"）的事件不计入"""
+    if event.get("completion") == "取消":
+        return 0
+    time_range = parse_time_range(event["time"])
+    return time_range[1] - time_range[0] if time_range else 0
+
+
+def day_vector(day_events, rating=None):
+    """把一天的事件和评分汇总为日向量，没有任何数据时返回 None"""
+    if not day_events and rating is None:
+        return None
+    vector = [0] * VECTOR_SIZE
+    for event in day_events or ():
+        vector[STATE_INDEX.get(event.get("completion"), STATE_INDEX[OTHER_STATE])] += 1
+        vector[MINUTES] += event_minutes(event)
+    if day_events:
+        vector[ACTIVE_DAYS] = 1
+    if rating is not None:
+        vector[RATING_SUM] = rating
+        vector[RATING_COUNT] = 1
+    return vector
+
+
+def read_feedback(file_path):
+    """读取反馈工作簿，返回 {日期: 评分}（解析规则与 flask_app.parse_excel_feedback 相同）"""
+    ratings = {}
+    if not os.path.exists(file_path):
+        return ratings
+    for row in iter_rows(file_path):
+        date_str = parse_date(row.get("日期"))
+        if not date_str:
+            continue
+        try:
+            ratings[date_str] = float(row.get("评分"))
+        except (TypeError, ValueError):
+            ratings[date_str] = DEFAULT_RATING
+    return ratings
+
+
+def vector_to_row(key, vector):
+    """汇总向量转换为API返回的记录"""
+    counts = {state: int(vector[i]) for i, state in enumerate(STATES) if vector[i]}
+    total = sum(counts.values())
+    # 完成率不计已取消的事件
+    effective = total - counts.get("取消", 0)
+    return {
+        "period": key,
+        "events": total,
+        "counts": counts,
+        "completion_rate": round(counts.get("已完成", 0) / effective, 4) if effective else None,
+        "booked_minutes": int(vector[MINUTES]),
+        "active_days": int(vector[ACTIVE_DAYS]),
+        "avg_rating": round(vector[RATING_SUM] / vector[RATING_COUNT], 2) if vector[RATING_COUNT] else None,
+        "rating_count": int(vector[RATING_COUNT]),
+    }
+
+
+class Rollups:
+    """单个日程存储的统计汇总表，通过 ScheduleStore.subscribe() 随每次提交增量更新"""
+
+    def __init__(self, feedback_path=None):
+        self.feedback_path = feedback_path
+        self._lock = threading.RLock()
+        self._days = {}
+        self._tables = {"week": {}, "month": {}, "weekday": {}}
+        self._ratings = {}
+        self._feedback_signature = None
+        self._snapshot = EMPTY_SNAPSHOT
+
+    def rebuild(self, snapshot):
+        """基于快照重新计算全部汇总表（向量化）"""
+        import numpy as np
+
+        with self._lock:
+            # 包含归档层中的历史日程
+            days = dict(snapshot.iter_days())
+            dates = sorted(set(days) | set(self._ratings))
+            n_days = len(dates)
+            # 展开为逐事件的数组：所属日期序号、完成度序号、分钟数
+            day_index, state_index, minutes = [], [], []
+            for i, date_str in enumerate(dates):
+                for event in days.get(date_str, ()):
+                    day_index.append(i)
+                    state_index.append(STATE_INDEX.get(event.get("completion"), STATE_INDEX[OTHER_STATE]))
+                    minutes.append(event_minutes(event))
+            day_index = np.asarray(day_index, dtype=np.int64)
+            state_index = np.asarray(state_index, dtype=np.int64)
+
+            matrix = np.zeros((n_days, VECTOR_SIZE), dtype=np.float64)
+            counts = np.bincount(day_index * len(STATES) + state_index, minlength=n_days * len(STATES))
+            matrix[:, :len(STATES)] = counts.reshape(n_days, len(STATES))
+            matrix[:, MINUTES] = np.bincount(day_index, weights=np.asarray(minutes, dtype=np.float64),
+                                             minlength=n_days)
+            matrix[:, ACTIVE_DAYS] = matrix[:, :len(STATES)].sum(axis=1) > 0
+            for i, date_str in enumerate(dates):
+                rating = self._ratings.get(date_str)
+                if rating is not None:
+                    matrix[i, RATING_SUM] = rating
+                    matrix[i, RATING_COUNT] = 1
+
+            keys = [period_keys(date_str) for date_str in dates]
+            tables = {}
+            for position, name in enumerate(("week", "month", "weekday")):
+                labels, inverse = np.unique(np.asarray([k[position] for k in keys] or [0]), return_inverse=True)
+                if not n_days:
+                    tables[name] = {}
+                    continue
+                sums = np.zeros((len(labels), VECTOR_SIZE), dtype=np.float64)
+                np.add.at(sums, inverse.reshape(-1), matrix)
+                tables[name] = {label.item(): row for label, row in zip(labels, sums.tolist())}
+
+            self._days = dict(zip(dates, matrix.tolist()))
+            self._tables = tables
+            self._snapshot = snapshot
+
+    def on_commit(self, previous, snapshot, changed_dates):
+        """存储监听器：只重新汇总变化的日期，并把差值加到所属的周、月、星期"""
+        with self._lock:
+            self._snapshot = snapshot
+            for date_str in changed_dates:
+                self._update_day(date_str, snapshot.get(date_str))
+
+    def _update_day(self, date_str, day_events):
+        new = day_vector(day_events, self._ratings.get(date_str))
+        old = self._days.get(date_str)
+        if new is None:
+            self._days.pop(date_str, None)
+        else:
+            self._days[date_str] = new
+        old = old or [0] * VECTOR_SIZE
+        new = new or [0] * VECTOR_SIZE
+        delta = [n - o for n, o in zip(new, old)]
+        if not any(delta):
+            return
+        for name, key in zip(("week", "month", "weekday"), period_keys(date_str)):
+            table = self._tables[name]
+            row = table.get(key)
+            if row is None:
+                row = table[key] = [0] * VECTOR_SIZE
+            for i, value in enumerate(delta):
+                row[i] += value
+            if not any(row):
+                del table[key]
+
+    def load_feedback(self):
+        """反馈工作簿有变化时重新读取，只更新评分变化的日期；只需一次 stat 即可确认未变化"""
+        if not self.feedback_path:
+            return
+        try:
+            stat = os.stat(self.feedback_path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            signature = None
+        if signature == self._feedback_signature:
+            return
+        try:
+            ratings = read_feedback(self.feedback_path) if signature else {}
+        except Exception as e:
+            print(f"读取反馈工作簿失败: {str(e)}")
+            return
+        with self._lock:
+            changed = [date_str for date_str in set(ratings) | set(self._ratings)
+                       if ratings.get(date_str) != self._ratings.get(date_str)]
+            self._ratings = ratings
+            self._feedback_signature = signature
+            for date_str in changed:
+                self._update_day(date_str, self._snapshot.get(date_str))
+
+    def daily(self, start, end):
+        """逐日汇总 [(日期, 日向量或None)]，start/end 为 YYYY-MM-DD 闭区间"""
+        self.load_feedback()
+        current = datetime.strptime(start, "%Y-%m-%d")
+        last = datetime.strptime(end, "%Y-%m-%d")
+        result = []
+        with self._lock:
+            while current <= last:
+                date_str = current.strftime("%Y-%m-%d")
+                result.append((date_str, self._days.get(date_str)))
+                current += timedelta(days=1)
+        return result
+
+    def recent_ratings(self, end, days=14):
+        """end（YYYY-MM-DD，不含）之前 days 天内的反馈评分 [(日期, 评分)]"""
+        self.load_feedback()
+        last = datetime.strptime(end, "%Y-%m-%d")
+        result = []
+        with self._lock:
+            for offset in range(days, 0, -1):
+                date_str = (last - timedelta(days=offset)).strftime("%Y-%m-%d")
+                if date_str in self._ratings:
+                    result.append((date_str, self._ratings[date_str]))
+        return result
+
+    def summary(self, period, start=None, end=None):
+        """按周期返回汇总记录列表
+
+        day/week/month 返回与 [start, end] 相交的各个周期（首尾的周、月按整体统计）；
+        weekday 不指定范围时直接读取星期汇总表，指定范围时由范围内的日汇总相加。
+        """
+        if period not in PERIODS:
+            raise ValueError(f"period 只支持 {', '.join(PERIODS)}")
+        self.load_feedback()
+        with self._lock:
+            if period == "day":
+                rows = [(d, v) for d, v in sorted(self._days.items())
+                        if (not start or d >= start) and (not end or d <= end)]
+            elif period == "weekday" and (start or end):
+                sums = {}
+                for date_str, vector in self._days.items():
+                    if (start and date_str < start) or (end and date_str > end):
+                        continue
+                    row = sums.setdefault(period_keys(date_str)[2], [0] * VECTOR_SIZE)
+                    for i, value in enumerate(vector):
+                        row[i] += value
+                rows = sorted(sums.items())
+            else:
+                low = high = None
+                if period == "week":
+                    low, high = (week_key(start) if start else None), (week_key(end) if end else None)
+                elif period == "month":
+                    low, high = (start[:7] if start else None), (end[:7] if end else None)
+                rows = [(k, v) for k, v in sorted(self._tables[period].items())
+                        if (low is None or k >= low) and (high is None or k <= high)]
+            return [vector_to_row(key, list(vector)) for key, vector in rows]
+
+
+_rollups = {}
+_rollups_lock = threading.Lock()
+
+
+def get_rollups(store):
+    """获取存储对应的统计汇总（首次调用时建立并订阅存储的变更）"""
+    with _rollups_lock:
+        rollups = _rollups.get(store.file_path)
+        if rollups is None:
+            rollups = Rollups(os.path.join(os.path.dirname(store.file_path), FEEDBACK_FILE_NAME))
+            rollups.load_feedback()
+            # 建立与订阅在存储的同一把锁内完成，期间的提交不会遗漏
+            store.subscribe(rollups.on_commit, initialize=rollups.rebuild)
+            _rollups[store.file_path] = rollups
+        return rollups
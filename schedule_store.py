@@ -0,0 +1,900 @@
+import csv
+import hashlib
+import heapq
+import itertools
+import os
+import re
+import sys
+import threading
+from datetime import datetime, date, time, timedelta
+from collections import deque
+from functools import lru_cache
+from types import MappingProxyType
+from filelock import FileLock
+from xlsx_stream import write_xlsx_rows
+import archive
+
+if getattr(sys, 'frozen', False):
+    # 打包后的环境：使用 sys.executable 获取 exe 路径
+    BASE_DIR = os.path.dirname(sys.executable)  # main.exe 所在目录
+else:
+    # 开发环境：使用 __file__ 获取脚本路径
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 工作簿中的列顺序（与caption.py保存的格式一致）
+EVENT_COLUMNS = ["日期", "时间", "任务", "完成度"]
+# 变更流保留的版本数
+CHANGE_LOG_SIZE = 1000
+
+
+def normalize_single_time(time_str):
+    """标准化单个时间点格式"""
+    # 尝试解析时间格式
+    if re.match(r"\d{1,2}:\d{2}", time_str):
+        # 已经是标准格式
+        return time_str
+
+    # 尝试添加分钟部分
+    if re.match(r"\d{1,2}$", time_str):
+        return f"{time_str}:00"
+
+    # 其他格式直接返回
+    return time_str
+
+
+def normalize_time(time_str):
+    """标准化时间格式（与caption.py相同）"""
+    if isinstance(time_str, time):
+        return time_str.strftime("%H:%M")
+    if not isinstance(time_str, str):
+        return ""
+
+    # 尝试统一时间分隔符
+    time_str = time_str.replace("：", ":")  # 替换中文冒号
+    time_str = time_str.replace("—", "-")   # 替换中文破折号
+    time_str = time_str.replace("~", "-")   # 替换波浪号
+
+    # 确保时间段分隔符统一
+    if "-" in time_str:
+        parts = time_str.split("-")
+        if len(parts) == 2:
+            start = normalize_single_time(parts[0].strip())
+            end = normalize_single_time(parts[1].strip())
+            return f"{start} - {end}"
+
+    # 处理单个时间点
+    return normalize_single_time(time_str.strip())
+
+
+def time_to_minutes(time_str):
+    """将时间字符串转换为分钟数用于排序"""
+    # 处理时间段（取开始时间）
+    if " - " in time_str:
+        time_str = time_str.split(" - ")[0].strip()
+
+    # 尝试解析时间
+    try:
+        if ":" in time_str:
+            parts = time_str.split(":")
+            hours = int(parts[0])
+            minutes = int(parts[1]) if len(parts) > 1 else 0
+            return hours * 60 + minutes
+        elif time_str.isdigit():
+            return int(time_str) * 60
+        else:
+            return 0
+    except:
+        return 0
+
+
+@lru_cache(maxsize=4096)
+def parse_time_range(time_str):
+    """将事件时间解析为 (开始分钟, 结束分钟)
+
+    单个时间点视为持续60分钟；"全天"等无法解析的时间返回 None。
+    同样的时间字符串大量重复出现，结果会被缓存。
+    """
+    normalized = normalize_time(time_str)
+    parts = normalized.split(" - ") if " - " in normalized else [normalized]
+
+    def to_minutes(part):
+        match = re.match(r"^(\d{1,2}):(\d{2})(?::\d{2})?$", part.strip())
+        if not match:
+            return None
+        hours, minutes = int(match.group(1)), int(match.group(2))
+        if hours > 24 or minutes > 59:
+            return None
+        return min(hours * 60 + minutes, 24 * 60)
+
+    start = to_minutes(parts[0])
+    if start is None:
+        return None
+    end = to_minutes(parts[1]) if len(parts) == 2 else None
+    if end is None:
+        end = min(start + 60, 24 * 60)
+    elif end < start:
+        # 跨越午夜的事件截断到当天结束
+        end = 24 * 60
+    return start, end
+
+
+def format_minutes(minutes):
+    """将分钟数格式化为HH:MM"""
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def parse_date(value):
+    """将工作簿/CSV中的日期解析为YYYY-MM-DD格式"""
+    try:
+        # 处理datetime/date对象（包括pandas.Timestamp）
+        if isinstance(value, (datetime, date)):
+            return value.strftime("%Y-%m-%d")
+
+        # Excel序列号日期
+        if isinstance(value, (int, float)):
+            base_date = datetime(1899, 12, 30)
+            return (base_date + timedelta(days=float(value))).strftime("%Y-%m-%d")
+
+        if isinstance(value, str):
+            value = value.strip()
+            # 尝试"年.月.日"格式
+            match = re.match(r"(\d{4})[./-](\d{1,2})[./-](\d{1,2})(?:\s|$)", value)
+            if match:
+                year, month, day = (int(part) for part in match.groups())
+                return datetime(year, month, day).strftime("%Y-%m-%d")
+
+        return None
+    except Exception as e:
+        print(f"解析日期错误: {value} - {str(e)}")
+        return None
+
+
+def format_excel_date(date_str):
+    """将日期格式化为年.月.日格式"""
+    try:
+        if isinstance(date_str, str) and re.match(r"\d{4}-\d{2}-\d{2}", date_str):
+            year, month, day = date_str.split('-')
+            return f"{int(year)}.{int(month)}.{int(day)}"
+        return date_str
+    except Exception as e:
+        print(f"格式化日期错误: {date_str} - {str(e)}")
+        return date_str
+
+
+def row_to_event(row):
+    """将一行记录转换为 (日期, 事件)，日期无法解析时返回 None"""
+    parsed_date = parse_date(row.get("日期"))
+    if not parsed_date:
+        return None
+    task = row.get("任务")
+    completion = row.get("完成度")
+    event = {
+        "time": normalize_time(row.get("时间") if row.get("时间") is not None else ""),
+        "task": str(task).strip() if task not in (None, "") else "",
+        "completion": str(completion).strip() if completion not in (None, "") else "未开始"
+    }
+    return parsed_date, event
+
+
+def iter_xlsx_rows(file_path):
+    """以只读模式逐行读取工作簿，每行返回 {列名: 值}，不会把整个文件载入内存"""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [str(cell).strip() if cell is not None else "" for cell in header]
+        for values in rows:
+            if values is None or all(value is None for value in values):
+                continue
+            yield dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+def iter_csv_rows(file_path):
+    """逐行读取CSV文件，自动识别UTF-8与GBK编码"""
+    encoding = "utf-8-sig"
+    with open(file_path, "rb") as f:
+        head = f.read(64 * 1024)
+    try:
+        head.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        encoding = "gbk"
+
+    with open(file_path, newline="", encoding=encoding, errors="replace") as f:
+        for row in csv.DictReader(f):
+            yield {(key or "").strip(): value for key, value in row.items()}
+
+
+def iter_rows(file_path):
+    """根据扩展名选择逐行读取方式"""
+    if file_path.lower().endswith(".csv"):
+        return iter_csv_rows(file_path)
+    return iter_xlsx_rows(file_path)
+
+
+def read_workbook(file_path):
+    """从工作簿读取全部事件，返回 {日期: [事件, ...]}"""
+    events = {}
+    if not os.path.exists(file_path):
+        return events
+    for index, row in enumerate(iter_rows(file_path)):
+        missing_columns = [col for col in EVENT_COLUMNS if col not in row] if index == 0 else None
+        if missing_columns:
+            raise ValueError(f"工作簿缺少必要列: {', '.join(missing_columns)}")
+        parsed = row_to_event(row)
+        if not parsed:
+            print(f"跳过无法解析的日期: {row.get('日期')} (行 {index+2})")
+            continue
+        date_str, event = parsed
+        events.setdefault(date_str, []).append(event)
+    for date_str in events:
+        events[date_str].sort(key=lambda x: time_to_minutes(x["time"]))
+    return events
+
+
+def write_workbook(file_path, events, extra_rows=()):
+    """将 {日期: [事件, ...]} 按日期顺序流式写入工作簿（原子替换）
+
+    extra_rows 为原样写在末尾的行（如无法解析的原始行），返回写入的行数。
+    """
+    rows = ([format_excel_date(date_str), event["time"], event["task"], event["completion"]]
+            for date_str in sorted(events) for event in events[date_str])
+    return write_xlsx_rows(file_path, EVENT_COLUMNS, itertools.chain(rows, extra_rows))
+
+
+def freeze_event(event):
+    """返回事件的只读视图"""
+    if isinstance(event, MappingProxyType):
+        return event
+    return MappingProxyType(dict(event))
+
+
+def merge_day_events(base, ours, theirs):
+    """三方合并一天的事件：在对方的当前版本上重做我方相对 base 的删除和新增
+
+    base 为我方读取时的事件，ours 为我方修改后的事件，theirs 为对方修改后的当前事件。
+    """
+    base, ours = [dict(event) for event in base], [dict(event) for event in ours]
+    removed = [event for event in base if event not in ours]
+    merged = [dict(event) for event in theirs]
+    for event in removed:
+        if event in merged:
+            merged.remove(event)
+    for event in ours:
+        if event not in base and event not in merged:
+            merged.append(event)
+    return sorted(merged, key=lambda x: time_to_minutes(x["time"]))
+
+
+class ConflictError(Exception):
+    """按版本提交时，某些日期已被其他写入者修改
+
+    conflicts 为 {日期: (期望的版本, 当前版本)}，changes 为被拒绝的整组修改，
+    snapshot 为检测到冲突时的当前快照，调用方可据此合并后重新提交。
+    """
+
+    def __init__(self, conflicts, changes, snapshot):
+        super().__init__(f"以下日期已被其他来源修改: {', '.join(sorted(conflicts))}")
+        self.conflicts = conflicts
+        self.changes = changes
+        self.snapshot = snapshot
+
+
+class ScheduleSnapshot:
+    """某一版本的只读日程快照
+
+    days 为 {日期: (只读事件, ...)}，未修改的日期在相邻版本之间共享同一个元组，
+    因此发布新版本只需复制日期索引，不会复制事件本身。
+    day_versions 为 {日期: 该天最后一次变化时的版本号}，被删除的日期也保留版本号，
+    从未出现过的日期版本为0。写入者读取时记下版本，提交时用 expected 比较并交换。
+    days 只包含工作簿（热数据）层，archive 为只读的归档层（archive.ArchiveTier，按年份延迟读取）。
+    同一天以 days 为准，days 中的空元组表示该天在归档层中的内容已被删除。
+    get() 和 iter_days() 同时查询两层，需要包含历史日程的读取者应使用它们而不是 days。
+    """
+
+    __slots__ = ("version", "days", "day_versions", "archive")
+
+    def __init__(self, version, days, day_versions=None, archive_tier=None):
+        self.version = version
+        self.days = MappingProxyType(days)
+        self.day_versions = MappingProxyType(day_versions if day_versions is not None
+                                             else dict.fromkeys(days, version))
+        self.archive = archive_tier if archive_tier is not None else archive.EMPTY_TIER
+
+    def get(self, date_str, default=()):
+        """返回某天的事件元组（工作簿层没有时查询归档层），没有事件时返回 default"""
+        day_events = self.days.get(date_str)
+        if day_events is None:
+            day_events = self.archive.get(date_str)
+        return day_events or default
+
+    def iter_days(self, start=None, end=None):
+        """按日期顺序产出两层中有事件的 (日期, 事件元组)，start/end 为可选的 YYYY-MM-DD 闭区间
+
+        归档层只读取与区间相交的年份。
+        """
+        hot = sorted((date_str, day_events) for date_str, day_events in self.days.items()
+                     if (not start or date_str >= start) and (not end or date_str <= end))
+        cold = ((date_str, day_events) for date_str, day_events in self.archive.iter_days(start, end)
+                if date_str not in self.days)
+        for date_str, day_events in heapq.merge(hot, cold, key=lambda item: item[0]):
+            if day_events:
+                yield date_str, day_events
+
+    def day_version(self, date_str):
+        """某天最后一次变化时的版本号，从未有过事件的日期为0"""
+        return self.day_versions.get(date_str, 0)
+
+    def versions_for(self, dates):
+        """{日期: 版本号}，用作提交时的 expected"""
+        return {date_str: self.day_versions.get(date_str, 0) for date_str in dates}
+
+    def to_dict(self, dates=None):
+        """转换为可JSON序列化的 {日期: [事件字典, ...]}，没有事件的日期不包含在内"""
+        if dates is None:
+            return {date_str: [dict(event) for event in day_events] for date_str, day_events in self.iter_days()}
+        return {date_str: [dict(event) for event in self.get(date_str)]
+                for date_str in dates if self.get(date_str)}
+
+    def event_count(self):
+        """工作簿层的事件数（不读取归档层）"""
+        return sum(len(day_events) for day_events in self.days.values())
+
+
+EMPTY_SNAPSHOT = ScheduleSnapshot(0, {})
+
+
+class ScheduleStore:
+    """以工作簿为后端的单个用户的日程存储
+
+    内存中的状态是写时复制的 ScheduleSnapshot：写入者通过 commit() 原子地发布新版本，
+    读取者（API、优化器、保存）通过 snapshot() 无锁地拿到当前版本的引用，
+    不会阻塞界面编辑，也不会看到只应用了一半的修改。
+    by_year=True 时按年份拆分为多个工作簿（记录_2024.xlsx ...），每个文件有独立的文件锁，
+    保存时只重写发生变化的年份。
+    早于归档期限且已经结束的日期保存在压缩的归档分段中（见 archive.py），加载时不读取，
+    由快照的只读归档层在第一次访问某个年份时读取。
+    """
+
+    def __init__(self, file_path, by_year=False):
+        self.file_path = file_path
+        self.by_year = by_year
+        self._mutex = threading.RLock()
+        # 首次加载单独加锁，多个线程同时触发加载时只读取一次磁盘
+        self._load_lock = threading.Lock()
+        # 保存互斥：并发的 save() 依次执行，较早的快照不会覆盖较新的写入
+        self._save_lock = threading.Lock()
+        self._file_locks = {}
+        self._snapshot = None
+        self.load_error = None
+        self._dirty_years = set()
+        # 最近一次与磁盘同步时的内容和文件签名，用于识别外部修改
+        self._disk_days = {}
+        self._disk_signature = None
+        self.archive_dir = archive.archive_dir(file_path)
+        # 变更流：最近的 (版本, 变化的日期, 来源)，供界面刷新和API长轮询
+        self._change_log = deque(maxlen=CHANGE_LOG_SIZE)
+        self._changed = threading.Condition(self._mutex)
+        # 每次发布新版本时同步调用的监听器 listener(旧快照, 新快照, 变化的日期)
+        self._listeners = []
+
+    def partition_path(self, year=None):
+        """返回某个年份分区对应的工作簿路径"""
+        if not self.by_year or year is None:
+            return self.file_path
+        stem, suffix = os.path.splitext(self.file_path)
+        return f"{stem}_{year}{suffix}"
+
+    def file_lock(self, path):
+        """每个分区文件使用独立的文件锁，跨进程生效"""
+        with self._mutex:
+            lock = self._file_locks.get(path)
+            if lock is None:
+                lock = self._file_locks[path] = FileLock(path + ".lock")
+            return lock
+
+    def _partition_years(self):
+        """列出磁盘上已存在的年份分区"""
+        stem, suffix = os.path.splitext(os.path.basename(self.file_path))
+        directory = os.path.dirname(self.file_path) or "."
+        if not os.path.isdir(directory):
+            return []
+        pattern = re.compile(re.escape(stem) + r"_(\d{4})" + re.escape(suffix) + "$")
+        years = []
+        for name in os.listdir(directory):
+            match = pattern.match(name)
+            if match:
+                years.append(int(match.group(1)))
+        return sorted(years)
+
+    def read_files(self):
+        """从磁盘读取工作簿中的事件（不修改内存状态），返回 ({日期: [事件]}, 需要重写的年份, 归档层)
+
+        归档分段不在这里读取，只有以下情况例外：工作簿中又出现了已归档年份中早于期限的日期
+        （例如在Excel中手动添加），读取该年的分段合并后下次保存时重新分层；
+        关闭分层（ARCHIVE_AFTER_DAYS=0）时读入全部分段，下次保存时移回工作簿。
+        """
+        events = {}
+        legacy_years = set()
+        if self.by_year:
+            for year in self._partition_years():
+                path = self.partition_path(year)
+                with self.file_lock(path):
+                    events.update(read_workbook(path))
+            # 兼容未分区时的旧文件：读入后标记对应年份，下次保存时迁移到分区文件
+            if os.path.exists(self.file_path):
+                with self.file_lock(self.file_path):
+                    legacy = read_workbook(self.file_path)
+                for date_str, day_events in legacy.items():
+                    merged = events.setdefault(date_str, [])
+                    merged.extend(event for event in day_events if event not in merged)
+                    merged.sort(key=lambda x: time_to_minutes(x["time"]))
+                    legacy_years.add(int(date_str[:4]))
+        else:
+            with self.file_lock(self.file_path):
+                events = read_workbook(self.file_path)
+
+        tier = archive.ArchiveTier(self.archive_dir, lock_for=self.file_lock)
+        horizon = archive.archive_horizon()
+        for year in tier.years():
+            prefix = f"{year}-"
+            if horizon is None:
+                dates = list(tier.segment(year))
+            else:
+                # 已归档的日期都早于期限，只有工作簿中早于期限的日期可能与归档层重复
+                dates = [d for d in events if d.startswith(prefix) and d < horizon]
+                if not dates:
+                    continue
+            segment = tier.segment(year)
+            for date_str in dates:
+                day_events = segment.get(date_str)
+                if not day_events:
+                    continue
+                merged = events.setdefault(date_str, [])
+                merged.extend(event for event in day_events if event not in merged)
+                merged.sort(key=lambda x: time_to_minutes(x["time"]))
+                legacy_years.add(year)
+        return events, legacy_years, tier
+
+    def partition_paths(self):
+        """列出当前存储涉及的全部工作簿和归档分段路径"""
+        paths = [self.file_path]
+        if self.by_year:
+            paths.extend(self.partition_path(year) for year in self._partition_years())
+        paths.extend(archive.segment_path(self.archive_dir, year) for year in archive.segment_years(self.archive_dir))
+        return paths
+
+    def disk_signature(self):
+        """各分区文件的 (路径, 修改时间, 大小)，文件变化时签名随之变化"""
+        signature = []
+        for path in self.partition_paths():
+            try:
+                stat = os.stat(path)
+                signature.append((path, stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                continue
+        return tuple(signature)
+
+    def _read_frozen(self):
+        """从磁盘读取工作簿中的事件并冻结，返回 (days, 需要重写的年份, 文件签名, 归档层)"""
+        signature = self.disk_signature()
+        events, legacy_years, tier = self.read_files()
+        days = {date_str: tuple(sorted((freeze_event(event) for event in day_events),
+                                       key=lambda x: time_to_minutes(x["time"])))
+                for date_str, day_events in events.items() if day_events}
+        return days, legacy_years, signature, tier
+
+    def _segment_years_changed(self, old_signature, new_signature):
+        """两次文件签名之间发生变化的归档分段年份"""
+        old, new = set(old_signature or ()), set(new_signature)
+        years = set()
+        for path, _, _ in old ^ new:
+            if os.path.dirname(path) == self.archive_dir:
+                year = archive.segment_year(path)
+                if year is not None:
+                    years.add(year)
+        return years
+
+    def _apply_disk(self, hot_changes, tier, archive_years, source):
+        """把磁盘上读到的工作簿层修改和归档层发布为新版本（调用方需持有 _mutex）
+
+        hot_changes 为 {日期: 事件元组或 None}，直接替换工作簿层（None 表示该天不在工作簿中，
+        此时以归档层为准）；archive_years 为归档层可能变化的年份。
+        只有两层合起来的内容发生变化的日期进入新版本和变更流；没有这样的日期时
+        原样替换当前快照的两层，不产生新版本。返回变化的日期列表。
+        """
+        base = self._snapshot
+        days = dict(base.days)
+        for date_str, day_events in hot_changes.items():
+            if day_events:
+                days[date_str] = day_events
+            else:
+                days.pop(date_str, None)
+        candidates = set(hot_changes)
+        if tier is not base.archive:
+            candidates |= base.archive.changed_dates(tier, archive_years)
+        updated = ScheduleSnapshot(base.version, days, base.day_versions, tier)
+        changed_dates = sorted(d for d in candidates if base.get(d) != updated.get(d))
+        if not changed_dates:
+            self._snapshot = updated
+            return []
+        version = base.version + 1
+        day_versions = dict(base.day_versions)
+        day_versions.update(dict.fromkeys(changed_dates, version))
+        self._publish(ScheduleSnapshot(version, days, day_versions, tier), changed_dates, source)
+        return changed_dates
+
+    def load(self):
+        """重新从工作簿加载事件，丢弃未保存的修改
+
+        与当前版本逐天比较，只有内容不同的日期进入新版本和变更流。
+        """
+        days, legacy_years, signature, tier = self._read_frozen()
+        with self._mutex:
+            if self._snapshot is None:
+                self._publish(ScheduleSnapshot(1, days, archive_tier=tier), list(days), "load")
+            else:
+                base = self._snapshot
+                hot_changes = {date_str: days.get(date_str)
+                               for date_str in set(base.days) | set(days)
+                               if base.days.get(date_str) != days.get(date_str)}
+                self._apply_disk(hot_changes, tier, set(base.archive.years()) | set(tier.years()), "load")
+            self._dirty_years = set(legacy_years)
+            self._disk_days = days
+            self._disk_signature = signature
+        print(f"成功从 {self.file_path} 加载 {sum(len(v) for v in days.values())} 条事件")
+        return self._snapshot
+
+    def sync_from_disk(self):
+        """增量同步外部对工作簿的修改
+
+        只把磁盘上相对上次同步发生变化的日期应用到内存，未保存的本地修改（其他日期）保持不变。
+        返回发生变化的日期列表。
+        """
+        if self._snapshot is None:
+            # 首次加载由 snapshot() 完成，加载的日期已记录在变更流中
+            self.snapshot()
+            return []
+        with self._mutex:
+            if self.disk_signature() == self._disk_signature:
+                return []
+        days, _, signature, tier = self._read_frozen()
+        with self._mutex:
+            old_days = self._disk_days
+            changes = {date_str: days.get(date_str)
+                       for date_str in set(old_days) | set(days)
+                       if old_days.get(date_str, ()) != days.get(date_str, ())}
+            archive_years = self._segment_years_changed(self._disk_signature, signature)
+            if not archive_years:
+                # 归档分段没有变化，继续使用已读取的归档层
+                tier = self._snapshot.archive
+            self._apply_disk(changes, tier, archive_years, "disk")
+            self._disk_days = days
+            self._disk_signature = signature
+        if changes:
+            print(f"检测到 {self.file_path} 外部修改，更新 {len(changes)} 天")
+        return sorted(changes)
+
+    def snapshot(self):
+        """无锁获取当前版本的只读快照，尚未加载时先从磁盘加载"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._load_lock:
+                if self._snapshot is None:
+                    self.load()
+                snapshot = self._snapshot
+        return snapshot
+
+    def peek(self):
+        """获取当前快照但不触发加载，尚未加载时返回空快照（供启动时界面立即显示）"""
+        return self._snapshot or EMPTY_SNAPSHOT
+
+    @property
+    def loaded(self):
+        return self._snapshot is not None
+
+    def load_async(self):
+        """在后台线程中完成首次加载，结果通过变更流通知"""
+        def runner():
+            try:
+                self.snapshot()
+            except Exception as e:
+                self.load_error = str(e)
+                print(f"后台加载 {self.file_path} 失败: {str(e)}")
+        thread = threading.Thread(target=runner, name="store-initial-load", daemon=True)
+        thread.start()
+        return thread
+
+    @property
+    def events(self):
+        """当前版本的 {日期: (事件, ...)} 只读视图"""
+        return self.snapshot().days
+
+    def _publish(self, snapshot, changed_dates, source):
+        """发布新版本并记录变更流（调用方需持有 _mutex）"""
+        # 单次引用赋值即完成发布，读取者要么看到旧版本，要么看到新版本
+        previous = self._snapshot or EMPTY_SNAPSHOT
+        self._snapshot = snapshot
+        self._change_log.append((snapshot.version, frozenset(changed_dates), source))
+        self._changed.notify_all()
+        for listener in self._listeners:
+            try:
+                listener(previous, snapshot, changed_dates)
+            except Exception as e:
+                # 派生数据出错不影响写入本身
+                print(f"日程变更监听器出错: {str(e)}")
+
+    def subscribe(self, listener, initialize=None):
+        """注册版本监听器，在 _mutex 内调用，按版本顺序收到每次变更
+
+        initialize(快照) 与注册在同一把锁内执行，用于基于当前版本建立派生数据，
+        保证建立期间不会漏掉或重复应用任何变更。
+        """
+        with self._mutex:
+            if initialize is not None:
+                initialize(self.snapshot())
+            self._listeners.append(listener)
+
+    def commit(self, changes, source=None, mark_dirty=True, expected=None):
+        """原子地应用一组按天的修改并发布新版本
+
+        changes 为 {日期: 新的事件列表}，列表为空或 None 表示删除该天。
+        内容没有变化的日期会被忽略；全部未变化时不产生新版本。返回当前快照。
+        source 标明修改来源（如 "gui"、"api"、"disk"），写入变更流供订阅者过滤。
+        expected 为可选的 {日期: 读取时的版本号}，其中任何一天的当前版本不同时
+        整组修改都不应用并抛出 ConflictError；修改其他日期的写入者互不影响。
+        修改归档的日期时新内容写入工作簿层（保存时重新分层），归档层本身不变。
+        """
+        return self.commit_delta(changes, source, mark_dirty, expected)[0]
+
+    def commit_delta(self, changes, source=None, mark_dirty=True, expected=None):
+        """与 commit() 相同，另外返回实际变化的日期修改前后的事件元组
+
+        返回 (当前快照, {日期: 修改前的事件元组}, {日期: 修改后的事件元组})，不存在的日期为空元组。
+        元组与快照共享，不复制事件，可用于记录撤销操作。
+        """
+        with self._mutex:
+            base = self.snapshot()
+            if expected:
+                conflicts = {date_str: (version, base.day_version(date_str))
+                             for date_str, version in expected.items()
+                             if base.day_version(date_str) != version}
+                if conflicts:
+                    raise ConflictError(conflicts, changes, base)
+            days = dict(base.days)
+            horizon = archive.archive_horizon()
+            changed_dates = []
+            for date_str, day_events in changes.items():
+                if day_events:
+                    frozen = tuple(freeze_event(event) for event in day_events)
+                    frozen = tuple(sorted(frozen, key=lambda x: time_to_minutes(x["time"])))
+                    if frozen == base.get(date_str):
+                        continue
+                    days[date_str] = frozen
+                elif not base.get(date_str):
+                    continue
+                elif date_str in days and (horizon is None or date_str >= horizon):
+                    del days[date_str]
+                else:
+                    # 早于期限的日期可能在归档层中，留下空元组遮住归档层中的同一天
+                    days[date_str] = ()
+                if mark_dirty:
+                    self._dirty_years.add(int(date_str[:4]))
+                changed_dates.append(date_str)
+            if not changed_dates:
+                return base, {}, {}
+            version = base.version + 1
+            day_versions = dict(base.day_versions)
+            day_versions.update(dict.fromkeys(changed_dates, version))
+            self._publish(ScheduleSnapshot(version, days, day_versions, base.archive), changed_dates, source)
+            before = {date_str: base.get(date_str) for date_str in changed_dates}
+            after = {date_str: days.get(date_str, ()) for date_str in changed_dates}
+            return self._snapshot, before, after
+
+    def changes_since(self, version):
+        """返回 version 之后的变更 [(版本, 日期集合, 来源), ...]
+
+        变更流已经丢弃了所需的记录（或版本号无效）时返回 None，调用方应整体刷新。
+        """
+        with self._mutex:
+            current = self._snapshot.version if self._snapshot else 0
+            if version > current:
+                # 客户端的版本来自重启之前
+                return None
+            if version == current:
+                return []
+            if not self._change_log or self._change_log[0][0] > version + 1:
+                return None
+            return [entry for entry in self._change_log if entry[0] > version]
+
+    def wait_for_changes(self, version, timeout=None):
+        """阻塞直到出现 version 之后的新版本或超时，返回值同 changes_since()"""
+        with self._changed:
+            self._changed.wait_for(
+                lambda: self._snapshot is not None and self._snapshot.version > version,
+                timeout=timeout
+            )
+            return self.changes_since(version)
+
+    def merge(self, rows, source="import"):
+        """将一批 (日期, 事件) 合并为一个新版本，完全相同的事件会被跳过
+
+        返回 (合并数量, 跳过数量)
+        """
+        merged = skipped = 0
+        with self._mutex:
+            base = self.snapshot()
+            changes = {}
+            for date_str, event in rows:
+                day_events = changes.get(date_str)
+                if day_events is None:
+                    day_events = changes[date_str] = list(base.get(date_str))
+                if event in day_events:
+                    skipped += 1
+                    continue
+                day_events.append(event)
+                merged += 1
+            changes = {date_str: day_events for date_str, day_events in changes.items()
+                       if len(day_events) != len(base.get(date_str))}
+            if changes:
+                self.commit(changes, source=source)
+        return merged, skipped
+
+    def replace_all(self, new_events, source=None):
+        """用新的事件集合整体替换，只有内容变化的日期会进入新版本"""
+        with self._mutex:
+            base = self.snapshot()
+            changes = {}
+            for date_str in set(base.days) | set(new_events):
+                new_day = new_events.get(date_str) or []
+                if list(base.get(date_str)) != list(new_day):
+                    changes[date_str] = new_day
+            if changes:
+                self.commit(changes, source=source)
+            return self._snapshot
+
+    def save(self):
+        """将当前快照写回磁盘，按年分区时只写有变化的年份
+
+        工作簿层中早于归档期限且已经结束的日期写入归档分段，其余写入工作簿；
+        归档分段只重写有修改或有日期新满足归档条件的年份，分段中其余日期原样保留。
+        写入过程中不持有内存锁，界面和API可以继续修改，后续修改会在下次保存时写入；
+        多个线程同时保存时依次执行。
+        """
+        with self._save_lock:
+            with self._mutex:
+                snapshot = self.snapshot()
+                dirty_years, self._dirty_years = self._dirty_years, set()
+                disk_days = self._disk_days
+            tier = snapshot.archive
+            cold = archive.cold_dates(snapshot.days, archive.archive_horizon())
+            # 仍在工作簿中、现在满足归档条件的日期所在年份也需要重写
+            touched_years = dirty_years | {int(date_str[:4]) for date_str in cold if date_str in disk_days}
+            segments = {}
+            try:
+                # 先写归档再写工作簿：中途出错时某天最多同时存在于两层（加载时合并），不会丢失
+                for year in sorted(touched_years):
+                    prefix = f"{year}-"
+                    path = archive.segment_path(self.archive_dir, year)
+                    # 工作簿层中的日期（含被删除的归档日期）以工作簿层为准
+                    year_cold = {d: e for d, e in tier.segment(year).items() if d not in snapshot.days}
+                    year_cold.update((d, snapshot.days[d]) for d in cold if d.startswith(prefix))
+                    if not year_cold and not os.path.exists(path):
+                        continue
+                    with self.file_lock(path):
+                        count = archive.write_segment(path, year_cold)
+                    segments[year] = year_cold
+                    print(f"归档 {count} 条事件到 {path}")
+
+                hot_days = {d: e for d, e in snapshot.days.items() if e and d not in cold}
+                if not self.by_year:
+                    with self.file_lock(self.file_path):
+                        count = write_workbook(self.file_path, hot_days)
+                        self._mark_synced(snapshot, hot_days, tier.with_segments(segments), cold)
+                    print(f"成功保存 {count} 条事件到 {self.file_path}")
+                    return True
+
+                for year in sorted(touched_years):
+                    prefix = f"{year}-"
+                    year_events = {d: e for d, e in hot_days.items() if d.startswith(prefix)}
+                    path = self.partition_path(year)
+                    with self.file_lock(path):
+                        count = write_workbook(path, year_events)
+                    print(f"成功保存 {count} 条事件到 {path}")
+
+                # 旧的未分区文件已迁移，改名保留备份
+                if os.path.exists(self.file_path):
+                    with self.file_lock(self.file_path):
+                        os.replace(self.file_path, self.file_path + ".bak")
+                self._mark_synced(snapshot, hot_days, tier.with_segments(segments), cold)
+                return True
+            except Exception:
+                # 写入失败时恢复待保存标记
+                with self._mutex:
+                    self._dirty_years |= touched_years
+                raise
+
+    def _mark_synced(self, snapshot, hot_days, tier, cold):
+        """记录刚写入磁盘的内容，文件监视器不会把自己的保存当作外部修改
+
+        当前快照换用写入后的归档层，刚归档的日期和已从分段中删除的日期的空元组
+        （此后未被修改）从工作簿层移除；两层合起来的内容不变，因此不产生新版本。
+        """
+        with self._mutex:
+            self._disk_days = dict(hot_days)
+            self._disk_signature = self.disk_signature()
+            current = self._snapshot
+            if current.archive is not snapshot.archive:
+                # 保存期间重新加载过，归档层已从磁盘重新读取
+                return
+            days = {d: e for d, e in current.days.items()
+                    if not ((d in cold and e is snapshot.days[d]) or (not e and not snapshot.days.get(d, True)))}
+            self._snapshot = ScheduleSnapshot(current.version, days, current.day_versions, tier)
+
+
+class StoreRegistry:
+    """按用户划分日程存储，每个用户的分区互不影响
+
+    与本机桌面用户相同的账号（默认为 API_USERNAME）继续使用原来的 记录.xlsx，
+    其他账号的日程保存在 schedules/<用户名>-<用户名哈希>/记录.xlsx。
+    """
+
+    def __init__(self, base_dir, file_name="记录.xlsx", default_user=None, by_year=False, watch=False):
+        self.base_dir = base_dir
+        self.file_name = file_name
+        self.default_user = default_user
+        self.by_year = by_year
+        self.watch = watch
+        self._stores = {}
+        self._watchers = {}
+        self._lock = threading.Lock()
+
+    def path_for(self, user):
+        """返回用户分区的工作簿路径"""
+        if user is None or user == self.default_user:
+            return os.path.join(self.base_dir, self.file_name)
+        user = str(user)
+        # 可读的前缀会把不同的名字（如 "a b" 和 "a_b"、大小写不同的名字）映射为同一个，
+        # 加上原始用户名的哈希保证每个用户一个目录
+        safe_name = re.sub(r"[^\w.-]", "_", user).strip(".")[:40] or "_"
+        digest = hashlib.sha1(user.encode("utf-8")).hexdigest()[:12]
+        return os.path.join(self.base_dir, "schedules", f"{safe_name}-{digest}", self.file_name)
+
+    def get(self, user=None):
+        """获取用户的日程存储（同一用户始终返回同一个实例）"""
+        path = self.path_for(user)
+        with self._lock:
+            store = self._stores.get(path)
+            if store is None:
+                store = self._stores[path] = ScheduleStore(path, by_year=self.by_year)
+                if self.watch:
+                    # 每个分区一个监视线程，外部修改自动增量同步
+                    from watcher import WorkbookWatcher
+                    self._watchers[path] = WorkbookWatcher(store).start()
+            return store
+
+
+_store_registry = None
+_store_registry_lock = threading.Lock()
+
+
+def get_store_registry():
+    """获取进程内共享的存储登记表（GUI与Flask API使用同一份）
+
+    延迟创建，以便 .env 中的 API_USERNAME / PARTITION_BY_YEAR / WATCH_WORKBOOKS 已经加载。
+    """
+    global _store_registry
+    with _store_registry_lock:
+        if _store_registry is None:
+            _store_registry = StoreRegistry(
+                BASE_DIR,
+                default_user=os.getenv("API_USERNAME", "admin"),
+                by_year=os.getenv("PARTITION_BY_YEAR", "0") == "1",
+                watch=os.getenv("WATCH_WORKBOOKS", "1") == "1",
+            )
+        return _store_registry
@@ -0,0 +1,143 @@
+"""任务名称的字符 n-gram 倒排索引，用于全文搜索
+
+中文不需要分词：每个任务名按单字和相邻两字（bigram）建立倒排表，
+查询时取查询串各个 bigram 倒排表的交集，再用子串匹配排除不连续的误命中。
+索引以单个事件 (日期, 序号) 为文档，随存储的每次提交只重建变化的日期。
+"""
+import heapq
+import threading
+
+# 倒排表中的文档为 (日期, 当天序号)
+NGRAM_SIZES = (1, 2)
+DEFAULT_LIMIT = 100
+
+
+def normalize_text(text):
+    """统一大小写并去掉首尾空白"""
+    return str(text or "").strip().casefold()
+
+
+def text_grams(text):
+    """文本中所有单字和相邻两字的集合"""
+    grams = set()
+    for size in NGRAM_SIZES:
+        for i in range(len(text) - size + 1):
+            grams.add(text[i:i + size])
+    return grams
+
+
+def query_grams(query):
+    """查询使用的 n-gram：单字查询用单字，否则用全部 bigram"""
+    if len(query) == 1:
+        return [query]
+    return list({query[i:i + 2] for i in range(len(query) - 1)})
+
+
+class SearchIndex:
+    """单个日程存储的倒排索引，通过 ScheduleStore.subscribe() 增量维护"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = {}  # n-gram -> {(日期, 序号), ...}
+        self._texts = {}  # (日期, 序号) -> 规范化后的任务名
+        self._days = {}  # 日期 -> 已索引的事件元组
+        self.stats = {"documents": 0, "grams": 0}
+
+    def _add_day(self, date_str, day_events):
+        for i, event in enumerate(day_events):
+            text = normalize_text(event.get("task"))
+            if not text:
+                continue
+            doc = (date_str, i)
+            self._texts[doc] = text
+            for gram in text_grams(text):
+                postings = self._postings.get(gram)
+                if postings is None:
+                    postings = self._postings[gram] = set()
+                postings.add(doc)
+        if day_events:
+            self._days[date_str] = day_events
+
+    def _remove_day(self, date_str):
+        day_events = self._days.pop(date_str, ())
+        for i in range(len(day_events)):
+            doc = (date_str, i)
+            text = self._texts.pop(doc, None)
+            if text is None:
+                continue
+            for gram in text_grams(text):
+                postings = self._postings.get(gram)
+                if postings is not None:
+                    postings.discard(doc)
+                    if not postings:
+                        del self._postings[gram]
+
+    def _update_stats(self):
+        self.stats = {"documents": len(self._texts), "grams": len(self._postings)}
+
+    def rebuild(self, snapshot):
+        """基于快照重建整个索引"""
+        with self._lock:
+            self._postings, self._texts, self._days = {}, {}, {}
+            for date_str, day_events in snapshot.iter_days():
+                self._add_day(date_str, day_events)
+            self._update_stats()
+
+    def on_commit(self, previous, snapshot, changed_dates):
+        """存储监听器：只重新索引变化的日期"""
+        with self._lock:
+            for date_str in changed_dates:
+                self._remove_day(date_str)
+                self._add_day(date_str, snapshot.get(date_str))
+            self._update_stats()
+
+    def search(self, query, limit=DEFAULT_LIMIT, start=None, end=None, completions=None, newest_first=False):
+        """返回 (命中总数, 按日期排序的前 limit 条命中)，命中为 {"date", "time", "task", "completion"}
+
+        start/end 为可选的日期范围，completions 为可选的完成度集合。
+        """
+        query = normalize_text(query)
+        if not query:
+            return 0, []
+        with self._lock:
+            # 从最短的倒排表开始求交集
+            postings = sorted((self._postings.get(gram, ()) for gram in query_grams(query)), key=len)
+            if not postings or not postings[0]:
+                return 0, []
+            candidates = postings[0]
+            for other in postings[1:]:
+                candidates = candidates & other
+                if not candidates:
+                    return 0, []
+            # 三个字以上的查询由多个 bigram 拼成，需要用子串匹配确认连续出现
+            if len(query) > 2 or start or end or completions:
+                texts, days = self._texts, self._days
+                candidates = [doc for doc in candidates
+                              if (not start or doc[0] >= start) and (not end or doc[0] <= end)
+                              and query in texts[doc]
+                              and (not completions or days[doc[0]][doc[1]].get("completion") in completions)]
+            total = len(candidates)
+            # 只对需要返回的前 limit 条排序
+            select = heapq.nlargest if newest_first else heapq.nsmallest
+            top = [(doc, self._days[doc[0]][doc[1]]) for doc in select(limit, candidates)]
+
+        hits = [{"date": doc[0], "time": event.get("time", ""), "task": event.get("task", ""),
+                 "completion": event.get("completion", "")}
+                for doc, event in top]
+        return total, hits
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_search_index(store):
+    """获取存储对应的搜索索引（首次调用时建立并订阅存储的变更）"""
+    with _indexes_lock:
+        index = _indexes.get(store.file_path)
+        if index is None:
+            index = SearchIndex()
+            # 建立与订阅在存储的同一把锁内完成，期间的提交不会遗漏
+            store.subscribe(index.on_commit, initialize=index.rebuild)
+            _indexes[store.file_path] = index
+        return index
@@ -0,0 +1,56 @@
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """合并相同键的并发调用：同一时刻只执行一次，等待者共享结果或异常
+
+    只合并正在进行的调用，不缓存结果；调用结束后再来的相同请求会重新执行。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.stats = {"executed": 0, "shared": 0}
+
+    def do(self, key, func, *args, **kwargs):
+        """执行 func(*args, **kwargs) 或等待进行中的相同调用，返回 (结果, 是否共享了其他调用的结果)"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.stats["executed"] += 1
+            else:
+                call.waiters += 1
+                self.stats["shared"] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        if call.waiters:
+            print(f"合并了 {call.waiters} 个相同的并发请求")
+        return call.result, False
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
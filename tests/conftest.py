@@ -0,0 +1,78 @@
+import base64
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+# flask_app 在导入时读取这些配置：限流计数写入临时数据库，不消耗真实的限流预算，也不启动文件监视线程
+_SESSION_DIR = tempfile.mkdtemp(prefix="bebop-tests-")
+os.environ["RATE_LIMIT_DB"] = os.path.join(_SESSION_DIR, "ratelimit.sqlite3")
+os.environ["RATE_LIMIT_DEFAULT"] = "1000000 per minute"
+os.environ["RATE_LIMIT_POLL"] = "1000000 per minute"
+os.environ["WATCH_WORKBOOKS"] = "0"
+os.environ["PREOPTIMIZE"] = "0"
+os.environ["API_USERNAME"] = "admin"
+os.environ["API_PASSWORD"] = "admin-password"
+os.environ["API_USERS_FILE"] = os.path.join(_SESSION_DIR, "api_users.txt")
+
+DEFAULT_USER = ("admin", "admin-password")
+
+
+def basic_auth(username, password):
+    token = base64.b64encode(f"{username}:{password}".encode("utf-8")).decode("ascii")
+    return {"Authorization": f"Basic {token}"}
+
+
+def put_day(client, headers, date, task, time="09:00-10:00"):
+    """通过 PUT /api/schedule 把某天替换为一个事件（带上读取到的版本号）"""
+    versions = client.get(f"/api/schedule?start={date}&end={date}", headers=headers).get_json()["day_versions"]
+    response = client.put("/api/schedule", headers=headers, json={
+        "events": {date: [{"time": time, "task": task}]},
+        "versions": {date: versions.get(date, 0)},
+    })
+    assert response.status_code == 200, response.get_json()
+    return response
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    """日程存储指向临时目录的登记表"""
+    import schedule_store
+
+    registry = schedule_store.StoreRegistry(str(tmp_path), default_user=DEFAULT_USER[0])
+    monkeypatch.setattr(schedule_store, "_store_registry", registry)
+    return registry
+
+
+@pytest.fixture
+def api_users(tmp_path, monkeypatch):
+    """临时账号文件，返回 add(用户名, 密码)"""
+    from werkzeug.security import generate_password_hash
+    import api_users as api_users_module
+
+    path = str(tmp_path / "api_users.txt")
+    monkeypatch.setenv("API_USERS_FILE", path)
+    users = {}
+
+    def add(username, password):
+        # 测试中使用较快的哈希方法
+        users[username] = generate_password_hash(password, method="pbkdf2:sha256:1000")
+        api_users_module.write_users(path, users)
+        return basic_auth(username, password)
+    return add
+
+
+@pytest.fixture
+def client(registry):
+    from flask_app import app
+
+    return app.test_client()
+
+
+@pytest.fixture
+def admin_auth():
+    return basic_auth(*DEFAULT_USER)
@@ -0,0 +1,35 @@
+import os
+
+from conftest import basic_auth, put_day
+
+
+def test_path_for_is_collision_free(registry):
+    paths = {registry.path_for(name) for name in ("a b", "a_b", "a.b", "Alice", "alice")}
+    assert len(paths) == 5
+    assert registry.path_for("admin") == os.path.join(registry.base_dir, "记录.xlsx")
+
+
+def test_unknown_user_and_wrong_password_are_rejected(client, api_users):
+    api_users("alice", "secret")
+    assert client.get("/api/schedule", headers=basic_auth("alice", "wrong")).status_code == 401
+    assert client.get("/api/schedule", headers=basic_auth("bob", "secret")).status_code == 401
+    assert client.get("/api/schedule", headers=basic_auth("alice", "secret")).status_code == 200
+
+
+def test_two_users_write_two_files(client, registry, api_users, admin_auth):
+    alice = api_users("a b", "pw-1")
+    bob = api_users("a_b", "pw-2")
+    put_day(client, alice, "2026-03-02", "alice 的任务")
+    put_day(client, bob, "2026-03-02", "bob 的任务")
+    put_day(client, admin_auth, "2026-03-03", "桌面端任务")
+
+    alice_path, bob_path = registry.path_for("a b"), registry.path_for("a_b")
+    assert alice_path != bob_path
+    for path in (alice_path, bob_path, registry.path_for("admin")):
+        assert os.path.exists(path)
+
+    alice_days = client.get("/api/schedule", headers=alice).get_json()["events"]
+    bob_days = client.get("/api/schedule", headers=bob).get_json()["events"]
+    assert [event["task"] for event in alice_days["2026-03-02"]] == ["alice 的任务"]
+    assert [event["task"] for event in bob_days["2026-03-02"]] == ["bob 的任务"]
+    assert "2026-03-03" not in alice_days
@@ -0,0 +1,108 @@
+import os
+
+import archive
+from data_export import iter_event_records
+from schedule_store import ScheduleStore, read_workbook
+from search_index import SearchIndex
+
+OLD_DAY = "2020-03-02"
+OLD_DAY_2 = "2020-03-03"
+RECENT_DAY = "2099-01-05"
+
+
+def done(task, time="09:00-10:00"):
+    return {"time": time, "task": task, "completion": "已完成"}
+
+
+def saved_store(tmp_path):
+    """保存一次：两天旧日程进入归档，一天新日程留在工作簿，返回重新打开的存储"""
+    path = str(tmp_path / "记录.xlsx")
+    store = ScheduleStore(path)
+    store.commit({OLD_DAY: [done("旧组会")], OLD_DAY_2: [done("旧周报")],
+                  RECENT_DAY: [{"time": "10:00-11:00", "task": "新任务", "completion": "未开始"}]})
+    store.save()
+    return ScheduleStore(path)
+
+
+def test_load_reads_workbook_only_and_archive_lazily(tmp_path):
+    store = saved_store(tmp_path)
+    assert sorted(read_workbook(store.file_path)) == [RECENT_DAY]
+    assert archive.segment_years(store.archive_dir) == [2020]
+
+    snapshot = store.snapshot()
+    assert list(snapshot.days) == [RECENT_DAY]
+    assert snapshot.archive.cached(2020) is None
+    assert [event["task"] for event in snapshot.get(OLD_DAY)] == ["旧组会"]
+    assert snapshot.archive.cached(2020) is not None
+
+
+def test_range_queries_only_read_intersecting_years(tmp_path):
+    snapshot = saved_store(tmp_path).snapshot()
+    assert [date for date, _ in snapshot.iter_days(start="2099-01-01")] == [RECENT_DAY]
+    assert snapshot.archive.cached(2020) is None
+    assert list(snapshot.to_dict()) == [OLD_DAY, OLD_DAY_2, RECENT_DAY]
+
+
+def test_search_and_export_include_both_tiers(tmp_path):
+    snapshot = saved_store(tmp_path).snapshot()
+    index = SearchIndex()
+    index.rebuild(snapshot)
+    total, hits = index.search("组会")
+    assert total == 1 and hits[0]["date"] == OLD_DAY
+    assert [record[0] for record in iter_event_records(snapshot)] == [OLD_DAY, OLD_DAY_2, RECENT_DAY]
+
+
+def test_edited_archived_day_moves_back_to_workbook(tmp_path):
+    store = saved_store(tmp_path)
+    store.commit({OLD_DAY: [{"time": "09:00-10:00", "task": "旧组会", "completion": "未完成"}]})
+    store.save()
+    assert OLD_DAY in read_workbook(store.file_path)
+    assert list(archive.read_segment(archive.segment_path(store.archive_dir, 2020))) == [OLD_DAY_2]
+
+    reopened = ScheduleStore(store.file_path).snapshot()
+    assert reopened.get(OLD_DAY)[0]["completion"] == "未完成"
+    assert reopened.get(OLD_DAY_2)[0]["task"] == "旧周报"
+
+
+def test_deleted_archived_day_stays_deleted(tmp_path):
+    store = saved_store(tmp_path)
+    index = SearchIndex()
+    store.subscribe(index.on_commit, initialize=index.rebuild)
+    store.commit({OLD_DAY: []})
+    assert store.snapshot().get(OLD_DAY) == ()
+    assert index.search("组会")[0] == 0
+    store.save()
+    # 已经从分段中删除，空元组不再需要
+    assert OLD_DAY not in store.snapshot().days
+    assert store.snapshot().get(OLD_DAY) == ()
+    assert OLD_DAY not in ScheduleStore(store.file_path).snapshot().to_dict()
+
+
+def test_newly_archived_days_leave_the_hot_tier(tmp_path):
+    store = ScheduleStore(str(tmp_path / "记录.xlsx"))
+    store.commit({OLD_DAY: [done("旧组会")]})
+    version = store.snapshot().version
+    store.save()
+    snapshot = store.snapshot()
+    assert snapshot.version == version
+    assert OLD_DAY not in snapshot.days
+    assert snapshot.get(OLD_DAY)[0]["task"] == "旧组会"
+
+
+def test_disabling_archive_moves_days_back(tmp_path, monkeypatch):
+    store = saved_store(tmp_path)
+    monkeypatch.setenv("ARCHIVE_AFTER_DAYS", "0")
+    store.snapshot()
+    store.save()
+    assert sorted(read_workbook(store.file_path)) == [OLD_DAY, OLD_DAY_2, RECENT_DAY]
+    assert not os.path.exists(archive.segment_path(store.archive_dir, 2020))
+
+
+def test_schedule_api_returns_archived_days(client, registry, admin_auth):
+    store = registry.get("admin")
+    store.commit({OLD_DAY: [done("旧组会")]})
+    store.save()
+    registry._stores.clear()
+    body = client.get(f"/api/schedule?start={OLD_DAY}&end={OLD_DAY}", headers=admin_auth).get_json()
+    assert [event["task"] for event in body["events"][OLD_DAY]] == ["旧组会"]
+    assert body["day_versions"] == {OLD_DAY: 0}
@@ -0,0 +1,39 @@
+import os
+
+from conftest import put_day
+
+
+def test_free_slots_merges_two_partitions(client, api_users, admin_auth):
+    alice = api_users("alice", "pw")
+    put_day(client, admin_auth, "2026-03-02", "会议")  # 09:00-10:00
+    put_day(client, alice, "2026-03-02", "上课", time="10:00-12:00")
+
+    response = client.get("/api/free-slots?duration=60&start=2026-03-02&end=2026-03-02&users=alice",
+                          headers=admin_auth)
+    assert response.status_code == 200
+    slots = [(slot["start"], slot["end"]) for slot in response.get_json()["slots"]]
+    assert slots == [("12:00", "18:00")]
+
+    # 只看自己的日程时 10:00-12:00 仍然空闲
+    own = client.get("/api/free-slots?duration=60&start=2026-03-02&end=2026-03-02", headers=admin_auth)
+    assert [(slot["start"], slot["end"]) for slot in own.get_json()["slots"]] == [("10:00", "18:00")]
+
+
+def test_free_slots_rejects_unknown_users_without_creating_stores(client, registry, api_users, admin_auth):
+    api_users("alice", "pw")
+    response = client.get("/api/free-slots?users=alice,nobody", headers=admin_auth)
+    assert response.status_code == 404
+    assert response.get_json()["users"] == ["nobody"]
+    assert not os.path.exists(os.path.dirname(registry.path_for("nobody")))
+
+
+def test_merge_busy_coalesces_overlapping_partitions():
+    from free_slots import busy_intervals, merge_busy, gaps
+
+    mine = busy_intervals([{"time": "09:00-10:00", "completion": "未开始"},
+                           {"time": "13:00-14:00", "completion": "取消"}])
+    theirs = busy_intervals([{"time": "09:30-11:00", "completion": "未开始"},
+                             {"time": "全天", "completion": "未开始"}])
+    merged = merge_busy([mine, theirs])
+    assert merged == [(540, 660)]
+    assert list(gaps(merged, 9 * 60, 18 * 60, 60)) == [(660, 1080)]
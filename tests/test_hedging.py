@@ -0,0 +1,114 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from hedging import HedgedCompleter
+from token_budget import usage_recorder
+
+MESSAGES = [{"role": "user", "content": "安排下周日程"}]
+
+
+def chunk(content=None, finish_reason=None, usage=None):
+    choices = [] if content is None else [
+        SimpleNamespace(delta=SimpleNamespace(content=content), finish_reason=finish_reason)]
+    return SimpleNamespace(choices=choices, usage=usage)
+
+
+class FakeStream:
+    """按顺序产出分块；stall=True 时在首个分块前一直阻塞，直到被 close()"""
+
+    def __init__(self, chunks, stall=False):
+        self.chunks = chunks
+        self.stall = stall
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        if self.stall:
+            self.closed.wait(10)
+            raise RuntimeError("stream closed")
+        for item in self.chunks:
+            if self.closed.is_set():
+                raise RuntimeError("stream closed")
+            yield item
+
+    def close(self):
+        self.closed.set()
+
+
+class FakeIntegrator:
+    def __init__(self, stream=None, error=None):
+        self.stream = stream
+        self.error = error
+
+    def chat_stream(self, messages, model, **params):
+        if self.error is not None:
+            raise self.error
+        return self.stream
+
+
+def fast_stream(text="好的"):
+    usage = SimpleNamespace(prompt_tokens=12, completion_tokens=3)
+    return FakeStream([chunk(text), chunk("", "stop"), chunk(usage=usage)])
+
+
+def wait_for_calls(before, count):
+    deadline = time.monotonic() + 5
+    while usage_recorder.totals["calls"] < before + count and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_losing_primary_records_censored_latency_and_is_closed():
+    slow = FakeStream([], stall=True)
+    completer = HedgedCompleter(FakeIntegrator(slow), "main", FakeIntegrator(fast_stream()), "backup", delay="0.2")
+    assert completer.complete(MESSAGES) == ("好的", "stop")
+    assert slow.closed.is_set()
+    samples = list(completer._first_token_latencies)
+    assert len(samples) == 1 and samples[0] >= 0.2
+    assert completer.stats["wins"] == {"primary": 0, "secondary": 1}
+
+
+def test_winning_primary_records_latency_once():
+    completer = HedgedCompleter(FakeIntegrator(fast_stream()), "main", FakeIntegrator(fast_stream()), "backup",
+                                delay="5")
+    assert completer.complete(MESSAGES)[0] == "好的"
+    assert len(completer._first_token_latencies) == 1
+    assert completer.stats["hedged"] == 0
+
+
+def test_failed_primary_is_not_a_latency_sample():
+    completer = HedgedCompleter(FakeIntegrator(error=RuntimeError("503")), "main",
+                                FakeIntegrator(fast_stream()), "backup", delay="5")
+    assert completer.complete(MESSAGES)[0] == "好的"
+    assert completer.stats["fallbacks"] == 1
+    assert len(completer._first_token_latencies) == 0
+
+
+def test_usage_is_recorded_for_winner_and_cancelled_loser():
+    before = dict(usage_recorder.totals)
+    completer = HedgedCompleter(FakeIntegrator(FakeStream([], stall=True)), "main",
+                                FakeIntegrator(fast_stream()), "backup", delay="0.1")
+    completer.complete(MESSAGES)
+    wait_for_calls(before["calls"], 2)
+    totals = usage_recorder.totals
+    assert totals["calls"] - before["calls"] == 2
+    assert totals["cancelled"] - before["cancelled"] == 1
+    # 获胜一方使用服务端返回的用量，落败一方按提示词估算
+    assert totals["completion_tokens"] - before["completion_tokens"] == 3
+    assert totals["prompt_tokens"] - before["prompt_tokens"] > 12
+    recent = usage_recorder.summary()["recent"][-2:]
+    assert sorted(entry["model"] for entry in recent) == ["backup", "main"]
+
+
+def test_stream_requests_usage_from_server():
+    llm_stub = pytest.importorskip("llm_stub")
+    from flask_app import ModelIntegrator
+
+    server, url = llm_stub.start_in_thread(llm_stub.StubConfig(latency=0))
+    try:
+        stream = ModelIntegrator("stub-key", base_url=url).chat_stream(MESSAGES, max_tokens=64)
+        usage = [item.usage for item in stream if getattr(item, "usage", None)]
+    finally:
+        server.shutdown()
+    assert usage and usage[-1].completion_tokens > 0
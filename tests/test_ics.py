@@ -0,0 +1,43 @@
+from ics_io import import_ics, iter_ics, iter_ics_events
+from schedule_store import ScheduleStore
+
+EVENTS = {
+    "2026-03-02": [
+        {"time": "09:00 - 10:30", "task": "组会, 讨论; 方案\\草稿", "completion": "已完成"},
+        {"time": "全天", "task": "出差", "completion": "未开始"},
+    ],
+    "2026-03-03": [
+        {"time": "23:00 - 24:00", "task": "夜间发布" + "很长的任务名" * 20, "completion": "取消"},
+    ],
+}
+
+
+def ics_lines(snapshot, **kwargs):
+    return "".join(iter_ics(snapshot, **kwargs)).splitlines(keepends=True)
+
+
+def test_round_trip_keeps_events(tmp_path):
+    source = ScheduleStore(str(tmp_path / "源.xlsx"))
+    source.commit(EVENTS)
+    lines = ics_lines(source.snapshot())
+    # 长行按75字节折行
+    assert all(len(line.rstrip("\r\n").encode("utf-8")) <= 75 for line in lines)
+
+    target = ScheduleStore(str(tmp_path / "目标.xlsx"))
+    assert import_ics(lines, target) == (3, 0)
+    assert target.snapshot().to_dict() == source.snapshot().to_dict()
+
+
+def test_reimport_adds_no_duplicates(tmp_path):
+    store = ScheduleStore(str(tmp_path / "记录.xlsx"))
+    store.commit(EVENTS)
+    version = store.snapshot().version
+    assert import_ics(ics_lines(store.snapshot()), store) == (0, 3)
+    assert store.snapshot().version == version
+
+
+def test_export_range(tmp_path):
+    store = ScheduleStore(str(tmp_path / "记录.xlsx"))
+    store.commit(EVENTS)
+    dates = {date for date, _ in iter_ics_events(ics_lines(store.snapshot(), start="2026-03-03"))}
+    assert dates == {"2026-03-03"}
@@ -0,0 +1,67 @@
+import io
+import time
+
+import flask_app
+from jobs import JobQueue
+
+CSV_ROWS = "日期,时间,任务,完成度\n" + "".join(
+    f"2026-04-{day:02d},09:00-10:00,导入任务{day},未开始\n" for day in range(1, 6))
+
+
+def upload(client, headers, data, filename="日程.csv"):
+    return client.post("/api/import", headers=headers, content_type="multipart/form-data",
+                       data={"file": (io.BytesIO(data), filename)})
+
+
+def wait_for_job(client, headers, status_url):
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        job = client.get(status_url, headers=headers).get_json()
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.02)
+    raise AssertionError("导入任务没有在限定时间内完成")
+
+
+def test_import_reports_progress_and_merges(client, admin_auth):
+    response = upload(client, admin_auth, CSV_ROWS.encode("utf-8"))
+    assert response.status_code == 202
+    body = response.get_json()
+    assert "queue_position" in body
+
+    job = wait_for_job(client, admin_auth, body["status_url"])
+    assert job["status"] == "done", job["error"]
+    assert job["progress"]["filename"] == "日程.csv"
+    assert job["progress"]["rows_read"] == 5
+    assert job["progress"]["merged"] == 5
+    assert job["result"]["merged"] == 5
+
+    events = client.get("/api/schedule?start=2026-04-01&end=2026-04-05", headers=admin_auth).get_json()["events"]
+    assert [event["task"] for event in events["2026-04-03"]] == ["导入任务3"]
+
+
+def test_declared_length_over_limit_is_rejected(client, admin_auth, monkeypatch):
+    monkeypatch.setattr(flask_app, "MAX_FILE_SIZE", 64)
+    monkeypatch.setattr(flask_app, "UPLOAD_OVERHEAD", 16)
+    response = upload(client, admin_auth, b"x" * 200)
+    assert response.status_code == 413
+
+
+def test_streamed_body_over_limit_is_rejected(client, admin_auth, monkeypatch, tmp_path):
+    # 声明的长度在限制内（含表单开销），实际文件在写入临时文件时超过限制
+    monkeypatch.setattr(flask_app, "MAX_FILE_SIZE", 64)
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path))
+    response = upload(client, admin_auth, CSV_ROWS.encode("utf-8") * 4)
+    assert response.status_code == 413
+    response = client.post("/api/import?filename=日程.csv", headers=admin_auth, content_type="text/csv",
+                           data=CSV_ROWS.encode("utf-8") * 4)
+    assert response.status_code == 413
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_full_queue_returns_429(client, admin_auth, monkeypatch):
+    monkeypatch.setattr(flask_app, "import_queue", JobQueue(flask_app.job_registry, max_per_owner=0))
+    response = upload(client, admin_auth, CSV_ROWS.encode("utf-8"))
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert response.get_json()["retry_after"] >= 1
@@ -0,0 +1,56 @@
+import threading
+
+import pytest
+
+from jobs import PRIORITIES, JobQueue, JobRegistry, QueueFull
+
+
+def gated_queue(**kwargs):
+    """单个工作线程被一个任务占住，释放 gate 之前提交的任务都在排队"""
+    queue = JobQueue(JobRegistry(), workers=1, **kwargs)
+    gate, started = threading.Event(), threading.Event()
+
+    def block(job):
+        started.set()
+        gate.wait(5)
+    queue.submit("gate", "system", block)
+    started.wait(5)
+    return queue, gate
+
+
+def run_order(queue, gate, submissions):
+    order = []
+    jobs = [queue.submit("test", owner, lambda job, name=name: order.append(name), priority=priority)
+            for owner, name, priority in submissions]
+    gate.set()
+    for job in jobs:
+        assert job.wait(5)
+    return order
+
+
+def test_owners_take_turns():
+    queue, gate = gated_queue(max_per_owner=10)
+    normal = PRIORITIES["normal"]
+    order = run_order(queue, gate, [("alice", "a1", normal), ("alice", "a2", normal), ("alice", "a3", normal),
+                                    ("bob", "b1", normal), ("carol", "c1", normal)])
+    assert order == ["a1", "b1", "c1", "a2", "a3"]
+
+
+def test_higher_priority_runs_first():
+    queue, gate = gated_queue()
+    order = run_order(queue, gate, [("alice", "low", PRIORITIES["low"]), ("bob", "high", PRIORITIES["high"])])
+    assert order == ["high", "low"]
+
+
+def test_per_owner_and_total_limits():
+    queue, gate = gated_queue(max_depth=3, max_per_owner=2)
+    for _ in range(2):
+        queue.submit("test", "alice", lambda job: None)
+    with pytest.raises(QueueFull):
+        queue.check_room("alice")
+    queue.submit("test", "bob", lambda job: None)
+    with pytest.raises(QueueFull) as info:
+        queue.submit("test", "carol", lambda job: None)
+    assert info.value.retry_after >= 1
+    assert queue.summary()["rejected"] == 2
+    gate.set()
@@ -0,0 +1,29 @@
+import multiprocessing
+
+from rate_limit import TokenBucketLimiter
+
+# 不会被 RATE_LIMIT_* 环境变量覆盖的预算名
+BUDGET = "shared"
+
+
+def hit_many(db_path, attempts):
+    limiter = TokenBucketLimiter(db_path, key_func=lambda: "client", budgets={BUDGET: "10 per hour"})
+    return sum(limiter.hit(BUDGET, "client")[0] for _ in range(attempts))
+
+
+def test_bucket_is_shared_between_processes(tmp_path):
+    db_path = str(tmp_path / "ratelimit.sqlite3")
+    with multiprocessing.get_context("spawn").Pool(4) as pool:
+        allowed = pool.starmap(hit_many, [(db_path, 8)] * 4)
+    # 四个进程共 32 次请求，共享同一个容量为10的桶
+    assert sum(allowed) == 10
+
+
+def test_all_buckets_must_have_room(tmp_path):
+    limiter = TokenBucketLimiter(str(tmp_path / "ratelimit.sqlite3"), key_func=lambda: "client",
+                                 budgets={BUDGET: "3 per minute; 100 per day"})
+    assert [limiter.hit(BUDGET, "a")[0] for _ in range(4)] == [True, True, True, False]
+    allowed, retry_after = limiter.hit(BUDGET, "a")
+    assert not allowed and 0 < retry_after <= 20
+    # 按客户端分别计数
+    assert limiter.hit(BUDGET, "b")[0]
@@ -0,0 +1,67 @@
+import pytest
+
+from conftest import put_day
+from schedule_store import ConflictError, ScheduleStore
+
+DAY = "2026-03-02"
+OTHER_DAY = "2026-03-03"
+
+
+def event(task, time="09:00-10:00"):
+    return {"time": time, "task": task, "completion": "未开始"}
+
+
+def test_commit_compares_day_versions(tmp_path):
+    store = ScheduleStore(str(tmp_path / "记录.xlsx"))
+    read = store.snapshot()
+    store.commit({DAY: [event("界面修改")]}, expected=read.versions_for([DAY]))
+
+    with pytest.raises(ConflictError) as info:
+        store.commit({DAY: [event("过期的修改")], OTHER_DAY: [event("另一天")]},
+                     expected=read.versions_for([DAY, OTHER_DAY]))
+    assert set(info.value.conflicts) == {DAY}
+    # 整组都不写入
+    assert store.snapshot().get(OTHER_DAY) == ()
+    assert store.snapshot().get(DAY)[0]["task"] == "界面修改"
+
+    # 修改其他日期的写入者不受影响
+    store.commit({OTHER_DAY: [event("另一天")]}, expected=read.versions_for([OTHER_DAY]))
+    assert store.snapshot().get(OTHER_DAY)[0]["task"] == "另一天"
+
+
+def test_put_without_versions_is_428(client, admin_auth):
+    response = client.put("/api/schedule", headers=admin_auth, json={"events": {DAY: [{"task": "x"}]}})
+    assert response.status_code == 428
+    assert response.get_json()["dates"] == [DAY]
+
+
+def test_put_with_stale_version_is_409(client, admin_auth):
+    put_day(client, admin_auth, DAY, "第一次")
+    put_day(client, admin_auth, DAY, "第二次")
+    response = client.put("/api/schedule", headers=admin_auth, json={
+        "events": {DAY: [{"time": "10:00-11:00", "task": "基于旧版本"}]}, "versions": {DAY: 0}})
+    assert response.status_code == 409
+    conflict = response.get_json()["conflicts"][DAY]
+    assert conflict["expected"] == 0
+    assert [item["task"] for item in conflict["events"]] == ["第二次"]
+
+
+@pytest.mark.parametrize("path", [
+    "/api/schedule",
+    f"/api/schedule?start={DAY}&end={OTHER_DAY}",
+    "/api/changes?since=0&timeout=0",
+    "/api/export?format=csv",
+    "/api/export.ics",
+    "/api/analytics?period=week",
+    "/api/search?q=会议",
+    f"/api/free-slots?duration=60&start={DAY}&end={OTHER_DAY}",
+    "/api/llm/usage",
+    "/api/optimize/queue",
+])
+def test_read_routes_return_200(client, admin_auth, path):
+    put_day(client, admin_auth, DAY, "组会")
+    assert client.get(path, headers=admin_auth).status_code == 200
+
+
+def test_routes_require_auth(client):
+    assert client.get("/api/schedule").status_code == 401
@@ -0,0 +1,59 @@
+from schedule_store import ScheduleStore
+from search_index import get_search_index
+from undo import UndoHistory
+
+DAY = "2026-03-02"
+OTHER_DAY = "2026-03-03"
+
+
+def event(task, time="09:00-10:00", completion="未开始"):
+    return {"time": time, "task": task, "completion": completion}
+
+
+def tasks(store, date):
+    return [item["task"] for item in store.snapshot().get(date)]
+
+
+def test_undo_and_redo_restore_both_directions(tmp_path):
+    store = ScheduleStore(str(tmp_path / "记录.xlsx"))
+    history = UndoHistory(store)
+    history.commit({DAY: [event("初稿")]}, "添加初稿")
+    history.commit({DAY: [event("定稿")], OTHER_DAY: [event("评审")]}, "修改")
+    assert history.undo_label() == "修改"
+
+    step, restored, skipped = history.undo()
+    assert step.label == "修改" and restored == [DAY, OTHER_DAY] and skipped == []
+    assert tasks(store, DAY) == ["初稿"] and tasks(store, OTHER_DAY) == []
+    assert history.redo_label() == "修改"
+
+    history.redo()
+    assert tasks(store, DAY) == ["定稿"] and tasks(store, OTHER_DAY) == ["评审"]
+    # 新的修改清空重做栈
+    history.commit({DAY: [event("再改")]}, "再改")
+    assert not history.can_redo()
+
+
+def test_undo_skips_days_changed_by_others(tmp_path):
+    store = ScheduleStore(str(tmp_path / "记录.xlsx"))
+    history = UndoHistory(store)
+    history.commit({DAY: [event("界面")], OTHER_DAY: [event("界面")]}, "界面修改")
+    store.commit({OTHER_DAY: [event("API")]}, source="api")
+
+    _, restored, skipped = history.undo()
+    assert restored == [DAY] and skipped == [OTHER_DAY]
+    assert tasks(store, DAY) == [] and tasks(store, OTHER_DAY) == ["API"]
+
+
+def test_search_index_follows_commits(tmp_path):
+    store = ScheduleStore(str(tmp_path / "记录.xlsx"))
+    store.commit({DAY: [event("项目组会"), event("阅读论文", "14:00-15:00", "已完成")]})
+    index = get_search_index(store)
+    assert index.search("组会")[0] == 1
+
+    store.commit({OTHER_DAY: [event("组会纪要")], DAY: [event("阅读论文", "14:00-15:00", "已完成")]})
+    total, hits = index.search("组会")
+    assert total == 1 and hits[0]["date"] == OTHER_DAY
+    # 不在任何任务名中出现的词组不命中
+    assert index.search("会组")[0] == 0
+    assert index.search("论文", completions={"未开始"})[0] == 0
+    assert index.search("论文", start=DAY, end=DAY)[1][0]["task"] == "阅读论文"
@@ -0,0 +1,54 @@
+import os
+import stat
+
+import pandas as pd
+import pytest
+
+from schedule_store import EVENT_COLUMNS, read_workbook, write_workbook
+from xlsx_stream import atomic_file, write_xlsx_rows
+
+
+def file_mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def test_round_trip_readable_by_openpyxl_and_pandas(tmp_path):
+    path = str(tmp_path / "记录.xlsx")
+    events = {
+        "2026-03-02": [{"time": "09:00-10:00", "task": "组会 <a&b>", "completion": "已完成"}],
+        "2026-03-03": [{"time": "全天", "task": "出差\x01", "completion": "未开始"}],
+    }
+    assert write_workbook(path, events) == 2
+
+    frame = pd.read_excel(path, dtype=str)
+    assert list(frame.columns) == EVENT_COLUMNS
+    assert frame["任务"].tolist() == ["组会 <a&b>", "出差"]
+    loaded = read_workbook(path)
+    assert loaded["2026-03-02"][0]["task"] == "组会 <a&b>"
+    assert loaded["2026-03-03"][0]["time"] == "全天"
+
+
+@pytest.mark.skipif(os.name == "nt", reason="Windows 不区分这些权限位")
+def test_atomic_replace_keeps_file_mode(tmp_path):
+    path = str(tmp_path / "记录.xlsx")
+    write_xlsx_rows(path, ["a"], [[1]])
+    umask = os.umask(0)
+    os.umask(umask)
+    assert file_mode(path) == 0o666 & ~umask
+
+    os.chmod(path, 0o640)
+    write_xlsx_rows(path, ["a"], [[2]])
+    assert file_mode(path) == 0o640
+
+
+def test_failed_write_keeps_original(tmp_path):
+    path = str(tmp_path / "data.bin")
+    with atomic_file(path) as f:
+        f.write(b"old")
+    with pytest.raises(RuntimeError):
+        with atomic_file(path) as f:
+            f.write(b"partial")
+            raise RuntimeError("boom")
+    with open(path, "rb") as f:
+        assert f.read() == b"old"
+    assert os.listdir(tmp_path) == ["data.bin"]
@@ -0,0 +1,140 @@
+"""LLM调用的本地token估算与用量记录
+
+估算规则（偏保守）：每个中日韩字符按 1 个token，其余字符约 3.5 个字符 1 个token。
+每次调用根据提示词和预计输出长度选择 max_tokens；预计输出超过模型上限时由调用方按天拆分请求。
+服务端返回的实际用量会被记录下来，并用于校准估算系数。
+"""
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import deque
+
+# 各模型的上下文长度和单次输出上限
+MODEL_LIMITS = {
+    "deepseek-ai/DeepSeek-V3": {"context": 64000, "max_output": 8192},
+}
+DEFAULT_LIMITS = {"context": 32000, "max_output": 4096}
+# 预计输出之外预留的比例和固定余量
+OUTPUT_MARGIN = 1.25
+OUTPUT_PADDING = 64
+MIN_MAX_TOKENS = 256
+# 每条消息的格式开销
+MESSAGE_OVERHEAD = 4
+# 保留的最近调用记录数
+USAGE_HISTORY_SIZE = 200
+
+CJK_PATTERN = re.compile(r"[　-〿㐀-䶿一-鿿＀-￯]")
+
+
+def model_limits(model):
+    """模型的 {"context", "max_output"}，可用 LLM_MAX_OUTPUT_TOKENS 覆盖输出上限"""
+    limits = dict(MODEL_LIMITS.get(model, DEFAULT_LIMITS))
+    if os.getenv("LLM_MAX_OUTPUT_TOKENS"):
+        limits["max_output"] = int(os.getenv("LLM_MAX_OUTPUT_TOKENS"))
+    return limits
+
+
+def raw_estimate(text):
+    """未校准的token数估算"""
+    if not text:
+        return 0
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 3.5)
+
+
+def estimate_tokens(text):
+    """按实际用量校准后的token数估算"""
+    return math.ceil(raw_estimate(text) * usage_recorder.calibration) + MESSAGE_OVERHEAD
+
+
+def estimate_events_output(events_data):
+    """返回这些日程的优化结果（与输入结构相同的缩进JSON）预计需要的token数"""
+    return estimate_tokens(json.dumps(events_data, indent=2, ensure_ascii=False))
+
+
+def choose_max_tokens(prompt, model, expected_output=None):
+    """为一次调用选择 max_tokens：预计输出加余量，不超过模型输出上限和剩余上下文"""
+    limits = model_limits(model)
+    available = limits["context"] - estimate_tokens(prompt)
+    ceiling = max(MIN_MAX_TOKENS, min(limits["max_output"], available))
+    if expected_output is None:
+        return ceiling
+    wanted = math.ceil(expected_output * OUTPUT_MARGIN) + OUTPUT_PADDING
+    return max(MIN_MAX_TOKENS, min(wanted, ceiling))
+
+
+def output_capacity(model):
+    """单次调用可以安全容纳的预计输出token数（扣除余量）"""
+    return int((model_limits(model)["max_output"] - OUTPUT_PADDING) / OUTPUT_MARGIN)
+
+
+def split_by_output(events_data, capacity):
+    """把 {日期: [事件]} 按日期顺序切分为若干组，每组预计输出不超过 capacity
+
+    单独一天就超过上限时该天自成一组。
+    """
+    groups, current, current_tokens = [], {}, 0
+    for date_str in sorted(events_data):
+        tokens = estimate_events_output({date_str: events_data[date_str]})
+        if current and current_tokens + tokens > capacity:
+            groups.append(current)
+            current, current_tokens = {}, 0
+        current[date_str] = events_data[date_str]
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+
+class UsageRecorder:
+    """记录每次调用的token用量，并用实际/估算之比校准估算系数"""
+
+    def __init__(self, size=USAGE_HISTORY_SIZE):
+        self._lock = threading.Lock()
+        self._records = deque(maxlen=size)
+        self.calibration = 1.0
+        self.totals = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "truncated": 0, "cancelled": 0}
+
+    def record(self, model, prompt, max_tokens, usage=None, finish_reason=None, elapsed=None, cancelled=False):
+        """cancelled=True 表示请求被中途取消（如对冲中落败的一方），服务端没有返回用量，
+        usage 为按已收到的输出估算的用量，计入总量但不参与校准"""
+        estimated = raw_estimate(prompt) + MESSAGE_OVERHEAD
+        prompt_tokens = getattr(usage, "prompt_tokens", None)
+        completion_tokens = getattr(usage, "completion_tokens", None)
+        entry = {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "model": model,
+            "estimated_prompt_tokens": estimated,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "max_tokens": max_tokens,
+            "finish_reason": finish_reason,
+            "elapsed": round(elapsed, 3) if elapsed is not None else None,
+            "cancelled": cancelled,
+        }
+        with self._lock:
+            self._records.append(entry)
+            self.totals["calls"] += 1
+            self.totals["prompt_tokens"] += prompt_tokens or 0
+            self.totals["completion_tokens"] += completion_tokens or 0
+            if finish_reason == "length":
+                self.totals["truncated"] += 1
+            if cancelled:
+                self.totals["cancelled"] += 1
+            if prompt_tokens and estimated > MESSAGE_OVERHEAD and not cancelled:
+                # 指数平均，限制在合理范围内避免个别异常值
+                ratio = prompt_tokens / estimated
+                self.calibration = min(2.0, max(0.5, 0.8 * self.calibration + 0.2 * ratio))
+        print(f"LLM用量: 提示 {prompt_tokens}（估算 {estimated}），输出 {completion_tokens}/{max_tokens}，结束原因 {finish_reason}")
+        return entry
+
+    def summary(self):
+        with self._lock:
+            return {"totals": dict(self.totals), "calibration": round(self.calibration, 3),
+                    "recent": list(self._records)[-20:]}
+
+
+usage_recorder = UsageRecorder()
@@ -0,0 +1,91 @@
+"""界面修改的撤销/重做
+
+每一步只记录被修改日期在修改前后的事件元组（与存储快照共享，不复制事件），
+内存占用与修改的规模成正比，与日程总量无关。一次LLM调整整周也只是一步，可一键撤销。
+撤销时如果某天在此之后又被其他来源（文件、API）修改过，该天保持不变，避免覆盖别人的修改。
+"""
+import threading
+from schedule_store import ConflictError
+
+# 最多保留的撤销步数
+UNDO_LIMIT = 100
+
+
+class UndoStep:
+    __slots__ = ("label", "before", "after")
+
+    def __init__(self, label, before, after):
+        self.label = label
+        self.before = before  # {日期: 修改前的事件元组}
+        self.after = after  # {日期: 修改后的事件元组}
+
+
+class UndoHistory:
+    """单个日程存储上的撤销/重做栈，修改通过 commit() 发布才会被记录"""
+
+    def __init__(self, store, limit=UNDO_LIMIT):
+        self.store = store
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._undo = []
+        self._redo = []
+
+    def commit(self, changes, label, source="gui", expected=None):
+        """发布修改并记录为一步，返回当前快照；没有实际变化时不记录
+
+        expected 同 ScheduleStore.commit()，版本不符时抛出 ConflictError，不记录任何步骤。
+        """
+        snapshot, before, after = self.store.commit_delta(changes, source, expected=expected)
+        if before:
+            with self._lock:
+                self._undo.append(UndoStep(label, before, after))
+                del self._undo[:-self.limit]
+                self._redo.clear()
+        return snapshot
+
+    def can_undo(self):
+        return bool(self._undo)
+
+    def can_redo(self):
+        return bool(self._redo)
+
+    def undo_label(self):
+        with self._lock:
+            return self._undo[-1].label if self._undo else None
+
+    def redo_label(self):
+        with self._lock:
+            return self._redo[-1].label if self._redo else None
+
+    def _replay(self, source_stack, target_stack, forward, source):
+        """把 source_stack 顶部的一步恢复到修改前（或重做到修改后）
+
+        返回 (该步, 已恢复的日期, 因被其他来源修改而跳过的日期)，栈为空时返回 None。
+        """
+        with self._lock:
+            if not source_stack:
+                return None
+            step = source_stack.pop()
+        current, wanted = (step.before, step.after) if forward else (step.after, step.before)
+        while True:
+            snapshot = self.store.snapshot()
+            changes = {date_str: list(wanted[date_str]) for date_str in wanted
+                       if snapshot.get(date_str) == current[date_str]}
+            try:
+                # 读取快照与提交之间被其他来源修改时重新比较
+                self.store.commit(changes, source=source, expected=snapshot.versions_for(changes))
+                break
+            except ConflictError:
+                continue
+        skipped = sorted(set(wanted) - set(changes))
+        with self._lock:
+            target_stack.append(step)
+        return step, sorted(changes), skipped
+
+    def undo(self, source="gui"):
+        """撤销最近一步，返回 (该步, 已恢复的日期, 跳过的日期) 或 None"""
+        return self._replay(self._undo, self._redo, False, source)
+
+    def redo(self, source="gui"):
+        """重做最近撤销的一步，返回 (该步, 已恢复的日期, 跳过的日期) 或 None"""
+        return self._replay(self._redo, self._undo, True, source)
@@ -0,0 +1,35 @@
+import threading
+
+# 检查工作簿是否被外部修改的间隔（秒）
+DEFAULT_POLL_INTERVAL = 1.0
+
+
+class WorkbookWatcher:
+    """监视日程存储对应的工作簿，发现外部修改后增量同步到内存
+
+    只比较文件的修改时间和大小，文件未变化时每次检查只需几次 stat 调用。
+    同步后变化的日期会进入存储的变更流，界面和API订阅者据此只刷新受影响的部分。
+    """
+
+    def __init__(self, store, interval=DEFAULT_POLL_INTERVAL):
+        self.store = store
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="workbook-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.store.sync_from_disk()
+            except Exception as e:
+                # 外部程序可能正在写入，下次检查时重试
+                print(f"同步工作簿修改失败: {str(e)}")
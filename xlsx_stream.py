@@ -0,0 +1,79 @@
+"""流式 xlsx 写入：openpyxl 只写模式（write_only）逐行写入，内存占用与行数无关
+
+单元格逐行序列化到 openpyxl 的临时文件中，不在内存中构建整张工作表。
+写入先落到同目录的临时文件并 fsync，再原子地改名覆盖目标文件（保留原文件的权限），
+中途崩溃或出错时原文件保持不变。
+"""
+import os
+import stat
+import tempfile
+from contextlib import contextmanager
+
+# 新建文件的权限与普通 open() 一致（0o666 去掉 umask）；umask 只能通过设置读取，在导入时读取一次
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def fsync_directory(directory):
+    """把目录项（改名结果）刷到磁盘，不支持打开目录的平台（Windows）上忽略"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def copy_file_mode(file_path, temp_path):
+    """mkstemp 创建的临时文件权限为 0600：替换已有文件时沿用其权限，新文件使用 0666 去掉 umask"""
+    try:
+        mode = stat.S_IMODE(os.stat(file_path).st_mode)
+    except FileNotFoundError:
+        mode = 0o666 & ~_UMASK
+    try:
+        os.chmod(temp_path, mode)
+    except OSError as e:
+        print(f"设置文件权限失败: {str(e)}")
+
+
+@contextmanager
+def atomic_file(file_path):
+    """以二进制写方式打开同目录的临时文件，正常结束时 fsync 并原子替换 file_path，出错时删除临时文件"""
+    directory = os.path.dirname(os.path.abspath(file_path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(file_path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        copy_file_mode(file_path, temp_path)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    fsync_directory(directory)
+
+
+def write_xlsx_rows(file_path, header, rows, sheet_name="Sheet1"):
+    """把表头和逐行数据写入工作簿并原子替换 file_path，返回写入的数据行数"""
+    from openpyxl import Workbook
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(sheet_name)
+    sheet.append(list(header))
+    count = 0
+    for values in rows:
+        # 去掉 XML 不允许的控制字符，否则 openpyxl 会拒绝写入
+        sheet.append([ILLEGAL_CHARACTERS_RE.sub("", value) if isinstance(value, str) else value
+                      for value in values])
+        count += 1
+    with atomic_file(file_path) as f:
+        workbook.save(f)
+    return count